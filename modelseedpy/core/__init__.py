@@ -10,8 +10,13 @@ from modelseedpy.core.mseditorapi import MSEditorAPI, MSEquation
 from modelseedpy.core.msgapfill import MSGapfill
 from modelseedpy.core.msatpcorrection import MSATPCorrection
 from modelseedpy.core.msgrowthphenotypes import MSGrowthPhenotypes, MSGrowthPhenotype
+from modelseedpy.core.msphenotyperesults import MSPhenotypeResults
 from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msmodeloverlay import MSModelOverlay
+from modelseedpy.core.msproblemmatrix import MSProblemMatrix
+from modelseedpy.core.msgapfilldatabase import MSGapfillDatabase
 from modelseedpy.core.mstemplate import MSTemplateBuilder
+from modelseedpy.core.mstemplatearchive import MSTemplateArchive
 from modelseedpy.core.msmodelreport import MSModelReport
 from modelseedpy.core.annotationontology import AnnotationOntology
 from modelseedpy.core.exceptions import *
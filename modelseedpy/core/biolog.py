@@ -1,4 +1,14 @@
 # -*- coding: utf-8 -*-
+import logging
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from modelseedpy.core.msworker import MSWorkerState
+
+logger = logging.getLogger(__name__)
+
 pm1_str = """A01    Negative Control
 A02    L-Arabinose    cpd00224
 A03    N-Acetyl-DGlucosamine    cpd00122
@@ -138,6 +148,16 @@ class BiologPlate:
         return html
 
 
+def _run_biolog_wells_worker(args):
+    state, exchange_ids, uses_lower, well_bounds = args
+    return Biolog.run_well_bounds(state.get(), exchange_ids, uses_lower, well_bounds)
+
+
+def _run_biolog_model_worker(args):
+    biolog, model_state, cmp = args
+    return biolog.growth_vector(pickle.loads(model_state), cmp)
+
+
 class Biolog:
     def __init__(self):
         self.plates = {}
@@ -147,28 +167,173 @@ class Biolog:
             print("replace existing plate")
         self.plates[plate.id] = plate
 
-    def run_plates(self, model, biomass=None, cmp="e"):  # !!! biomass is never used
-        prev_medium = model.medium
+    def well_keys(self):
+        """Returns (plate ID, well ID) for every well of every plate, in plate and well order"""
+        return [
+            (plate_id, well_id)
+            for plate_id, plate in self.plates.items()
+            for well_id in plate.wells
+        ]
+
+    @staticmethod
+    def exchange_mapping(model):
+        """Maps the ID of the metabolite in each exchange reaction to the exchange reaction"""
         compound_exchange = {}
         for ex_rxn in model.exchanges:
             ex_met = list(ex_rxn.metabolites)[0]
             if ex_met.id not in compound_exchange:
                 compound_exchange[ex_met.id] = ex_rxn
             else:
-                print(ex_rxn, list(ex_rxn.metabolites)[0])
-        for plate_id, plate in self.plates.items():
-            for well_id in plate.wells:
-                media = plate.get_media(well_id)
-                model_medium = {}
-                for o in media:
-                    match = "{}_{}".format(o, cmp)
-                    if match in compound_exchange:
-                        model_medium[compound_exchange[match].id] = media[o]
-                    else:
-                        print("skip", o)
-                model.medium = model_medium
-                ovalue = model.slim_optimize()
-                plate.wells[well_id]["growth"] = ovalue
-                # print(well_id, solution)
-                # print(well_id, media)
+                logger.warning(
+                    f"Exchange {ex_rxn.id} ignored for {ex_met.id}, which already has an exchange"
+                )
+        return compound_exchange
+
+    def well_bounds(self, model, cmp="e"):
+        """Precomputes the exchange bounds of every well as an array
+
+        Exchange bounds follow the rules of cobra's Model.medium: the active bound (the lower
+        bound for exchanges consuming their metabolite) is set to the well concentration for
+        compounds in the well and closed for all other exchanges.
+
+        Returns
+        -------
+        ([string], numpy.ndarray, numpy.ndarray)
+            Exchange reaction IDs, whether the active bound of each exchange is its lower bound, and
+            the active bounds of all exchanges (columns) in every well (rows, in well_keys order)
+        """
+        compound_exchange = Biolog.exchange_mapping(model)
+        exchanges = list(model.exchanges)
+        index = {rxn.id: i for i, rxn in enumerate(exchanges)}
+        uses_lower = np.array([len(rxn.reactants) > 0 for rxn in exchanges], dtype=bool)
+        closed = np.array(
+            [
+                min(
+                    0.0,
+                    -rxn.lower_bound
+                    if len(rxn.reactants) > 0 and len(rxn.products) == 0
+                    else rxn.upper_bound,
+                )
+                for rxn in exchanges
+            ]
+        )
+        keys = self.well_keys()
+        bounds = np.tile(closed, (len(keys), 1))
+        skipped = set()
+        for row, (plate_id, well_id) in enumerate(keys):
+            media = self.plates[plate_id].get_media(well_id)
+            for compound in media:
+                match = "{}_{}".format(compound, cmp)
+                if match in compound_exchange:
+                    bounds[row, index[compound_exchange[match].id]] = media[compound]
+                else:
+                    skipped.add(compound)
+        if len(skipped) > 0:
+            logger.info(f"Compounds without exchanges skipped: {sorted(skipped)}")
+        return [rxn.id for rxn in exchanges], uses_lower, bounds
+
+    @staticmethod
+    def run_well_bounds(model, exchange_ids, uses_lower, well_bounds):
+        """Optimizes the model for each row of well bounds, changing only the bounds that differ between wells
+
+        The original exchange bounds are restored afterwards.
+
+        Returns
+        -------
+        numpy.ndarray
+            Objective value for each well
+        """
+        exchanges = [model.reactions.get_by_id(rxn_id) for rxn_id in exchange_ids]
+        original = [rxn.bounds for rxn in exchanges]
+        applied = np.array(
+            [
+                -rxn.lower_bound if uses_lower[i] else rxn.upper_bound
+                for i, rxn in enumerate(exchanges)
+            ]
+        )
+        changed = np.zeros(len(exchanges), dtype=bool)
+        growth = np.empty(len(well_bounds))
+        for row, bounds in enumerate(well_bounds):
+            for i in np.flatnonzero(bounds != applied):
+                if uses_lower[i]:
+                    exchanges[i].lower_bound = -bounds[i]
+                else:
+                    exchanges[i].upper_bound = bounds[i]
+                changed[i] = True
+            applied = bounds
+            growth[row] = model.slim_optimize()
+        for i in np.flatnonzero(changed):
+            exchanges[i].bounds = original[i]
+        return growth
+
+    def growth_vector(
+        self, model, cmp="e", processes=None, chunk_size=None, executor=None
+    ):
+        """Computes the objective value of the model in every well, in well_keys order
+
+        Wells are run serially with delta bound updates, or split into chunks of consecutive
+        wells run in worker processes if processes or an executor is specified.
+        """
+        exchange_ids, uses_lower, well_bounds = self.well_bounds(model, cmp)
+        if processes is None and executor is None:
+            return Biolog.run_well_bounds(model, exchange_ids, uses_lower, well_bounds)
+        if chunk_size is None:
+            workers = processes or os.cpu_count() or 1
+            chunk_size = max(1, int(np.ceil(len(well_bounds) / workers)))
+        chunks = [
+            well_bounds[start : start + chunk_size]
+            for start in range(0, len(well_bounds), chunk_size)
+        ]
+        with MSWorkerState(model, "biolog") as state:
+            args = [(state, exchange_ids, uses_lower, chunk) for chunk in chunks]
+            if executor is not None:
+                results = list(executor.map(_run_biolog_wells_worker, args))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    results = list(pool.map(_run_biolog_wells_worker, args))
+        return np.concatenate(results) if len(results) > 0 else np.empty(0)
+
+    def growth_matrix(
+        self, model, cmp="e", processes=None, chunk_size=None, executor=None
+    ):
+        """Runs all plates and returns the objective values as a plates x wells DataFrame
+
+        Wells missing from a plate are NaN. See growth_vector for the parallel options.
+        """
+        growth = self.growth_vector(model, cmp, processes, chunk_size, executor)
+        matrix = pd.DataFrame(
+            index=list(self.plates),
+            columns=list(dict.fromkeys(well for _, well in self.well_keys())),
+            dtype=float,
+        )
+        for (plate_id, well_id), value in zip(self.well_keys(), growth):
+            matrix.at[plate_id, well_id] = value
+        return matrix
+
+    def run_models(self, models, cmp="e", processes=None, executor=None):
+        """Runs all plates for every model and returns a models x wells DataFrame
+
+        Rows are model IDs and columns are (plate, well) pairs. Models are run in worker
+        processes if processes or an executor is specified.
+        """
+        if processes is None and executor is None:
+            rows = [self.growth_vector(model, cmp) for model in models]
+        else:
+            args = [(self, pickle.dumps(model), cmp) for model in models]
+            if executor is not None:
+                rows = list(executor.map(_run_biolog_model_worker, args))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    rows = list(pool.map(_run_biolog_model_worker, args))
+        return pd.DataFrame(
+            np.array(rows).reshape(len(rows), len(self.well_keys())),
+            index=[model.id for model in models],
+            columns=pd.MultiIndex.from_tuples(self.well_keys(), names=["plate", "well"]),
+        )
+
+    def run_plates(self, model, biomass=None, cmp="e"):  # !!! biomass is never used
+        prev_medium = model.medium
+        growth = self.growth_vector(model, cmp)
+        for (plate_id, well_id), value in zip(self.well_keys(), growth):
+            self.plates[plate_id].wells[well_id]["growth"] = value
         return prev_medium
@@ -2,9 +2,15 @@
 import logging
 import cobra
 import copy
+import hashlib
 import json
+import math
+import os
 import time
+import numpy as np
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
 from os.path import abspath as _abspath
 from os.path import dirname as _dirname
 from optlang.symbolics import Zero, add
@@ -16,9 +22,12 @@ from modelseedpy.core.msmodel import (
 )
 from cobra.core import Gene, Metabolite, Model, Reaction
 from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msworker import MSWorkerState
 from modelseedpy.core.mstemplate import MSTemplateBuilder
 from modelseedpy.core import FBAHelper, MSGapfill, MSMedia
+from modelseedpy.core.msgapfilldatabase import MSGapfillDatabase
 from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
+from modelseedpy.fbapkg.gapfillingpkg import base_blacklist
 from modelseedpy.helpers import get_template
 
 logger = logging.getLogger(__name__)
@@ -54,10 +63,25 @@ default_threshold_multipiers = {
 }
 
 
+def _atp_modelutls(atp_correction):
+    # Registering the copies so the gapfilling model keeps its gapfilling packages
+    return [atp_correction.modelutl, atp_correction.msgapfill.gfmodelutl]
+
+
+def _run_atp_media_worker(args):
+    state, indices, no_gapfilling = args
+    return state.get().evaluate_media_range(indices, no_gapfilling)
+
+
 class MSATPCorrection:
 
     DEBUG = False
 
+    # Results of ATP media evaluations and core test thresholds keyed by a fingerprint of the
+    # active reaction set and media, shared by all instances with cache_results set
+    cache = OrderedDict()
+    cache_size = 256
+
     def __init__(
         self,
         model_or_mdlutl,
@@ -70,17 +94,21 @@ class MSATPCorrection:
         load_default_medias=True,
         forced_media=[],
         default_media_path=None,
+        cache_results=False,
+        cache_dir=None,
     ):
         """
         :param model:
         :param core_template:
-        :param atp_medias: list<MSMedia> : list of additional medias to test
+        :param atp_medias: list<MSMedia> : list of additional medias to test, or of [MSMedia, minimum objective] pairs
         :param load_default_medias: Bool : load default media set
         :param forced_media: list<string> : name of medias in which ATP production should be forced
         :param compartment: string : ID of compartment to test ATP in
         :param max_gapfilling: string : maximum gapfilling allowed in accepted media
         :param gapfilling_delta: string : difference between lowest gapfilling and current gapfilling where media will be accepted
         :param atp_hydrolysis_id: string : ATP Hydrolysis reaction ID, if None it will perform a SEED reaction search
+        :param cache_results: Bool : reuse media evaluations and test thresholds of models with identical core reaction sets (see core_fingerprint)
+        :param cache_dir: string : directory where cached results are also stored as JSON, shared by processes and runs
         """
         # Discerning input is model or mdlutl and setting internal links
         if isinstance(model_or_mdlutl, MSModelUtil):
@@ -109,6 +137,7 @@ class MSATPCorrection:
         self.atp_medias = []
         if load_default_medias:
             self.load_default_medias()
+        self.add_atp_medias(atp_medias)
 
         self.forced_media = []
         for media_id in forced_media:
@@ -129,13 +158,18 @@ class MSATPCorrection:
         self.msgapfill = None
         self.cumulative_core_gapfilling = None
         self.selected_media = None
-        self.original_bounds = {}
+        self.bound_snapshot = None
+        self.snapshot_positions = []
         self.noncore_reactions = []
         self.other_compartments = []
         self.media_gapfill_stats = {}
         self.filtered_noncore = []
         self.lp_filename = None
         self.multiplier = 1.2
+        self.cache_results = cache_results or cache_dir is not None
+        self.cache_dir = cache_dir
+        # Reaction member signature, exchange mask and stoichiometry digest of the last fingerprint
+        self.stoichiometry_fingerprint = None
 
     def get_msgapfill(self):
         if self.msgapfill is None:
@@ -153,10 +187,11 @@ class MSATPCorrection:
 
     def load_default_medias(self):
         filename = self.default_media_path
-        medias = pd.read_csv(filename, sep="\t", index_col=0).to_dict()
-        for media_id in medias:
+        data = pd.read_csv(filename, sep="\t", index_col=0).to_dict()
+        medias = []
+        for media_id in data:
             media_d = {}
-            for exchange, v in medias[media_id].items():
+            for exchange, v in data[media_id].items():
                 if v > 0:
                     k = exchange.split("_")[1]
                     media_d[k] = v
@@ -165,24 +200,25 @@ class MSATPCorrection:
             media = MSMedia.from_dict(media_d)
             media.id = media_id
             media.name = media_id
-            self.atp_medias.append([media, min_gap.get(media_id, 0.01)])
-        
-        media_ids = set()
-        temp_medias = self.atp_medias
-        self.atp_medias = []
-        for media in temp_medias:
+            medias.append([media, min_gap.get(media_id, 0.01)])
+        self.add_atp_medias(medias)
+
+    def add_atp_medias(self, medias):
+        """
+        Adds media to test ATP production in, registering the empty media used by build_tests
+
+        :param medias: list<MSMedia> : media to add, or [MSMedia, minimum objective] pairs
+        """
+        media_ids = {media.id for media, minimum_obj in self.atp_medias}
+        for media in medias:
+            minimum_obj = 0.01
             if isinstance(media, list):
-                if media[0].id in media_ids:
-                    raise ValueError("media ids not unique")
-                media_ids.add(media[0].id)
-                self.atp_medias.append(media)
-                self.media_hash[media[0].id] = media[0]
-            else:
-                if media.id in media_ids:
-                    raise ValueError("media ids not unique")
-                media_ids.add(media.id)
-                self.atp_medias.append([media, 0.01])
-                self.media_hash[media.id] = media
+                media, minimum_obj = media
+            if media.id in media_ids:
+                raise ValueError("media ids not unique")
+            media_ids.add(media.id)
+            self.atp_medias.append([media, minimum_obj])
+            self.media_hash[media.id] = media
         if "empty" not in self.media_hash:
             media = MSMedia.from_dict({})
             media.id = "empty"
@@ -234,23 +270,22 @@ class MSATPCorrection:
         if len(self.noncore_reactions) > 0:
             self.restore_noncore_reactions(noncore=True, othercompartment=True)
         # Now clearing the existing noncore data structures
-        self.original_bounds = {}
         self.noncore_reactions = []
         self.other_compartments = []
+        # Saving all bounds in one snapshot, which restore_noncore_reactions applies in bulk
+        self.bound_snapshot = self.modelutl.bound_snapshot()
+        self.snapshot_positions = []
+        disable_lower = np.zeros(len(self.bound_snapshot["reactions"]), dtype=bool)
+        disable_upper = np.zeros(len(self.bound_snapshot["reactions"]), dtype=bool)
         # Iterating through reactions and disabling
-        for reaction in self.model.reactions:
-            gfrxn = self.get_msgapfill().gfmodel.reactions.get_by_id(reaction.id)
+        for i, reaction in enumerate(self.bound_snapshot["reactions"]):
             if reaction.id == self.atp_hydrolysis.id:
                 continue
             if FBAHelper.is_ex(reaction):
                 continue
             if FBAHelper.is_biomass(reaction):
                 continue
-
-            self.original_bounds[reaction.id] = (
-                reaction.lower_bound,
-                reaction.upper_bound,
-            )
+            self.snapshot_positions.append(i)
 
             # check if reaction is in core template
             template_reaction = self.find_reaction_in_template(
@@ -263,13 +298,11 @@ class MSATPCorrection:
                 if reaction.lower_bound < 0 and template_reaction.lower_bound >= 0:
                     logger.debug(reaction.id + " core but reversible")
                     self.noncore_reactions.append([reaction, "<"])
-                    reaction.lower_bound = 0
-                    gfrxn.lower_bound = 0
+                    disable_lower[i] = True
                 if reaction.upper_bound > 0 and template_reaction.upper_bound <= 0:
                     logger.debug(reaction.id + " core but reversible")
                     self.noncore_reactions.append([reaction, ">"])
-                    reaction.upper_bound = 0
-                    gfrxn.upper_bound = 0
+                    disable_upper[i] = True
             else:
                 logger.debug(f"{reaction.id} non core")
                 if FBAHelper.rxn_compartment(reaction) != self.compartment:
@@ -282,30 +315,276 @@ class MSATPCorrection:
                         self.noncore_reactions.append([reaction, "<"])
                     if reaction.upper_bound > 0:
                         self.noncore_reactions.append([reaction, ">"])
-                reaction.lower_bound = 0
-                reaction.upper_bound = 0
-                gfrxn.lower_bound = 0
-                gfrxn.upper_bound = 0
+                disable_lower[i] = True
+                disable_upper[i] = True
+        self.modelutl.apply_bound_snapshot(
+            self.bound_snapshot,
+            np.where(disable_lower, 0, self.bound_snapshot["lower_bounds"]),
+            np.where(disable_upper, 0, self.bound_snapshot["upper_bounds"]),
+            self.snapshot_positions,
+        )
+        # Disabling the same reaction directions in the gapfilling model
+        gfmodel = self.get_msgapfill().gfmodel
+        gfutl = MSModelUtil.get(gfmodel)
+        gfsnapshot = gfutl.bound_snapshot(
+            [
+                gfmodel.reactions.get_by_id(rxn.id)
+                for rxn in self.bound_snapshot["reactions"]
+            ]
+        )
+        gfutl.apply_bound_snapshot(
+            gfsnapshot,
+            np.where(disable_lower, 0, gfsnapshot["lower_bounds"]),
+            np.where(disable_upper, 0, gfsnapshot["upper_bounds"]),
+            self.snapshot_positions,
+        )
+
+    @property
+    def original_bounds(self):
+        """Bounds of the reactions saved by disable_noncore_reactions, keyed by reaction ID"""
+        if self.bound_snapshot is None:
+            return {}
+        return {
+            self.bound_snapshot["reactions"][i].id: (
+                self.bound_snapshot["lower_bounds"][i].item(),
+                self.bound_snapshot["upper_bounds"][i].item(),
+            )
+            for i in self.snapshot_positions
+        }
+
+    def snapshot_positions_for(self, reaction_list):
+        """Returns the snapshot positions of the reactions in a [reaction, direction] list"""
+        index = self.bound_snapshot["index"]
+        return np.unique(
+            np.array(
+                [index[item[0].id] for item in reaction_list if item[0].id in index],
+                dtype=np.int64,
+            )
+        )
+
+    def reaction_set_fingerprint(self, *extra):
+        """
+        Computes a hash of the active reactions of the model and any extra JSON serializable data
+
+        Reactions with both bounds at zero are left out, so models built from the same template
+        have the same fingerprint once their noncore reactions are disabled. Exchange bounds are
+        left out because every media application changes them.
+
+        The reaction IDs and stoichiometry are serialized once per reaction set, as tracked by
+        MSModelUtil.member_signature; later calls only read the bounds as arrays. Stoichiometry
+        edited in place on a reaction already in the model is not picked up.
+
+        :return: string : hex digest usable across processes and runs
+        """
+        reactions = self.model.reactions
+        signature = MSModelUtil.member_signature(reactions)
+        if (
+            self.stoichiometry_fingerprint is None
+            or self.stoichiometry_fingerprint[0] != signature
+        ):
+            exchange = np.zeros(len(reactions), dtype=bool)
+            data = []
+            for i, rxn in enumerate(reactions):
+                exchange[i] = FBAHelper.is_ex(rxn)
+                data.append(
+                    [
+                        rxn.id,
+                        sorted((met.id, coef) for met, coef in rxn.metabolites.items()),
+                    ]
+                )
+            digest = hashlib.sha1(json.dumps(data).encode()).hexdigest()
+            self.stoichiometry_fingerprint = (signature, exchange, digest)
+        signature, exchange, digest = self.stoichiometry_fingerprint
+        lower = np.fromiter(
+            (rxn.lower_bound for rxn in reactions), dtype="<f8", count=len(reactions)
+        )
+        upper = np.fromiter(
+            (rxn.upper_bound for rxn in reactions), dtype="<f8", count=len(reactions)
+        )
+        active = ~exchange & ((lower != 0) | (upper != 0))
+        fingerprint = hashlib.sha1(
+            json.dumps([list(extra), digest], default=str).encode()
+        )
+        fingerprint.update(active.tobytes())
+        fingerprint.update(lower[active].tobytes())
+        fingerprint.update(upper[active].tobytes())
+        return fingerprint.hexdigest()
+
+    @staticmethod
+    def media_fingerprint_data(media):
+        return [
+            media.id,
+            sorted(
+                (cpd.id, cpd.lower_bound, cpd.upper_bound)
+                for cpd in media.mediacompounds
+            ),
+        ]
+
+    def core_fingerprint(self, no_gapfilling=False):
+        """
+        Computes the cache key of the ATP media evaluation of the current (core restricted) model
+
+        The key covers the active reactions and their bounds, the ATP hydrolysis reaction, the
+        ATP media with their minimum objectives and everything the gapfilling of failing media
+        depends on: the content of the core template, the blacklists and the penalty and
+        exchange settings of the gapfilling package.
+        """
+        parameters = self.get_msgapfill().gfpkgmgr.getpkg("GapfillingPkg").parameters
+        base_media = parameters["base_media"]
+        if base_media is not None:
+            base_media = self.media_fingerprint_data(base_media)
+        return self.reaction_set_fingerprint(
+            "media_evaluation",
+            self.atp_hydrolysis.id,
+            no_gapfilling,
+            [
+                self.media_fingerprint_data(media) + [minimum_obj]
+                for media, minimum_obj in self.atp_medias
+            ],
+            MSGapfillDatabase.template_fingerprint(
+                self.coretemplate, "0", parameters["blacklist"], base_blacklist
+            ),
+            [
+                parameters[name]
+                for name in [
+                    "model_penalty",
+                    "default_excretion",
+                    "default_uptake",
+                    "default_exchange_penalty",
+                    "minimize_exchanges",
+                    "base_media_target_element",
+                ]
+            ],
+            sorted(parameters["auto_sink"]),
+            sorted((parameters["reaction_scores"] or {}).items()),
+            base_media,
+        )
+
+    def get_cached_results(self, key):
+        if key in MSATPCorrection.cache:
+            MSATPCorrection.cache.move_to_end(key)
+            return MSATPCorrection.cache[key]
+        if self.cache_dir:
+            filename = os.path.join(self.cache_dir, f"atp_{key[:16]}.json")
+            if os.path.exists(filename):
+                with open(filename, "r") as fh:
+                    data = json.load(fh)
+                if data["key"] == key:
+                    self.store_cached_results(key, data["results"], save=False)
+                    return data["results"]
+        return None
+
+    def store_cached_results(self, key, results, save=True):
+        MSATPCorrection.cache[key] = results
+        MSATPCorrection.cache.move_to_end(key)
+        while len(MSATPCorrection.cache) > MSATPCorrection.cache_size:
+            MSATPCorrection.cache.popitem(last=False)
+        if save and self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            filename = os.path.join(self.cache_dir, f"atp_{key[:16]}.json")
+            with open(filename, "w") as fh:
+                json.dump({"key": key, "results": results}, fh)
 
-    def evaluate_growth_media(self,no_gapfilling=False):
+    @staticmethod
+    def clear_cache():
+        MSATPCorrection.cache = OrderedDict()
+
+    def evaluate_growth_media(
+        self, no_gapfilling=False, processes=None, chunk_size=None, executor=None
+    ):
         """
         Determines how much gap filling each input test media requires to make ATP
 
-        :return:
+        :param no_gapfilling: Bool : only test ATP production without gapfilling
+        :param processes: int : number of worker processes evaluating and gapfilling subsets of the media
+        :param chunk_size: int : number of media per worker task (defaults to one subset per process)
+        :param executor: concurrent.futures.Executor : existing executor used instead of creating a process pool
+        :return: dict<string, float> : ATP production of each media before gapfilling
         """
         self.disable_noncore_reactions()
         self.media_gapfill_stats = {}
         self.get_msgapfill().default_gapfill_templates = [self.coretemplate]
         if self.lp_filename:
             self.get_msgapfill().lp_filename = self.lp_filename
+        indices = list(range(len(self.atp_medias)))
+        cached = None
+        if self.cache_results:
+            key = self.core_fingerprint(no_gapfilling)
+            cached = self.get_cached_results(key)
+        if cached is not None:
+            output = dict(cached["atp_production"])
+            stats = copy.deepcopy(cached["media_gapfill_stats"])
+        elif processes is None and executor is None:
+            output, stats = self.evaluate_media_range(indices, no_gapfilling)
+        else:
+            if chunk_size is None:
+                chunk_size = math.ceil(len(indices) / (processes or os.cpu_count() or 1))
+            chunk_size = max(1, chunk_size)
+            subsets = [
+                indices[start : start + chunk_size]
+                for start in range(0, len(indices), chunk_size)
+            ]
+            # Each worker loads the core restricted model and gapfilling problem once
+            with MSWorkerState(self, "atp", _atp_modelutls) as state:
+                args = [(state, subset, no_gapfilling) for subset in subsets]
+                if executor is not None:
+                    results = list(executor.map(_run_atp_media_worker, args))
+                else:
+                    with ProcessPoolExecutor(max_workers=processes) as pool:
+                        results = list(pool.map(_run_atp_media_worker, args))
+            output = {}
+            stats = {}
+            for subset_output, subset_stats in results:
+                output.update(subset_output)
+                stats.update(subset_stats)
+        if self.cache_results and cached is None:
+            # Media are stored by ID and restored to the input media objects on a cache hit
+            stored_stats = {}
+            for media_id, solution in stats.items():
+                if solution is not None:
+                    solution = dict(solution)
+                    if "media" in solution:
+                        solution["media"] = media_id
+                stored_stats[media_id] = solution
+            self.store_cached_results(
+                key,
+                copy.deepcopy(
+                    {"atp_production": output, "media_gapfill_stats": stored_stats}
+                ),
+            )
+        # Solutions from workers and the cache do not hold the input media objects, so the stats are keyed by and pointed to them here
+        for media, minimum_obj in self.atp_medias:
+            self.media_gapfill_stats[media] = stats[media.id]
+            if stats[media.id] is not None and "media" in stats[media.id]:
+                stats[media.id]["media"] = media
+
+        if MSATPCorrection.DEBUG:
+            export_data = {}
+            for media in self.media_gapfill_stats:
+                export_data[media.id] = self.media_gapfill_stats[media]
+            with open("debug.json", "w") as outfile:
+                json.dump(export_data, outfile)
+
+        return output
+
+    def evaluate_media_range(self, indices, no_gapfilling=False):
+        """
+        Tests ATP production in a subset of the ATP media and gapfills the media that fail
+
+        :param indices: list<int> : positions of the media to evaluate in atp_medias
+        :param no_gapfilling: Bool : only test ATP production without gapfilling
+        :return: (dict<string, float>, dict<string, dict>) : ATP production and gapfilling solution (or None) of each media by media ID
+        """
         output = {}
+        stats = {}
         with self.model:
             self.model.objective = self.atp_hydrolysis.id
             pkgmgr = MSPackageManager.get_pkg_mgr(self.model)
             # First prescreening model for ATP production without gapfilling
             media_list = []
             min_objectives = {}
-            for media, minimum_obj in self.atp_medias:
+            for index in indices:
+                media, minimum_obj = self.atp_medias[index]
 
                 logger.debug("evaluate media %s", media)
                 pkgmgr.getpkg("KBaseMediaPkg").build_package(media)
@@ -317,7 +596,7 @@ class MSATPCorrection:
                     solution.objective_value,
                     solution.status,
                 )
-                self.media_gapfill_stats[media] = None
+                stats[media.id] = None
 
                 output[media.id] = solution.objective_value
 
@@ -328,10 +607,10 @@ class MSATPCorrection:
                     media_list.append(media)
                     min_objectives[media] = minimum_obj
                 elif solution.objective_value >= minimum_obj:
-                    self.media_gapfill_stats[media] = {"reversed": {}, "new": {}}
+                    stats[media.id] = {"reversed": {}, "new": {}}
 
             # Now running gapfilling on all conditions where initially there was no growth
-            if not no_gapfilling:
+            if not no_gapfilling and len(media_list) > 0:
                 all_solutions = self.get_msgapfill().run_multi_gapfill(
                     media_list,
                     target=self.atp_hydrolysis.id,
@@ -342,19 +621,12 @@ class MSATPCorrection:
                     run_sensitivity_analysis=False,
                     integrate_solutions=False,
                 )
-                print(str(all_solutions))
-                # Adding the new solutions to the media gapfill stats
-                for media in all_solutions:
-                    self.media_gapfill_stats[media] = all_solutions[media]
-
-        if MSATPCorrection.DEBUG:
-            export_data = {}
-            for media in self.media_gapfill_stats:
-                export_data[media.id] = self.media_gapfill_stats[media]
-            with open("debug.json", "w") as outfile:
-                json.dump(export_data, outfile)
-
-        return output
+                logger.debug("ATP media gapfilling solutions: %s", all_solutions)
+                # Adding the new solutions to the media gapfill stats; None means no media could be gapfilled
+                if all_solutions:
+                    for media in all_solutions:
+                        stats[media.id] = all_solutions[media]
+        return output, stats
 
     def determine_growth_media(self, max_gapfilling=None):
         """
@@ -455,6 +727,8 @@ class MSATPCorrection:
         -------
         Raises
         ------
+        ValueError
+            If the model fails the ATP tests even with every noncore reaction filtered
         """
         self.filtered_noncore = []
         tests = self.build_tests()
@@ -465,16 +739,32 @@ class MSATPCorrection:
         self.filtered_noncore = self.modelutl.reaction_expansion_test(
             self.noncore_reactions, tests, attribute_label="atp_expansion_filter"
         )
-        # Removing filtered reactions
+        if self.filtered_noncore is None:
+            raise ValueError(
+                "No set of noncore reactions passes the ATP tests, model not expanded"
+            )
+        # Removing filtered reactions, starting from the bounds saved in the snapshot
+        if self.bound_snapshot is None:
+            self.bound_snapshot = self.modelutl.bound_snapshot()
+        lower_bounds = self.bound_snapshot["lower_bounds"].copy()
+        upper_bounds = self.bound_snapshot["upper_bounds"].copy()
+        index = self.bound_snapshot["index"]
         for item in self.filtered_noncore:
             logger.info("Removing " + item[0].id + " " + item[1])
             if item[1] == ">":
-                item[0].upper_bound = 0
+                upper_bounds[index[item[0].id]] = 0
             else:
-                item[0].lower_bound = 0
-            # reaction.update_variable_bounds()
-            if item[0].lower_bound == 0 and item[0].upper_bound == 0:
-                self.model.remove_reactions([item[0]])
+                lower_bounds[index[item[0].id]] = 0
+        positions = self.snapshot_positions_for(self.filtered_noncore)
+        self.modelutl.apply_bound_snapshot(
+            self.bound_snapshot, lower_bounds, upper_bounds, positions
+        )
+        blocked = positions[
+            (lower_bounds[positions] == 0) & (upper_bounds[positions] == 0)
+        ]
+        self.model.remove_reactions(
+            [self.bound_snapshot["reactions"][i] for i in blocked]
+        )
         # Restoring other compartment reactions but not the core because this would undo reaction filtering
         self.restore_noncore_reactions(noncore=False, othercompartment=True)
 
@@ -483,25 +773,17 @@ class MSATPCorrection:
         Restores the bounds on all noncore reactions
         :return:
         """
-        # Restoring original reaction bounds
+        if self.bound_snapshot is None:
+            return
+        # Restoring original reaction bounds from the snapshot; removed reactions are skipped
+        reaction_list = []
         if noncore:
-            for item in self.noncore_reactions:
-                reaction = item[0]
-                if (
-                    reaction.id in self.original_bounds
-                    and reaction in self.model.reactions
-                ):
-                    reaction.lower_bound = self.original_bounds[reaction.id][0]
-                    reaction.upper_bound = self.original_bounds[reaction.id][1]
+            reaction_list += self.noncore_reactions
         if othercompartment:
-            for item in self.other_compartments:
-                reaction = item[0]
-                if (
-                    reaction.id in self.original_bounds
-                    and reaction in self.model.reactions
-                ):
-                    reaction.lower_bound = self.original_bounds[reaction.id][0]
-                    reaction.upper_bound = self.original_bounds[reaction.id][1]
+            reaction_list += self.other_compartments
+        self.modelutl.apply_bound_snapshot(
+            self.bound_snapshot, positions=self.snapshot_positions_for(reaction_list)
+        )
 
     def build_tests(self, multiplier_hash_override={}):
         """Build tests based on ATP media evaluations
@@ -551,15 +833,31 @@ class MSATPCorrection:
             }
         # Setting objective to ATP hydrolysis
         self.model.objective = self.atp_hydrolysis.id
+        # ATP production only depends on the active reactions, so it is shared by identical models
+        production = None
+        if self.cache_results:
+            key = self.reaction_set_fingerprint(
+                "atp_production",
+                self.atp_hydrolysis.id,
+                [self.media_fingerprint_data(media) for media in self.selected_media],
+            )
+            cached = self.get_cached_results(key)
+            production = {} if cached is None else cached["atp_production"]
         for media in self.selected_media:
             # Setting multiplier for test threshold
             multiplier = multiplier_hash_override["default"]
             if media.id in multiplier_hash_override:
                 multiplier = multiplier_hash_override[media.id]
-            # Constraining model exchanges for media
+            # Constraining model exchanges for media, also on a cache hit so the model ends in
+            # the same state either way
             self.modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(media)
-            # Computing core ATP production
-            obj_value = self.model.slim_optimize()
+            if production is not None and media.id in production:
+                obj_value = production[media.id]
+            else:
+                # Computing core ATP production
+                obj_value = self.model.slim_optimize()
+                if production is not None:
+                    production[media.id] = obj_value
             logger.debug(f"{media.name} = {obj_value};{multiplier}")
             threshold = multiplier * obj_value
             if threshold == 0:
@@ -577,6 +875,8 @@ class MSATPCorrection:
                 "threshold": multiplier * obj_value,
                 "objective": self.atp_hydrolysis.id,
             }
+        if production is not None and cached is None:
+            self.store_cached_results(key, {"atp_production": production})
         # Saving test attributes to the model
         self.modelutl.save_attributes(atp_att, "ATP_analysis")
         return tests
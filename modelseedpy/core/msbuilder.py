@@ -1,13 +1,17 @@
 # -*- coding: utf-8 -*-
 import logging
 import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from enum import Enum
 import cobra
 from modelseedpy.core.exceptions import ModelSEEDError
 from modelseedpy.core.rast_client import RastClient
 from modelseedpy.core.msgenome import normalize_role
 from modelseedpy.core.mstemplate import TemplateReactionType
+from modelseedpy.core.mstemplatearchive import MSTemplateArchive
+from modelseedpy.core.msworker import MSWorkerState
 from modelseedpy.core.msmodel import (
+    MSModel,
     get_gpr_string,
     get_reaction_constraints_from_direction,
 )
@@ -29,6 +33,28 @@ DEFAULT_SINKS = {
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_GENOME_CLASSIFIER = "knn_ACNP_RAST_filter_01_17_2023"
+
+# TODO: update with enum MSGenomeClass
+GENOME_SCALE_TEMPLATES = {
+    "A": "template_gram_neg",
+    "C": "template_gram_neg",
+    "N": "template_gram_neg",
+    "P": "template_gram_pos",
+}
+
+CORE_TEMPLATES = {
+    "A": "template_core",
+    "C": "template_core",
+    "N": "template_core",
+    "P": "template_core",
+}
+
+def _run_build_worker(args):
+    """Builds the model of one genome against the templates loaded in the worker"""
+    state, model_id, genome, options = args
+    return MSBuilder.build_one(model_id, genome, state.get(), **options)
+
 ### temp stuff ###
 core_biomass = {
     "cpd00032_c": -1.7867,
@@ -437,12 +463,20 @@ class MSBuilder:
         :param template_reaction:
         :return:
         """
+        role_index = self.template.get_role_index() if self.template else None
         template_reaction_complexes = {}
         for cpx in template_reaction.get_complexes():
             template_reaction_complexes[cpx.id] = {}
-            for role, (triggering, optional) in cpx.roles.items():
-                sn = normalize_role(role.name)
-                template_reaction_complexes[cpx.id][role.id] = [
+            # Normalized role names are taken from the template index when available
+            if role_index and role_index["complexes"].get(cpx.id) is cpx:
+                complex_roles = role_index["complex_roles"][cpx.id].items()
+            else:
+                complex_roles = [
+                    (role.id, (normalize_role(role.name), triggering, optional))
+                    for role, (triggering, optional) in cpx.roles.items()
+                ]
+            for role_id, (sn, triggering, optional) in complex_roles:
+                template_reaction_complexes[cpx.id][role_id] = [
                     sn,
                     triggering,
                     optional,
@@ -579,38 +613,31 @@ class MSBuilder:
             res.append(self.build_biomass("bio1", model, template, grampos))
         return res
 
-    def auto_select_template(self):
+    def auto_select_template(self, genome_classifier=None, templates=None):
         """
 
+        :param genome_classifier: loaded classifier (default: loads DEFAULT_GENOME_CLASSIFIER)
+        :param templates: dict of loaded genome scale templates by name in GENOME_SCALE_TEMPLATES
         :return: genome class
         """
         from modelseedpy.helpers import get_template, get_classifier
         from modelseedpy.core.mstemplate import MSTemplateBuilder
 
-        genome_classifier = get_classifier("knn_ACNP_RAST_filter_01_17_2023")
+        if genome_classifier is None:
+            genome_classifier = get_classifier(DEFAULT_GENOME_CLASSIFIER)
         self.genome_class = genome_classifier.classify(self.genome)
 
-        # TODO: update with enum MSGenomeClass
-        template_genome_scale_map = {
-            "A": "template_gram_neg",
-            "C": "template_gram_neg",
-            "N": "template_gram_neg",
-            "P": "template_gram_pos",
-        }
-        template_core_map = {
-            "A": "template_core",
-            "C": "template_core",
-            "N": "template_core",
-            "P": "template_core",
-        }
-
         if (
-            self.genome_class in template_genome_scale_map
-            and self.genome_class in template_core_map
+            self.genome_class in GENOME_SCALE_TEMPLATES
+            and self.genome_class in CORE_TEMPLATES
         ):
-            self.template = MSTemplateBuilder.from_dict(
-                get_template(template_genome_scale_map[self.genome_class])
-            ).build()
+            template_name = GENOME_SCALE_TEMPLATES[self.genome_class]
+            if templates is not None and template_name in templates:
+                self.template = templates[template_name]
+            else:
+                self.template = MSTemplateBuilder.from_dict(
+                    get_template(template_name)
+                ).build()
         elif self.template is None:
             raise Exception(f"unable to select template for {self.genome_class}")
 
@@ -618,7 +645,10 @@ class MSBuilder:
 
     def generate_reaction_complex_sets(self, allow_incomplete_complexes=True):
         self.reaction_to_complex_sets = {}
-        for template_reaction in self.template.reactions:
+        # Only reactions with a complex containing an annotated role can have a gpr set
+        for template_reaction in self.template.get_reactions_from_roles(
+            self.search_name_to_genes
+        ):
             gpr_set = self.get_gpr_from_template_reaction(
                 template_reaction, allow_incomplete_complexes
             )
@@ -937,6 +967,8 @@ class MSBuilder:
         biomass_classic=False,
         biomass_gc=0.5,
         add_reaction_from_rast_annotation=True,
+        genome_classifier=None,
+        templates=None,
     ):
         """
 
@@ -947,6 +979,8 @@ class MSBuilder:
         @param annotate_with_rast:
         @param biomass_classic:
         @param biomass_gc:
+        @param genome_classifier: loaded classifier used to select a template if none is set
+        @param templates: loaded genome scale templates used to select a template if none is set
         @return:
         """
         self.index = index
@@ -960,7 +994,7 @@ class MSBuilder:
 
         # rxn_roles = aux_template(self.template)  # needs to be fixed to actually reflect template GPR rules
         if self.template is None:
-            self.auto_select_template()
+            self.auto_select_template(genome_classifier, templates)
 
         cobra_model = model_or_id
         if type(model_or_id) == str:
@@ -1120,10 +1154,139 @@ class MSBuilder:
             )
         return model
 
+    @staticmethod
+    def build_one(
+        model_id, genome, data, gapfill_media=None, output="model", **build_args
+    ):
+        """Builds the model of one genome against loaded templates (see build_many)
+
+        @param model_id: ID of the built model
+        @param genome: MSGenome
+        @param data: dict with the "template" (MSTemplate or MSTemplateArchive) to use, or the
+        "genome_classifier" and genome scale "templates" to select one from; the full template
+        of an archive is kept in it as "gapfill_template" once built for gapfilling
+        @param gapfill_media: MSMedia to gapfill biomass production in, or None to not gapfill
+        @param output: "model" to return the cobra.Model or "json" to return it as a JSON string
+        @param build_args: arguments passed to MSBuilder.build
+        @return: built model or JSON string
+        """
+        template = data["template"]
+        gapfill_template = None
+        if isinstance(template, MSTemplateArchive):
+            # Gapfilling draws on the full archive, which is built once per process
+            if gapfill_media is not None:
+                if data.get("gapfill_template") is None:
+                    data["gapfill_template"] = template.to_template()
+                gapfill_template = data["gapfill_template"]
+            # Only materializing the reactions the genome can use, plus reactions without genes
+            if build_args.get("annotate_with_rast", True):
+                RastClient().annotate_genome(genome)
+                build_args = dict(build_args, annotate_with_rast=False)
+            search_name_to_genes, _ = _aaaa(genome, "RAST")
+            template = template.to_template(
+                template.get_reactions_from_roles(search_name_to_genes)
+                + template.get_reactions_by_type(["universal", "spontaneous"])
+            )
+        builder = MSBuilder(genome, template)
+        model = builder.build(
+            model_id,
+            genome_classifier=data["genome_classifier"],
+            templates=data["templates"],
+            **build_args,
+        )
+        if gapfill_media is not None:
+            model = MSBuilder.gapfill_model(
+                model, "bio1", gapfill_template or builder.template, gapfill_media
+            )
+        if output == "json":
+            return cobra.io.to_json(model)
+        return model
+
+    @staticmethod
+    def build_many(
+        genomes,
+        template=None,
+        model_ids=None,
+        gapfill_media=None,
+        output="model",
+        processes=None,
+        executor=None,
+        **build_args,
+    ):
+        """Builds one model per genome, yielding each model as soon as it is built
+
+        The template (or, when no template is given, the genome classifier and the genome
+        scale templates) is loaded once and its role index built once in this process. The
+        loaded data is pickled once and shared read-only with every worker process, so each
+        genome only pays for its own reconstruction:
+
+            for model_id, model_json in MSBuilder.build_many(
+                genomes, template, output="json", annotate_with_rast=False, processes=8
+            ):
+                ...
+
+        @param genomes: list of MSGenome
+        @param template: MSTemplate used for all genomes, MSTemplateArchive from which only the
+        reactions each genome can use are built, or None to select a template for each genome
+        with the genome classifier; archives loaded from a file are memory-mapped by each worker
+        @param model_ids: ID of the model of each genome (default: the genome IDs)
+        @param gapfill_media: MSMedia to gapfill biomass production in, or None to not gapfill
+        @param output: "model" to yield cobra.Model objects or "json" to yield JSON strings,
+        which are cheaper to send back from worker processes
+        @param processes: number of worker processes to create when no executor is provided;
+        None or 1 builds every model in this process
+        @param executor: existing concurrent.futures.Executor to submit the genomes to
+        @param build_args: arguments passed to MSBuilder.build (index, annotate_with_rast, ...)
+        @return: generator of (model ID, model or JSON string) in order of completion
+        """
+        if output not in ["model", "json"]:
+            raise ValueError("output must be model or json")
+        if model_ids is None:
+            model_ids = [
+                genome.id if genome.id else "model" + str(i)
+                for i, genome in enumerate(genomes)
+            ]
+        data = {"template": template, "genome_classifier": None, "templates": None}
+        if template is None:
+            from modelseedpy.helpers import get_template, get_classifier
+            from modelseedpy.core.mstemplate import MSTemplateBuilder
+
+            data["genome_classifier"] = get_classifier(DEFAULT_GENOME_CLASSIFIER)
+            data["templates"] = {
+                name: MSTemplateBuilder.from_dict(get_template(name)).build()
+                for name in set(GENOME_SCALE_TEMPLATES.values())
+            }
+        for loaded in [template] + list((data["templates"] or {}).values()):
+            if loaded is not None and not isinstance(loaded, MSTemplateArchive):
+                loaded.get_role_index()
+        options = dict(build_args, gapfill_media=gapfill_media, output=output)
+        if executor is None and (processes is None or processes == 1):
+            for model_id, genome in zip(model_ids, genomes):
+                yield model_id, MSBuilder.build_one(model_id, genome, data, **options)
+            return
+        with MSWorkerState(data, "build") as state:
+            pool = None
+            if executor is None:
+                pool = executor = ProcessPoolExecutor(max_workers=processes)
+            try:
+                futures = {
+                    executor.submit(
+                        _run_build_worker, (state, model_id, genome, options)
+                    ): model_id
+                    for model_id, genome in zip(model_ids, genomes)
+                }
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+
     @staticmethod
     def gapfill_model(original_mdl, target_reaction, template, media):
+        from modelseedpy.core.msmodelutl import MSModelUtil
+
         FBAHelper.set_objective_from_target_reaction(original_mdl, target_reaction)
-        model = cobra.io.json.from_json(cobra.io.json.to_json(original_mdl))
+        model = MSModelUtil.clone(original_mdl)
         pkgmgr = MSPackageManager.get_pkg_mgr(model)
         pkgmgr.getpkg("GapfillingPkg").build_package(
             {
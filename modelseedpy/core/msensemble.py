@@ -12,6 +12,7 @@ from optlang.symbolics import Zero, add
 from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
 from modelseedpy.core.msmodelutl import MSModelUtil
 from modelseedpy.core.msfba import MSFBA
+from modelseedpy.core.msmodeloverlay import MSModelOverlay
 from modelseedpy.core.msatpcorrection import MSATPCorrection
 
 # from builtins import None
@@ -29,7 +30,7 @@ class MSEnsemble:
             for (i,mdl) in enumerate(models):
                 models[i] = MSModelUtil.get(mdl)
         #Cloning the first model as a starting point
-        clone_model = cobra.io.json.from_json(cobra.io.json.to_json(models[0].model))
+        clone_model = MSModelUtil.clone(models[0])
         clone_mdlutl = MSModelUtil.get(clone_model)
         ensemble = MSEnsemble(clone_mdlutl)
         ensemble.rebuild_from_models(models)
@@ -202,21 +203,24 @@ class MSEnsemble:
                     self.data["reactions"][rxnid]["presence"] += "0"
 
     def unpack_models(self,model_list=None):
-        output_models = [None]*self.size
-        for i in range(self.size):
+        output_models = [None]*self.data["size"]
+        for i in range(self.data["size"]):
             if not model_list or i in model_list:
-                clone_mdl = cobra.io.json.from_json(cobra.io.json.to_json(self.model))
+                clone_mdl = MSModelUtil.clone(self.mdlutl)
                 clone_mdl_utl = MSModelUtil.get(clone_mdl)
                 remove_reactions = []
                 for rxn in clone_mdl_utl.model.reactions:
                     if rxn.id in self.data["reactions"]:
-                        if self.data["reactions"][rxn.id][i] == "0":
+                        if self.data["reactions"][rxn.id]["presence"][i] == "0":
                             remove_reactions.append(rxn)
                         else:
                             new_genes = []
                             for gene in rxn.genes:
                                 if gene.id in self.data["reactions"][rxn.id]["genes"]:
-                                    if self.data["reactions"][rxn.id]["genes"][gene.id][i] == "1":
+                                    gene_data = self.data["reactions"][rxn.id]["genes"][gene.id]
+                                    if isinstance(gene_data,dict):
+                                        gene_data = gene_data["presence"]
+                                    if gene_data[i] == "1":
                                         new_genes.append(gene)
                             rxn.gene_reaction_rule = " or ".join([gene.id for gene in new_genes])
                     else:
@@ -242,17 +246,46 @@ class MSEnsemble:
                 output_models[i] = clone_mdl_utl
         return output_models
 
+    def build_member_overlays(self,model_list=None):
+        """Builds an MSModelOverlay for each ensemble member that knocks out the member's missing reactions
+
+        Unlike unpack_models, no model is copied: every overlay shares the ensemble model and its LP
+        """
+        output_overlays = [None]*self.data["size"]
+        for i in range(self.data["size"]):
+            if not model_list or i in model_list:
+                overlay = MSModelOverlay(self.mdlutl,id=self.model.id+"."+str(i))
+                knockouts = []
+                for rxn in self.model.reactions:
+                    if rxn.id in self.data["reactions"]:
+                        if self.data["reactions"][rxn.id]["presence"][i] == "0":
+                            knockouts.append(rxn.id)
+                        else:
+                            overlay.reaction_genes[rxn.id] = []
+                            for gene in rxn.genes:
+                                if gene.id in self.data["reactions"][rxn.id]["genes"]:
+                                    gene_data = self.data["reactions"][rxn.id]["genes"][gene.id]
+                                    if isinstance(gene_data,dict):
+                                        gene_data = gene_data["presence"]
+                                    if gene_data[i] == "1":
+                                        overlay.reaction_genes[rxn.id].append(gene.id)
+                    else:
+                        knockouts.append(rxn.id)
+                overlay.knock_out(knockouts)
+                output_overlays[i] = overlay
+        return output_overlays
+
     def save_ensemble_model(self):
         self.mdlutl.save_attributes(self.data,"ensemble")
         return self.mdlutl
 
     def run_fba(self,media,objective,maximize,gene_ko=[],reaction_ko=[],pfba=True,fva=True):
-        msfba = MSFBA(self.model,media,objective,maximize,gene_ko,reaction_ko,pfba,fva,clone=True)
+        msfba = MSFBA(self.model,media,objective,maximize,gene_ko,reaction_ko,pfba,fva,overlay=True)
         msfba.run()
-        models = self.unpack_models()
-        #Iterating over each model to run FBA on each
-        for mdlutl in models:
-            subfba = MSFBA(mdlutl,media,objective,maximize,gene_ko,reaction_ko,pfba,fva,clone=False)
+        overlays = self.build_member_overlays()
+        #Iterating over each member to run FBA on each, all sharing the ensemble model LP
+        for overlay in overlays:
+            subfba = MSFBA(self.mdlutl,media,objective,maximize,gene_ko,reaction_ko,pfba,fva,overlay=overlay)
             subfba.run()
             msfba.add_secondary_solution(subfba.primary_solution,subfba.fva_results)
         return msfba
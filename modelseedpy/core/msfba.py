@@ -6,17 +6,29 @@ import cobra
 from cobra.flux_analysis import pfba
 from cobra.flux_analysis import flux_variability_analysis
 from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msmodeloverlay import MSModelOverlay
 
 logger = logging.getLogger(__name__)
 
 class MSFBA:
-    def __init__(self,model_or_mdlutl,media,objective_reactions={"bio1":1},maximize=True,gene_ko=[],reaction_ko=[],pfba=True,fva=True,clone=True,primary_solution=None,id=None):
+    def __init__(self,model_or_mdlutl,media,objective_reactions={"bio1":1},maximize=True,gene_ko=[],reaction_ko=[],pfba=True,fva=True,clone=True,primary_solution=None,id=None,overlay=False):
+        #overlay: True or an MSModelOverlay to record media, knockouts and objective as deltas on the shared model instead of cloning it
+        if isinstance(overlay, MSModelOverlay):
+            model_or_mdlutl = overlay.mdlutl
+            clone = False
+        elif overlay:
+            clone = False
         if isinstance(model_or_mdlutl, MSModelUtil):
             model_or_mdlutl = model_or_mdlutl.model
         if clone:
-            model_or_mdlutl = cobra.io.json.from_json(cobra.io.json.to_json(model_or_mdlutl))
+            model_or_mdlutl = MSModelUtil.clone(model_or_mdlutl)
         self.model = model_or_mdlutl
-        self.mdlutl = MSModelUtil.get(model_or_mdlutl)        
+        self.mdlutl = MSModelUtil.get(model_or_mdlutl)
+        self.overlay = None
+        if isinstance(overlay, MSModelOverlay):
+            self.overlay = overlay
+        elif overlay:
+            self.overlay = MSModelOverlay(self.mdlutl)
         self.media = media
         self.objective_reactions = objective_reactions
         self.maximize = maximize
@@ -39,6 +51,7 @@ class MSFBA:
         if not self.maximize:
             sense = "min"
         obj = self.model.problem.Objective(0, direction=sense)
+        self.model.objective = obj
         objcoef = {}
         for rxnid in self.objective_reactions:
             if rxnid in self.model.reactions:
@@ -46,10 +59,22 @@ class MSFBA:
                 objcoef[rxn.forward_variable] = self.objective_reactions[rxnid]
                 objcoef[rxn.reverse_variable] = -1*self.objective_reactions[rxnid]
             else:
-                logger.warning(f"KO reaction {rxnid} not found in model")
+                logger.warning(f"Objective reaction {rxnid} not found in model")
         obj.set_linear_coefficients(objcoef)
 
     def apply_parameters(self):
+        """Applies the media, knockouts and objective to the model
+
+        With an overlay these are recorded as deltas and applied only during run. Otherwise they are
+        set directly on self.model, which is the caller's own model when clone is False, and the
+        objective_reactions replace the model's objective in both cases
+        """
+        if self.overlay:
+            self.overlay.set_media(self.media)
+            self.overlay.knock_out_genes(self.gene_ko)
+            self.overlay.knock_out(self.reaction_ko)
+            self.overlay.set_objective(self.objective_reactions,self.maximize)
+            return
         self.pkgmgr.getpkg("KBaseMediaPkg").build_package(self.media)
         for gene in self.gene_ko:
             if gene in self.model.genes:
@@ -61,14 +86,26 @@ class MSFBA:
                 self.model.reactions.get_by_id(rxn).knock_out()
             else:
                 logger.warning(f"KO reaction {rxn} not found in model")
+        self.build_objective()
     
     def run(self):
-        if self.pfba:
-            self.primary_solution = pfba(self.model)
-        else:
-            self.primary_solution = self.model.optimize()
-        if self.fva:
-            self.fva_results = flux_variability_analysis(self.model)
+        if self.overlay:
+            self.overlay.apply()
+        try:
+            if self.pfba:
+                self.primary_solution = pfba(self.model)
+            else:
+                self.primary_solution = self.model.optimize()
+            if self.fva:
+                self.fva_results = flux_variability_analysis(self.model)
+        finally:
+            if self.overlay:
+                self.overlay.revert()
+
+    def reaction_bounds(self,rxn):
+        if self.overlay:
+            return self.overlay.get_bounds(rxn.id)
+        return rxn.bounds
 
     def add_secondary_solution(self,solution,fva=None):
         if self.secondary_solutions == None:
@@ -169,8 +206,9 @@ class MSFBA:
             flux = 0
             if rxn.id in self.primary_solution.fluxes:
                 flux = self.primary_solution.fluxes[rxn.id]
-            min_flux = rxn.lower_bound
-            max_flux = rxn.upper_bound
+            (lower_bound, upper_bound) = self.reaction_bounds(rxn)
+            min_flux = lower_bound
+            max_flux = upper_bound
             if self.fva_results and rxn.id in self.fva_results:
                 min_flux, max_flux = self.fva_results[rxn.id]
             other_mins= []
@@ -183,8 +221,8 @@ class MSFBA:
                     else:
                         other_fluxes.append(0)
             if self.secondary_fva:
-                othermin = rxn.lower_bound
-                othermax = rxn.upper_bound
+                othermin = lower_bound
+                othermax = upper_bound
                 for fva in self.secondary_fva:
                     if rxn.id in fva:
                         othermin, othermax = fva[rxn.id]
@@ -193,10 +231,10 @@ class MSFBA:
             variable_class = self.get_variable_class(min_flux, max_flux)
             variable_data = {
                 "class": variable_class,
-                "lowerBound": rxn.lower_bound,
+                "lowerBound": lower_bound,
                 "max": max_flux,
                 "min": min_flux,
-                "upperBound": rxn.upper_bound,
+                "upperBound": upper_bound,
                 "other_max": other_maxes,
                 "other_min": other_mins,
                 "other_values": other_fluxes,
@@ -3,15 +3,16 @@
 import logging
 import cobra
 import re
-import json
 import numpy as np
 import pandas as pd
 from optlang.symbolics import Zero, add
 from modelseedpy.core import FBAHelper  # !!! the import is never used
 from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
 from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msworker import MSWorkerState
 from modelseedpy.core.exceptions import GapfillingError
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
 
 logger = logging.getLogger(__name__)
@@ -19,6 +20,18 @@ logger.setLevel(
     logging.INFO  # WARNING
 )  # When debugging - set this to INFO then change needed messages below from DEBUG to INFO
 
+def _gapfill_modelutls(msgapfill):
+    return [msgapfill.mdlutl, msgapfill.gfmodelutl]
+
+
+def _run_gapfill_worker(args):
+    """Gapfills one media, returning the solution and the sensitivity data saved for it"""
+    state, media, target, minimum_obj, binary_check = args
+    msgapfill = state.get()
+    solution = msgapfill.run_gapfilling(media, target, minimum_obj, binary_check, False)
+    gf_sensitivity = msgapfill.mdlutl.get_attributes("gf_sensitivity", {})
+    return solution, gf_sensitivity.get(media.id)
+
 
 class MSGapfill:
     @staticmethod
@@ -44,7 +57,8 @@ class MSGapfill:
         default_uptake=0,
         default_target=None,
         base_media = None,
-        base_media_target_element = "C"
+        base_media_target_element = "C",
+        gapfill_database_cache = None
     ):
         # Discerning input is model or mdlutl and setting internal links
         if isinstance(model_or_mdlutl, MSModelUtil):
@@ -64,7 +78,7 @@ class MSGapfill:
             "cpd03091",
         ]  # the cpd11416 compound is filtered during model extension with templates
         # Cloning model to create gapfilling model
-        self.gfmodel = cobra.io.json.from_json(cobra.io.json.to_json(self.model))
+        self.gfmodel = MSModelUtil.clone(self.model)
         self.gfmodelutl = MSModelUtil.get(self.gfmodel)
         # Getting package manager for gapfilling model
         self.gfpkgmgr = MSPackageManager.get_pkg_mgr(self.gfmodelutl)
@@ -107,7 +121,8 @@ class MSGapfill:
                 "reaction_scores": self.reaction_scores,
                 "set_objective": 1,
                 "base_media": base_media,
-                "base_media_target_element":base_media_target_element
+                "base_media_target_element":base_media_target_element,
+                "gapfill_database_cache":gapfill_database_cache
             }
         )
 
@@ -152,12 +167,16 @@ class MSGapfill:
         )
         return False
 
-    def prefilter(self,test_conditions=None,growth_conditions=[],use_prior_filtering=True,base_filter_only=False):
+    def prefilter(self,test_conditions=None,growth_conditions=[],use_prior_filtering=True,base_filter_only=False,processes=None,executor=None):
         """Prefilters the database by removing any reactions that break specified ATP tests
         Parameters
         ----------
         test_conditions : []
             List of conditions to be tested when filtering the gapfilling database. If not specified, the test_conditions attribute will be used
+        processes : int
+            Number of worker processes used to test conditions in parallel
+        executor : concurrent.futures.Executor
+            Existing executor used to test conditions in parallel
         """
         if not test_conditions:
             test_conditions = self.test_conditions
@@ -170,7 +189,9 @@ class MSGapfill:
                 self.test_conditions,
                 growth_conditions=growth_conditions,
                 base_filter=base_filter,
-                base_filter_only=base_filter_only
+                base_filter_only=base_filter_only,
+                processes=processes,
+                executor=executor,
             )
             gf_filter = self.gfpkgmgr.getpkg("GapfillingPkg").modelutl.get_attributes(
                 "gf_filter", {}
@@ -411,7 +432,9 @@ class MSGapfill:
         gapfilling_mode="Sequential",
         run_sensitivity_analysis=True,
         integrate_solutions=True,
-        remove_unneeded_reactions=True
+        remove_unneeded_reactions=True,
+        processes=None,
+        executor=None,
     ):
         """Run gapfilling across an array of media conditions ultimately using different integration policies: simultaneous gapfilling, independent gapfilling, cumulative gapfilling
         Parameters
@@ -434,11 +457,15 @@ class MSGapfill:
             Indicates the integration policy to be used: Global, Independent, and Cumulative
         run_sensitivity_analysis : bool
             Indicates if sensitivity analysis should be run on the gapfilling solution to determine biomass dependency
+        processes : int
+            Number of worker processes used to gapfill each media in parallel in Independent mode
+        executor : concurrent.futures.Executor
+            Executor to use for parallel Independent gapfilling instead of creating a process pool
         """
         #If not integrating, backing up and replacing self.mdlutl
         oldmdlutl = self.mdlutl
         if not integrate_solutions:
-            self.model = cobra.io.json.from_json(cobra.io.json.to_json(self.model))
+            self.model = MSModelUtil.clone(self.model)
             self.mdlutl = MSModelUtil.get(self.model)
         #Setting the default minimum objective
         if default_minimum_objective == None:
@@ -479,9 +506,8 @@ class MSGapfill:
         targets = []
         thresholds = []
         for item in media_list:
-            currtarget=target
-            if media in target_hash:
-                targets.append(target_hash[media])
+            if item in target_hash:
+                targets.append(target_hash[item])
             else:
                 targets.append(target)
             #Determining the minimum objective for the current media
@@ -489,15 +515,27 @@ class MSGapfill:
             if item in minimum_objectives:
                 minimum_obj = minimum_objectives[item]
             thresholds.append(minimum_obj)
+        #Independent solves do not depend on each other, so they can be farmed out to worker processes
+        parallel_solutions = None
+        if gapfilling_mode == "Independent" and (executor or (processes and processes > 1)):
+            parallel_solutions = self.run_parallel_gapfilling(
+                media_list, targets, thresholds, binary_check, processes, executor
+            )
+        for i,item in enumerate(media_list):
+            currtarget = targets[i]
+            minimum_obj = thresholds[i]
             #Implementing specified gapfilling mode
-            if gapfilling_mode == "Independent" or gapfilling_mode == "Sequential":           
-                solution = self.run_gapfilling(
-                    item,
-                    currtarget,
-                    minimum_obj,
-                    binary_check,
-                    False,
-                )
+            if gapfilling_mode == "Independent" or gapfilling_mode == "Sequential":
+                if parallel_solutions is not None:
+                    solution = parallel_solutions[i]
+                else:
+                    solution = self.run_gapfilling(
+                        item,
+                        currtarget,
+                        minimum_obj,
+                        binary_check,
+                        False,
+                    )
                 #If there is a solution, go ahead and integrate it into the model
                 if solution:
                     solution_dictionary[item] = self.integrate_gapfill_solution(
@@ -549,8 +587,6 @@ class MSGapfill:
             self.gfpkgmgr.getpkg("GapfillingPkg").compute_gapfilling_penalties(reaction_scores=self.reaction_scores)
             self.gfpkgmgr.getpkg("GapfillingPkg").build_gapfilling_objective_function()
         #Running sensitivity analysis once on the cumulative solution for all media
-        with open("datacache/solutions.json", 'w') as f:
-            json.dump(solution_dictionary,f,indent=4,skipkeys=True)
         if run_sensitivity_analysis:
             logger.info(
                 "Gapfilling sensitivity analysis running"
@@ -608,6 +644,59 @@ class MSGapfill:
         #Returning the solution dictionary
         return solution_dictionary
 
+    def run_parallel_gapfilling(
+        self, media_list, targets, thresholds, binary_check=False, processes=None, executor=None
+    ):
+        """Runs independent gapfilling for each media in separate worker processes
+        Parameters
+        ----------
+        media_list : [MSMedia]
+            List of the medias in which the model should be gapfilled
+        targets : [string]
+            Target for each media in media_list
+        thresholds : [double]
+            Minimum objective for each media in media_list
+        binary_check : bool
+            Indicates if the solution should be checked to ensure it is minimal in the number of reactions involved
+        processes : int
+            Number of worker processes to create if no executor is provided
+        executor : concurrent.futures.Executor
+            Executor to run the gapfilling tasks on
+        Returns
+        -------
+        [dict]
+            Gapfilling solution (or None) for each media, in media_list order
+        """
+        # Each worker loads its own copy of the fully built gapfilling problem once
+        with MSWorkerState(self, "gapfill", _gapfill_modelutls) as state:
+            tasks = [
+                (state, media, targets[i], thresholds[i], binary_check)
+                for i, media in enumerate(media_list)
+            ]
+            if executor:
+                outputs = list(executor.map(_run_gapfill_worker, tasks))
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=min(processes, len(media_list))
+                ) as pool:
+                    outputs = list(pool.map(_run_gapfill_worker, tasks))
+        solutions = [solution for solution, _ in outputs]
+        # Saving the sensitivity data of failed media that workers saved on their copies
+        gf_sensitivity = self.mdlutl.get_attributes("gf_sensitivity", {})
+        for i, (_, media_sensitivity) in enumerate(outputs):
+            if media_sensitivity:
+                media_entry = gf_sensitivity.setdefault(media_list[i].id, {})
+                for target, notes in media_sensitivity.items():
+                    media_entry.setdefault(target, {}).update(notes)
+        if gf_sensitivity:
+            self.mdlutl.save_attributes(gf_sensitivity, "gf_sensitivity")
+        # Solutions carry copies of the media, so the caller's objects are restored here
+        for i, solution in enumerate(solutions):
+            if solution:
+                solution["media"] = media_list[i]
+                self.last_solution = solution
+        return solutions
+
     def integrate_gapfill_solution(
         self,solution,cumulative_solution=[],remove_unneeded_reactions=False,check_for_growth=True,gapfilling_mode="Sequential"
     ):
@@ -714,7 +803,7 @@ class MSGapfill:
                 #elif not remove_unneeded_reactions:
                 #    cumulative_solution.append(item)
         logger.info(f"Unneeded: {str(unneeded)}")
-        logger.info(f"Cumulative: {str(cumulative_gapfilling)}")
+        logger.info(f"Cumulative: {str(self.cumulative_gapfilling)}")
         #Checking that the final integrated model grows
         if check_for_growth:
             self.mdlutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(solution["media"])
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import json
+import hashlib
+import weakref
+from collections import OrderedDict
+from cobra import Reaction, Metabolite
+
+logger = logging.getLogger(__name__)
+
+
+class MSGapfillDatabase:
+    """Precompiled gapfilling database for one template and compartment index
+
+    Holds the metabolites and reactions a template contributes to a gapfilling model, with
+    blacklist filtering and directionality already applied and the gapfilling penalties of
+    every reaction precomputed. Databases are built once per (template, index, blacklist) and
+    cached in memory for as long as the template object is alive; if a cache directory is given they are also stored on disk as JSON
+    keyed by a fingerprint of the template content, so other processes and later runs can
+    reuse them:
+
+        database = MSGapfillDatabase.get(template, "0", blacklist, "gapfill_cache")
+    """
+
+    # Databases of each live template, as {(index, blacklist, base blacklist): database}
+    # holding the most recently used cache_size entries
+    cache = weakref.WeakKeyDictionary()
+    cache_size = 16
+
+    def __init__(self, template_id, index, fingerprint, metabolites, reactions):
+        self.template_id = template_id
+        self.index = index
+        self.fingerprint = fingerprint
+        self.metabolites = metabolites
+        self.reactions = reactions
+
+    @staticmethod
+    def template_fingerprint(template, index="0", blacklist=[], base_blacklist={}):
+        """Computes a hash of the template content that affects the gapfilling database"""
+        data = [template.id, str(index), sorted(blacklist), sorted(base_blacklist.items())]
+        for cpd in template.compcompounds:
+            data.append([cpd.id, cpd.compartment, cpd.formula, cpd.charge])
+        for rxn in template.reactions:
+            data.append(
+                [
+                    rxn.id,
+                    rxn.reference_id,
+                    rxn.GapfillDirection,
+                    rxn.lower_bound,
+                    rxn.upper_bound,
+                    rxn.base_cost,
+                    rxn.forward_penalty,
+                    rxn.reverse_penalty,
+                    sorted((met.id, coef) for met, coef in rxn.metabolites.items()),
+                ]
+            )
+        return hashlib.sha1(json.dumps(data, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def build(template, index="0", blacklist=[], base_blacklist={}, fingerprint=None):
+        """Converts all template compounds and reactions for the specified index
+
+        Parameters
+        ----------
+        template : MSTemplate
+            Template used to build the database
+        index : string
+            Compartment index of the non extracellular compartments
+        blacklist : [string]
+            ModelSEED reaction IDs excluded from the database
+        base_blacklist : {string : string}
+            ModelSEED reaction IDs whose directions ("<", ">" or "=") are blocked
+
+        Returns
+        -------
+        MSGapfillDatabase
+        """
+        if fingerprint is None:
+            fingerprint = MSGapfillDatabase.template_fingerprint(
+                template, index, blacklist, base_blacklist
+            )
+        metabolites = []
+        compartment_indecies = {}
+        for template_compound in template.compcompounds:
+            compartment_index = "0" if template_compound.compartment == "e" else index
+            metabolite = template_compound.to_metabolite(compartment_index)
+            compartment_indecies[template_compound.id] = compartment_index
+            metabolites.append(
+                {
+                    "id": metabolite.id,
+                    "formula": metabolite.formula,
+                    "name": metabolite.name,
+                    "charge": metabolite.charge,
+                    "compartment": metabolite.compartment,
+                    "notes": dict(metabolite.notes),
+                    "extracellular": template_compound.compartment == "e",
+                }
+            )
+        blacklist = set(blacklist)
+        reactions = []
+        for template_reaction in template.reactions:
+            if template_reaction.reference_id in blacklist:
+                continue
+            lower_bound = template_reaction.lower_bound
+            upper_bound = template_reaction.upper_bound
+            if template_reaction.GapfillDirection == ">":
+                lower_bound = 0
+            elif template_reaction.GapfillDirection == "<":
+                upper_bound = 0
+            if template_reaction.reference_id in base_blacklist:
+                if base_blacklist[template_reaction.reference_id] in [">", "="]:
+                    upper_bound = 0
+                if base_blacklist[template_reaction.reference_id] in ["<", "="]:
+                    lower_bound = 0
+            reactions.append(
+                {
+                    "id": template_reaction.id + str(index),
+                    "name": template_reaction.name,
+                    "lower_bound": lower_bound,
+                    "upper_bound": upper_bound,
+                    "metabolites": {
+                        met.id + compartment_indecies[met.id]: coef
+                        for met, coef in template_reaction.metabolites.items()
+                    },
+                    "reference_id": template_reaction.reference_id,
+                    "gapfill_direction": template_reaction.GapfillDirection,
+                    "template_lower_bound": template_reaction.lower_bound,
+                    "template_upper_bound": template_reaction.upper_bound,
+                    "forward_penalty": template_reaction.base_cost
+                    + template_reaction.forward_penalty,
+                    "reverse_penalty": template_reaction.base_cost
+                    + template_reaction.reverse_penalty,
+                }
+            )
+        return MSGapfillDatabase(
+            template.id, str(index), fingerprint, metabolites, reactions
+        )
+
+    @staticmethod
+    def get(template, index="0", blacklist=[], cache_dir=None, base_blacklist={}):
+        """Returns the cached database for a template and index, building it if needed
+
+        The in memory cache is keyed by the template object without keeping it alive, so a
+        template that is edited after its database was built should be followed by a call to
+        clear_cache.
+        """
+        index = str(index)
+        key = (index, tuple(sorted(blacklist)), tuple(sorted(base_blacklist.items())))
+        databases = MSGapfillDatabase.cache.setdefault(template, OrderedDict())
+        if key in databases:
+            databases.move_to_end(key)
+            return databases[key]
+        database = None
+        fingerprint = None
+        filename = None
+        if cache_dir:
+            fingerprint = MSGapfillDatabase.template_fingerprint(
+                template, index, blacklist, base_blacklist
+            )
+            filename = os.path.join(
+                cache_dir, f"{template.id}_{index}_{fingerprint[:16]}.json"
+            )
+            if os.path.exists(filename):
+                database = MSGapfillDatabase.load(filename)
+        if database is None:
+            database = MSGapfillDatabase.build(
+                template, index, blacklist, base_blacklist, fingerprint
+            )
+            if filename:
+                os.makedirs(cache_dir, exist_ok=True)
+                database.save(filename)
+        databases[key] = database
+        while len(databases) > MSGapfillDatabase.cache_size:
+            databases.popitem(last=False)
+        return database
+
+    @staticmethod
+    def clear_cache():
+        MSGapfillDatabase.cache = weakref.WeakKeyDictionary()
+
+    def to_dict(self):
+        return {
+            "template_id": self.template_id,
+            "index": self.index,
+            "fingerprint": self.fingerprint,
+            "metabolites": self.metabolites,
+            "reactions": self.reactions,
+        }
+
+    @staticmethod
+    def from_dict(data):
+        return MSGapfillDatabase(
+            data["template_id"],
+            data["index"],
+            data["fingerprint"],
+            data["metabolites"],
+            data["reactions"],
+        )
+
+    def save(self, filename):
+        with open(filename, "w") as fh:
+            json.dump(self.to_dict(), fh)
+
+    @staticmethod
+    def load(filename):
+        with open(filename, "r") as fh:
+            return MSGapfillDatabase.from_dict(json.load(fh))
+
+    def new_metabolites(self, model):
+        """Creates cobra metabolites for every database metabolite missing from model
+
+        Returns
+        -------
+        ([cobra.Metabolite], [cobra.Metabolite])
+            All new metabolites and the new extracellular metabolites needing exchanges
+        """
+        new_metabolites = []
+        new_extracellular = []
+        for data in self.metabolites:
+            if data["id"] not in model.metabolites:
+                metabolite = Metabolite(
+                    data["id"],
+                    data["formula"],
+                    data["name"],
+                    data["charge"],
+                    data["compartment"],
+                )
+                metabolite.notes.update(data["notes"])
+                new_metabolites.append(metabolite)
+                if data["extracellular"]:
+                    new_extracellular.append(metabolite)
+        return new_metabolites, new_extracellular
+
+    def to_reaction(self, data, model):
+        """Creates a cobra reaction for a database reaction using the metabolites in model"""
+        reaction = Reaction(
+            data["id"],
+            name=data["name"],
+            lower_bound=data["lower_bound"],
+            upper_bound=data["upper_bound"],
+        )
+        reaction.add_metabolites(
+            {
+                model.metabolites.get_by_id(met_id): coef
+                for met_id, coef in data["metabolites"].items()
+            }
+        )
+        reaction.annotation["sbo"] = "SBO:0000176"  # biochemical reaction
+        reaction.annotation["seed.reaction"] = data["reference_id"]
+        return reaction
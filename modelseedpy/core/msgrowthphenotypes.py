@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 import pandas as pd
 import logging
+import math
+import os
 import cobra
+from concurrent.futures import ProcessPoolExecutor
 from cobra.core.dictlist import DictList
 from modelseedpy.core.msmedia import MSMedia
 from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
 from modelseedpy.core.msmodelutl import MSModelUtil
 from modelseedpy.core.msgapfill import MSGapfill
+from modelseedpy.core.msphenotyperesults import MSPhenotypeResults
+from modelseedpy.core.msworker import MSWorkerState
 
 logger = logging.getLogger(__name__)
 logger.setLevel(
@@ -15,6 +20,47 @@ logger.setLevel(
 
 zero_threshold = 0.0000001
 
+def _phenotype_modelutls(data):
+    return [data[0]]
+
+
+def _phenotype_gapfill_modelutls(data):
+    # Registering the copies so the gapfilling model keeps its gapfilling packages
+    return [data[0].mdlutl, data[0].gfmodelutl]
+
+
+def _load_range_worker_data(state, start):
+    """Returns the object a worker loaded and the first phenotype whose changes it lacks
+
+    Workers keep their copy across ranges and only replay the model changes of the phenotypes
+    after the last range they ran, reloading the copy if a range starts before that.
+    """
+    if start < state.worker_data().get("end", 0):
+        state.get(reload=True)
+    return state.get(), state.worker_data().get("end", 0)
+
+
+def _run_phenotype_worker(args):
+    """Simulates a range of phenotypes, reusing the worker model if no earlier phenotypes were simulated on it"""
+    state, start, end, options = args
+    (modelutl, phenotypes), replay_start = _load_range_worker_data(state, start)
+    state.worker_data()["end"] = end
+    outputs = phenotypes.simulate_phenotype_range(
+        modelutl, start, end, replay_start=replay_start, **options
+    )
+    return outputs, options["results"]
+
+
+def _run_phenotype_gapfill_worker(args):
+    """Gapfills a range of phenotypes, reusing the worker models if no earlier phenotypes were gapfilled on them"""
+    state, indices, start, end, options = args
+    (msgapfill, phenotypes), replay_start = _load_range_worker_data(state, start)
+    state.worker_data()["end"] = end
+    return phenotypes.gapfill_phenotype_range(
+        msgapfill, indices, start, end, replay_start=replay_start, **options
+    )
+
+
 class MSGrowthPhenotype:
     def __init__(
         self,
@@ -57,6 +103,18 @@ class MSGrowthPhenotype:
                 full_media.merge(self.parent.base_media, overwrite_overlap=False)
         return full_media
 
+    def add_model_changes(self, modelutl, add_missing_exchanges=False):
+        """Makes the persistent changes to the model that simulate makes for this phenotype
+
+        Simulating a phenotype sets the objective and can add exchanges to the model, which
+        remain for the phenotypes simulated after it. Parallel simulations use this to bring a
+        model copy to the state a serial simulation would reach without solving anything.
+        """
+        objstring = modelutl.set_objective_from_phenotype(self, [])
+        if objstring != None and add_missing_exchanges:
+            modelutl.add_missing_exchanges(self.build_media())
+        return objstring
+
     def simulate(
         self,
         model_or_mdlutl,
@@ -67,6 +125,7 @@ class MSGrowthPhenotype:
         ignore_experimental_data=False,
         baseline_objective=0.01,
         flux_coefficients=None,
+        classification_only=False,
     ):
         """Simulates a single phenotype
         Parameters
@@ -83,6 +142,8 @@ class MSGrowthPhenotype:
             Runs pFBA to compute fluxes after initially solving for growth
         ignore_experimental_data : bool
             Indicates if existing growth data in the phenotype should be ignored when computing the class of the simulated phenotype
+        classification_only : bool
+            Only solves for the objective value needed to classify the phenotype, skipping pFBA and reaction counts unless fluxes or reaction lists are saved
         """
         modelutl = model_or_mdlutl
         if not isinstance(model_or_mdlutl, MSModelUtil):
@@ -112,10 +173,7 @@ class MSGrowthPhenotype:
             output["missing_transports"].extend(modelutl.add_missing_exchanges(full_media))
         
         # Getting basline growth
-        if objstring != None and output["baseline_objective"] == None and self.parent:
-            output["baseline_objective"] = self.parent.baseline_objective(modelutl, objstring)
-        if output["baseline_objective"] < 1e-5:
-            output["baseline_objective"] = 0.01
+        output["baseline_objective"] = self.baseline(modelutl, objstring, baseline_objective)
 
         # Building specific media and setting compound exception list
         if self.parent and self.parent.atom_limits and len(self.parent.atom_limits) > 0:
@@ -129,13 +187,15 @@ class MSGrowthPhenotype:
                 self.parent.atom_limits, exception_reactions=reaction_exceptions
             )
 
-        # Applying media
+        # Applying media, changing only the exchanges that differ from the last applied media
         if self.parent:
             modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(
-                full_media, self.parent.base_uptake, self.parent.base_excretion
+                full_media, self.parent.base_uptake, self.parent.base_excretion, delta=True
             )
         else:
-            modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(full_media, 0, 1000)
+            modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(
+                full_media, 0, 1000, delta=True
+            )
 
         with modelutl.model:
             # Applying gene knockouts
@@ -148,9 +208,17 @@ class MSGrowthPhenotype:
             if '1_objc' in modelutl.model.constraints:
                 constraint = modelutl.model.constraints['1_objc']
                 modelutl.model.remove_cons_vars([constraint])
-            solution = modelutl.model.optimize()
-            output["objective_value"] = solution.objective_value
-            if solution.objective_value != None and solution.objective_value > 0:
+            # Saved fluxes and reaction lists, along with the reaction counts, need the full solution
+            if classification_only and not (save_fluxes or save_reaction_list):
+                output["objective_value"] = modelutl.model.slim_optimize(error_value=0)
+                solution = None
+            else:
+                solution = modelutl.model.optimize()
+                output["objective_value"] = solution.objective_value
+                # The objective value left by the solver for an infeasible problem is meaningless
+                if solution.status != "optimal":
+                    output["objective_value"] = 0
+            if solution != None and solution.status == "optimal" and solution.objective_value > 0:
                 if flux_coefficients == None:
                     solution = cobra.flux_analysis.pfba(modelutl.model)
                 else:
@@ -176,23 +244,21 @@ class MSGrowthPhenotype:
                     coefobj.set_linear_coefficients(obj_coef)
                     solution = modelutl.model.optimize()
                     modelutl.pkgmgr.getpkg("ObjConstPkg").clear()
-                if save_reaction_list:
-                    output["reactions"] = []
                 if save_fluxes:
                     output["fluxes"] = solution.fluxes
+                active = solution.fluxes[solution.fluxes.abs() > zero_threshold]
+                output["reaction_count"] = len(active)
+                # Counting active reactions without genes, other than biomass, exchanges and sinks
+                candidates = active.index[~active.index.str[0:3].isin(["bio", "EX_", "DM_"])]
                 output["gapfill_count"] = 0
-                output["reaction_count"] = 0
-                for reaction in modelutl.model.reactions:
-                    if reaction.id in solution.fluxes:
-                        flux = solution.fluxes[reaction.id]
-                        if abs(flux) > zero_threshold:
-                            output["reaction_count"] += 1
-                            if reaction.id[0:3] != "bio" and reaction.id[0:3] != "EX_" and reaction.id[0:3] != "DM_" and len(reaction.genes) == 0:
-                                output["gapfill_count"] += 1
-                            if save_reaction_list and flux > zero_threshold:
-                                output["reactions"].append(">"+reaction.id)
-                            elif save_reaction_list:
-                                output["reactions"].append("<"+reaction.id)
+                for rxn_id in candidates:
+                    if len(modelutl.model.reactions.get_by_id(rxn_id).genes) == 0:
+                        output["gapfill_count"] += 1
+                if save_reaction_list:
+                    output["reactions"] = [
+                        (">" if flux > zero_threshold else "<") + rxn_id
+                        for rxn_id, flux in active.items()
+                    ]
 
         # Determining phenotype class
         if output["objective_value"] != None and output["objective_value"] >= output["baseline_objective"] * multiplier:
@@ -213,12 +279,31 @@ class MSGrowthPhenotype:
                 output["class"] = "CN"
         return output
 
+    def baseline(self, modelutl, objective, baseline_objective=0.01):
+        """Returns the objective value positive growth is measured against in simulate
+        Parameters
+        ----------
+        modelutl : MSModelUtl
+            Model the baseline is computed on when baseline_objective is None
+        objective : string
+            Objective to optimize on the base media
+        baseline_objective : double
+            Objective value to use; None computes it on the base media of the phenotype set
+        """
+        if baseline_objective == None and self.parent:
+            baseline_objective = self.parent.baseline_objective(modelutl, objective)
+        if baseline_objective == None or baseline_objective < 1e-5:
+            baseline_objective = 0.01
+        return baseline_objective
+
     def gapfill_model_for_phenotype(
         self,
         msgapfill,
         test_conditions,
         multiplier=10,
         add_missing_exchanges=False,
+        prefilter=True,
+        baseline_objective=0.01,
     ):
         """Gapfills the model to permit this single phenotype to be positive
         Parameters
@@ -231,10 +316,17 @@ class MSGrowthPhenotype:
             Indicates a multiplier to use for positive growth above the growth on baseline media
         objective : string
             Expression for objective to be activated by gapfilling
+        prefilter : bool
+            Indicates if the gapfilling database should be prefiltered before gapfilling; set to False when it was already filtered for this phenotype (see MSGrowthPhenotypes.gapfill_phenotypes)
+        baseline_objective : double
+            Objective value positive growth is measured against; None computes it on the base media (see baseline)
         """
         # First simulate model without gapfilling to assess ungapfilled growth
         output = self.simulate(
-            msgapfill.mdlutl,multiplier, add_missing_exchanges
+            msgapfill.mdlutl,
+            multiplier,
+            add_missing_exchanges,
+            baseline_objective=baseline_objective,
         )
         if output["objective_value"] >= output["baseline_objective"] * multiplier:
             # No gapfilling needed - original model grows without gapfilling
@@ -251,9 +343,15 @@ class MSGrowthPhenotype:
         gfmodelutl = MSModelUtil.get(msgapfill.gfmodel)
         # Saving the gapfill objective because this will be replaced when the simulation runs
         gfobj = gfmodelutl.model.objective
+        # Clearing the minimum objective constraint of the last gapfilling through its package,
+        # which run_gapfilling rebuilds, rather than letting simulate remove it behind the package
+        gfmodelutl.pkgmgr.getpkg("ObjConstPkg").clear()
         # Running simulate on gapfill model to add missing exchanges and set proper media and uptake limit constraints
         output = self.simulate(
-            gfmodelutl, multiplier=multiplier, add_missing_exchanges=add_missing_exchanges
+            gfmodelutl,
+            multiplier=multiplier,
+            add_missing_exchanges=add_missing_exchanges,
+            baseline_objective=baseline_objective,
         )
         # If the gapfilling model fails to achieve the minimum growth, then no solution exists
         if output["objective_value"] < output["baseline_objective"] * multiplier:
@@ -264,20 +362,29 @@ class MSGrowthPhenotype:
 
         # Running the gapfilling itself
         full_media = self.build_media()
-        with gfmodelutl.model:
-            # Applying gene knockouts
-            for gene in self.gene_ko:
-                if gene in gfmodelutl.model.genes:
-                    geneobj = gfmodelutl.model.genes.get_by_id(gene)
-                    geneobj.knock_out()
-
-            gfresults = self.gapfilling.run_gapfilling(
-                full_media, None, minimum_obj=output["baseline_objective"] * multiplier
+        # Applying gene knockouts through reaction bounds restored afterwards, because gapfilling
+        # rebuilds package constraints that a model context would try to revert
+        knockouts = [gene for gene in self.gene_ko if gene in gfmodelutl.model.genes]
+        original_bounds = {}
+        for gene in knockouts:
+            for rxn in gfmodelutl.model.genes.get_by_id(gene).reactions:
+                if rxn not in original_bounds and not rxn.gpr.eval(knockouts):
+                    original_bounds[rxn] = rxn.bounds
+                    rxn.bounds = (0, 0)
+        try:
+            gfresults = msgapfill.run_gapfilling(
+                full_media,
+                None,
+                minimum_obj=output["baseline_objective"] * multiplier,
+                prefilter=prefilter,
+            )
+        finally:
+            for rxn, bounds in original_bounds.items():
+                rxn.bounds = bounds
+        if gfresults is None:
+            logger.warning(
+                "Gapfilling failed with the specified model, media, and target reaction."
             )
-            if gfresults is None:
-                logger.warning(
-                    "Gapfilling failed with the specified model, media, and target reaction."
-                )
 
         return gfresults
 
@@ -294,6 +401,12 @@ class MSGrowthPhenotypes:
         self.baseline_objective_data = {}
         self.cached_based_growth = {}
 
+    def __getstate__(self):
+        # Cached baseline growth is keyed by model fingerprints, which are only comparable within a process
+        state = self.__dict__.copy()
+        state["cached_based_growth"] = {}
+        return state
+
     @staticmethod
     def from_compound_hash(
         compounds,
@@ -432,35 +545,107 @@ class MSGrowthPhenotypes:
         additions = DictList(keep_phenos)
         self.phenotypes += additions
 
+    def media_switching_order(self):
+        """Orders phenotypes so consecutive phenotypes differ by as few media compounds as possible
+
+        Starting from the phenotype closest to the base media, the next phenotype is always the
+        remaining one whose media differs least from the current one (compounds added, removed
+        or with different bounds).
+
+        Returns
+        -------
+        list<int>
+            Indices of the phenotypes in the order they should be simulated
+        """
+        media_keys = []
+        for pheno in self.phenotypes:
+            media_keys.append(
+                {
+                    cpd.id: (cpd.lower_bound, cpd.upper_bound)
+                    for cpd in pheno.build_media().mediacompounds
+                }
+            )
+        current = {}
+        if self.base_media:
+            current = {
+                cpd.id: (cpd.lower_bound, cpd.upper_bound)
+                for cpd in self.base_media.mediacompounds
+            }
+        remaining = list(range(len(media_keys)))
+        order = []
+        while len(remaining) > 0:
+            best = None
+            best_delta = None
+            for index in remaining:
+                delta = len(set(current.items()).symmetric_difference(media_keys[index].items()))
+                if best_delta is None or delta < best_delta:
+                    best = index
+                    best_delta = delta
+            order.append(best)
+            remaining.remove(best)
+            current = media_keys[best]
+        return order
+
     def baseline_objective(self, model_or_mdlutl, objective):
-        """Simulates all the specified phenotype conditions and saves results
+        """Computes the objective value on the base media, reusing values computed for the same model state
         Parameters
         ----------
         model_or_modelutl : Model | MSModelUtl
             Model to use to run the simulations
+        objective : string
+            Objective to optimize on the base media
+
+        Returns
+        -------
+        float
+            Objective value on the base media with the atom limits of the phenotype set
         """
         # Discerning input is model or mdlutl and setting internal links
         modelutl = model_or_mdlutl
         if not isinstance(model_or_mdlutl, MSModelUtil):
             modelutl = MSModelUtil.get(model_or_mdlutl)
-        # Checking if base growth already computed
-        if modelutl in self.cached_based_growth:
-            if objective in self.cached_based_growth[modelutl]:
-                return self.cached_based_growth[modelutl][objective]
-        else:
-            self.cached_based_growth[modelutl] = {}
-        # Setting objective
-        modelutl.objective = objective
-        # Setting media
-        modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(
-            self.base_media, self.base_uptake, self.base_excretion
-        )
-        # Adding uptake limits
+        # Checking if base growth was already computed for this model state, objective and base media
+        key = self.baseline_key(modelutl, objective)
+        if key in self.cached_based_growth:
+            return self.cached_based_growth[key]
+        # Adding uptake limits, which are rebuilt by every phenotype simulation
         if len(self.atom_limits) > 0:
             modelutl.pkgmgr.getpkg("ElementUptakePkg").build_package(self.atom_limits)
-        # Simulating
-        self.cached_based_growth[modelutl][objective] = modelutl.model.slim_optimize()
-        return self.cached_based_growth[modelutl][objective]
+        # The objective and media of the caller are restored once the baseline is computed
+        with modelutl.model:
+            # Setting objective - simulate passes the string of the objective it already set
+            if str(modelutl.model.objective) != objective:
+                modelutl.model.objective = objective
+            # Setting media
+            modelutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(
+                self.base_media, self.base_uptake, self.base_excretion
+            )
+            # Simulating
+            value = modelutl.model.slim_optimize()
+        # Building the packages can add variables, so the key is stored for the state they leave
+        self.cached_based_growth[key] = value
+        self.cached_based_growth[self.baseline_key(modelutl, objective)] = value
+        return value
+
+    def baseline_key(self, modelutl, objective):
+        """Key of a baseline objective value: the model state apart from exchange bounds, which the base media sets, along with the objective and base media"""
+        media = None
+        if self.base_media:
+            media = (
+                self.base_media.id,
+                tuple(
+                    (cpd.id, cpd.lower_bound, cpd.upper_bound)
+                    for cpd in self.base_media.mediacompounds
+                ),
+            )
+        return (
+            modelutl.model_fingerprint(include_exchange_bounds=False),
+            str(objective),
+            media,
+            self.base_uptake,
+            self.base_excretion,
+            tuple(sorted(self.atom_limits.items())),
+        )
 
     def simulate_phenotypes(
         self,
@@ -474,7 +659,14 @@ class MSGrowthPhenotypes:
         test_conditions=None,
         ignore_experimental_data=False,
         flux_coefficients=None,
-        recall_phenotypes=True
+        recall_phenotypes=True,
+        processes=None,
+        chunk_size=None,
+        executor=None,
+        order_by_media=False,
+        classification_only=False,
+        baseline_objective=0.01,
+        results=None,
     ):
         """Simulates all the specified phenotype conditions and saves results
         Parameters
@@ -487,8 +679,24 @@ class MSGrowthPhenotypes:
             Boolean indicating if exchanges for compounds mentioned explicitly in phenotype media should be added to the model automatically
         save_fluxes : bool
             Indicates if the fluxes should be saved and returned with the results
+        gapfill_negatives : bool
+            Gapfills msgapfill for every negative phenotype (see gapfill_phenotypes)
         ignore_experimental_data : bool
             Indicates if existing growth data in the phenotype set should be ignored when computing the class of a simulated phenotype
+        processes : int
+            Number of worker processes to simulate phenotypes and gapfill negative phenotypes in (see simulate_phenotypes_in_parallel)
+        chunk_size : int
+            Number of consecutive phenotypes simulated by a worker per task
+        executor : concurrent.futures.Executor
+            Existing executor used to simulate phenotypes instead of creating a process pool
+        order_by_media : bool
+            Simulates phenotypes in media_switching_order to minimize media changes; results are still reported in phenotype order
+        classification_only : bool
+            Runs a single optimization per phenotype to classify it, without pFBA or reaction counts unless fluxes or reaction lists are saved
+        baseline_objective : double
+            Objective value positive growth is measured against; None computes it on the base media for each phenotype objective (see baseline_objective)
+        results : MSPhenotypeResults
+            Columnar store the results and fluxes are saved in as each phenotype is simulated; it is returned as "data" in place of a dict of result dicts
         """
         # Discerning input is model or mdlutl and setting internal links
         modelutl = model_or_mdlutl
@@ -512,16 +720,56 @@ class MSGrowthPhenotypes:
         gapfilling_solutions = {}
         totalcount = 0
         datahash = {}
-        for pheno in self.phenotypes:
-            result = pheno.simulate(
-                modelutl,
+        order = None
+        if order_by_media:
+            order = self.media_switching_order()
+        options = {
+            "multiplier": multiplier,
+            "add_missing_exchanges": add_missing_exchanges,
+            "save_fluxes": save_fluxes,
+            "save_reaction_list": save_reaction_list,
+            "ignore_experimental_data": ignore_experimental_data,
+            "flux_coefficients": flux_coefficients,
+            "order": order,
+            "classification_only": classification_only,
+            "baseline_objective": baseline_objective,
+            "results": results,
+        }
+        if processes is not None or executor is not None:
+            outputs = self.simulate_phenotypes_in_parallel(
+                modelutl, processes=processes, chunk_size=chunk_size, executor=executor, **options
+            )
+        else:
+            outputs = self.simulate_phenotype_range(
+                modelutl, 0, len(self.phenotypes), **options
+            )
+        # Results come back in simulation order
+        if order is not None:
+            ordered_outputs = outputs
+            outputs = [None] * len(order)
+            for position, index in enumerate(order):
+                outputs[index] = ordered_outputs[position]
+        # Gapfilling all negative growth conditions against a database filtered once for all of them
+        if gapfill_negatives:
+            negatives = [
+                pheno
+                for i, pheno in enumerate(self.phenotypes)
+                if outputs[i]["class"] in ["N", "FN", "CN"]
+            ]
+            solutions = self.gapfill_phenotypes(
+                msgapfill,
+                negatives,
+                test_conditions,
                 multiplier,
                 add_missing_exchanges,
-                save_fluxes,
-                save_reaction_list=save_reaction_list,
-                ignore_experimental_data=ignore_experimental_data,
-                flux_coefficients=flux_coefficients
+                processes=processes,
+                chunk_size=chunk_size,
+                executor=executor,
+                baseline_objective=baseline_objective,
             )
+            gapfilling_solutions = dict(zip(negatives, solutions))
+        for i, pheno in enumerate(self.phenotypes):
+            result = outputs[i]
             datahash[pheno.id] = result
             data["Class"].append(result["class"])
             data["Phenotype"].append(pheno.id)
@@ -547,13 +795,7 @@ class MSGrowthPhenotypes:
             elif result["class"] == "N":
                 summary["Count"][6] += 1
             # Gapfilling negative growth conditions
-            if gapfill_negatives and result["class"] in ["N", "FN", "CN"]:
-                gapfilling_solutions[pheno] = pheno.gapfill_model_for_phenotype(
-                    msgapfill,
-                    test_conditions,
-                    multiplier,
-                    add_missing_exchanges,
-                )
+            if pheno in gapfilling_solutions:
                 if gapfilling_solutions[pheno] != None:
                     data["Gapfilling score"] = 0
                     list = []
@@ -577,8 +819,284 @@ class MSGrowthPhenotypes:
         sdf = pd.DataFrame(summary)
         df = pd.DataFrame(data)
         self.adjust_phenotype_calls(df)
+        if results is not None:
+            datahash = results
         return {"details": df, "summary": sdf,"data":datahash}
 
+    def simulate_phenotype_range(
+        self,
+        modelutl,
+        start,
+        end,
+        replay_start=0,
+        multiplier=3,
+        add_missing_exchanges=False,
+        save_fluxes=False,
+        save_reaction_list=False,
+        ignore_experimental_data=False,
+        flux_coefficients=None,
+        order=None,
+        classification_only=False,
+        baseline_objective=0.01,
+        results=None,
+    ):
+        """Simulates the phenotypes from start to end after making the model changes of the prior phenotypes
+
+        Only the changes of phenotypes from replay_start on are made, for models that already
+        went through the earlier phenotypes. Positions refer to the list of phenotype indices in
+        order if one is provided. If an MSPhenotypeResults store is given, each result is added
+        to it as soon as it is simulated and the returned results do not hold fluxes.
+        """
+        phenotypes = self.phenotypes
+        if order is not None:
+            phenotypes = [self.phenotypes[index] for index in order]
+        for pheno in phenotypes[replay_start:start]:
+            pheno.add_model_changes(modelutl, add_missing_exchanges)
+        outputs = []
+        for pheno in phenotypes[start:end]:
+            output = pheno.simulate(
+                modelutl,
+                multiplier,
+                add_missing_exchanges,
+                save_fluxes,
+                save_reaction_list=save_reaction_list,
+                ignore_experimental_data=ignore_experimental_data,
+                flux_coefficients=flux_coefficients,
+                classification_only=classification_only,
+                baseline_objective=baseline_objective,
+            )
+            if results is not None:
+                results.add(pheno.id, output)
+                output.pop("fluxes", None)
+            outputs.append(output)
+        return outputs
+
+    def simulate_phenotypes_in_parallel(
+        self,
+        model_or_mdlutl,
+        multiplier=3,
+        add_missing_exchanges=False,
+        save_fluxes=False,
+        save_reaction_list=False,
+        ignore_experimental_data=False,
+        flux_coefficients=None,
+        processes=None,
+        chunk_size=None,
+        executor=None,
+        order=None,
+        classification_only=False,
+        baseline_objective=0.01,
+        results=None,
+    ):
+        """Simulates consecutive ranges of phenotypes in worker processes and returns the results in order
+
+        Each worker unpickles its own copy of the model and replays the model changes made by
+        the phenotypes before each range it simulates, so each phenotype is simulated on the
+        same model a serial run would use. The model changes of all phenotypes are then made to the input model,
+        leaving it with the exchanges and objective of a serial run.
+
+        Parameters
+        ----------
+        model_or_mdlutl : Model | MSModelUtl
+            Model to use to run the simulations
+        processes : int
+            Number of worker processes to create when no executor is provided
+        chunk_size : int
+            Number of consecutive phenotypes per task (defaults to one range per process)
+        executor : concurrent.futures.Executor
+            Existing executor to submit the phenotype ranges to
+        order : list<int>
+            Indices of the phenotypes in the order they should be simulated
+        results : MSPhenotypeResults
+            Store the results of every range are added to; the returned results then hold no fluxes
+
+        Returns
+        -------
+        list<dict>
+            Simulation output of every phenotype, in simulation order
+        """
+        modelutl = model_or_mdlutl
+        if not isinstance(model_or_mdlutl, MSModelUtil):
+            modelutl = MSModelUtil.get(model_or_mdlutl)
+        count = len(self.phenotypes)
+        if chunk_size is None:
+            chunk_size = math.ceil(count / (processes or os.cpu_count() or 1))
+        chunk_size = max(1, chunk_size)
+        options = {
+            "multiplier": multiplier,
+            "add_missing_exchanges": add_missing_exchanges,
+            "save_fluxes": save_fluxes,
+            "save_reaction_list": save_reaction_list,
+            "ignore_experimental_data": ignore_experimental_data,
+            "flux_coefficients": flux_coefficients,
+            "order": order,
+            "classification_only": classification_only,
+            "baseline_objective": baseline_objective,
+        }
+        ranges = [
+            (start, min(start + chunk_size, count))
+            for start in range(0, count, chunk_size)
+        ]
+        # Each range fills its own store, which is merged into results in simulation order
+        range_options = [
+            dict(
+                options,
+                results=None if results is None else MSPhenotypeResults(sparse=results.sparse),
+            )
+            for _ in ranges
+        ]
+        with MSWorkerState(
+            (modelutl, self), "phenotypes", _phenotype_modelutls
+        ) as state:
+            args = [
+                (state, start, end, range_options[i])
+                for i, (start, end) in enumerate(ranges)
+            ]
+            if executor is not None:
+                chunks = list(executor.map(_run_phenotype_worker, args))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    chunks = list(pool.map(_run_phenotype_worker, args))
+        if results is not None:
+            for _, chunk_results in chunks:
+                results.extend(chunk_results)
+        phenotypes = self.phenotypes
+        if order is not None:
+            phenotypes = [self.phenotypes[index] for index in order]
+        for pheno in phenotypes:
+            pheno.add_model_changes(modelutl, add_missing_exchanges)
+        return [result for chunk, _ in chunks for result in chunk]
+
+    def gapfill_phenotypes(
+        self,
+        msgapfill,
+        phenotypes=None,
+        test_conditions=None,
+        multiplier=3,
+        add_missing_exchanges=False,
+        prefilter=True,
+        processes=None,
+        chunk_size=None,
+        executor=None,
+        baseline_objective=0.01,
+    ):
+        """Gapfills the model for each of a batch of phenotypes, filtering the gapfilling database only once
+        Parameters
+        ----------
+        msgapfill : MSGapfill
+            Fully configured gapfilling object with a default target
+        phenotypes : list<MSGrowthPhenotype>
+            Phenotypes to gapfill (defaults to all phenotypes in the set)
+        multiplier : double
+            Indicates a multiplier to use for positive growth above the growth on baseline media
+        add_missing_exchanges : bool
+            Boolean indicating if exchanges for compounds mentioned explicitly in phenotype media should be added to the model automatically
+        prefilter : bool
+            Indicates if the gapfilling database should be filtered with the growth conditions of all phenotypes before gapfilling
+        processes : int
+            Number of worker processes to gapfill phenotypes in
+        chunk_size : int
+            Number of consecutive phenotypes gapfilled by a worker per task (defaults to one range per process)
+        executor : concurrent.futures.Executor
+            Existing executor used to gapfill phenotypes instead of creating a process pool
+        baseline_objective : double
+            Objective value positive growth is measured against; None computes it on the base media (see MSGrowthPhenotype.baseline)
+
+        Returns
+        -------
+        list<dict>
+            Gapfilling solution (or None) of each phenotype, in the format of gapfill_model_for_phenotype
+        """
+        if phenotypes is None:
+            phenotypes = self.phenotypes
+        indices = [self.phenotypes.index(pheno) for pheno in phenotypes]
+        if len(indices) == 0:
+            return []
+        if prefilter:
+            # Phenotypes are gapfilled to grow above the same minimum objective as in gapfill_model_for_phenotype
+            msgapfill.prefilter(
+                test_conditions,
+                growth_conditions=[
+                    {
+                        "media": pheno.build_media(),
+                        "is_max_threshold": False,
+                        "threshold": pheno.baseline(
+                            msgapfill.gfmodelutl,
+                            msgapfill.default_target,
+                            baseline_objective,
+                        )
+                        * multiplier,
+                        "objective": msgapfill.default_target,
+                    }
+                    for pheno in phenotypes
+                ],
+            )
+        options = {
+            "test_conditions": test_conditions,
+            "multiplier": multiplier,
+            "add_missing_exchanges": add_missing_exchanges,
+            "baseline_objective": baseline_objective,
+        }
+        if processes is None and executor is None:
+            return self.gapfill_phenotype_range(
+                msgapfill, indices, 0, len(indices), **options
+            )
+        count = len(indices)
+        if chunk_size is None:
+            chunk_size = math.ceil(count / (processes or os.cpu_count() or 1))
+        chunk_size = max(1, chunk_size)
+        ranges = [
+            (start, min(start + chunk_size, count))
+            for start in range(0, count, chunk_size)
+        ]
+        with MSWorkerState(
+            (msgapfill, self), "phenotype_gapfill", _phenotype_gapfill_modelutls
+        ) as state:
+            args = [(state, indices, start, end, options) for start, end in ranges]
+            if executor is not None:
+                chunks = list(executor.map(_run_phenotype_gapfill_worker, args))
+            else:
+                with ProcessPoolExecutor(max_workers=processes) as pool:
+                    chunks = list(pool.map(_run_phenotype_gapfill_worker, args))
+        # Leaving the input models with the objectives and exchanges of a serial run
+        for pheno in phenotypes:
+            pheno.add_model_changes(msgapfill.mdlutl, add_missing_exchanges)
+            pheno.add_model_changes(msgapfill.gfmodelutl, add_missing_exchanges)
+        return [solution for chunk in chunks for solution in chunk]
+
+    def gapfill_phenotype_range(
+        self,
+        msgapfill,
+        indices,
+        start,
+        end,
+        replay_start=0,
+        test_conditions=None,
+        multiplier=3,
+        add_missing_exchanges=False,
+        baseline_objective=0.01,
+    ):
+        """Gapfills the phenotypes at positions start to end of indices on an already filtered database
+
+        The model changes of the phenotypes from replay_start to start are made first, so a
+        model copy reaches the state a serial run would reach before gapfilling the range.
+        """
+        phenotypes = [self.phenotypes[index] for index in indices]
+        for pheno in phenotypes[replay_start:start]:
+            pheno.add_model_changes(msgapfill.mdlutl, add_missing_exchanges)
+            pheno.add_model_changes(msgapfill.gfmodelutl, add_missing_exchanges)
+        return [
+            pheno.gapfill_model_for_phenotype(
+                msgapfill,
+                test_conditions,
+                multiplier,
+                add_missing_exchanges,
+                prefilter=False,
+                baseline_objective=baseline_objective,
+            )
+            for pheno in phenotypes[start:end]
+        ]
+
     def adjust_phenotype_calls(self,data,baseline_objective=0.01):
         lowest = data["Simulated objective"].min()
         if baseline_objective < lowest:
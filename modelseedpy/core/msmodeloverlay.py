@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import logging
+from optlang.symbolics import Zero
+from modelseedpy.core.msmodelutl import MSModelUtil
+
+logger = logging.getLogger(__name__)
+
+
+class MSModelOverlay:
+    """Copy-on-write view of a model that records bound, objective and knockout changes
+
+    The overlay never copies the underlying model or its solver problem. Changes are stored
+    as deltas and only written into the shared model while the overlay is applied, so many
+    overlays (e.g. ensemble members or phenotype conditions) can share one LP:
+
+        with overlay:
+            objective = overlay.model.slim_optimize()
+
+    Knockouts take precedence over recorded bounds, so media applied after a knockout
+    cannot reopen the knocked out reaction.
+    """
+
+    def __init__(self, model_or_mdlutl, id=None):
+        if isinstance(model_or_mdlutl, MSModelUtil):
+            self.model = model_or_mdlutl.model
+            self.mdlutl = model_or_mdlutl
+        else:
+            self.model = model_or_mdlutl
+            self.mdlutl = MSModelUtil.get(model_or_mdlutl)
+        self.id = id
+        self.bounds = {}
+        self.knockouts = set()
+        self.objective = None
+        self.maximize = True
+        self.reaction_genes = {}
+        self.media = None
+        self.applied = 0
+        self.original_bounds = None
+        self.original_objective = None
+        self.original_direction = None
+
+    def set_bounds(self, rxn_id, lower_bound, upper_bound):
+        self.bounds[rxn_id] = (lower_bound, upper_bound)
+
+    def get_bounds(self, rxn_id):
+        if rxn_id in self.knockouts:
+            return (0, 0)
+        if rxn_id in self.bounds:
+            return self.bounds[rxn_id]
+        return self.model.reactions.get_by_id(rxn_id).bounds
+
+    def knock_out(self, rxn_ids):
+        for rxn_id in rxn_ids:
+            if rxn_id in self.model.reactions:
+                self.knockouts.add(rxn_id)
+            else:
+                logger.warning(f"KO reaction {rxn_id} not found in model")
+
+    def knock_out_genes(self, gene_ids):
+        """Knocks out every reaction whose gene reaction rule is no longer satisfied
+
+        Reactions listed in reaction_genes use that gene list (joined by "or") in place of
+        the gene reaction rule stored in the model.
+        """
+        knockouts = set()
+        for gene_id in gene_ids:
+            if gene_id in self.model.genes:
+                knockouts.add(gene_id)
+            else:
+                logger.warning(f"KO gene {gene_id} not found in model")
+        affected = set()
+        for gene_id in knockouts:
+            for rxn in self.model.genes.get_by_id(gene_id).reactions:
+                affected.add(rxn)
+        for rxn in affected:
+            if rxn.id in self.reaction_genes:
+                genes = self.reaction_genes[rxn.id]
+                functional = len(genes) == 0 or any(
+                    gene not in knockouts for gene in genes
+                )
+            else:
+                functional = rxn.gpr.eval(knockouts)
+            if not functional:
+                self.knockouts.add(rxn.id)
+
+    def set_objective(self, objective_reactions, maximize=True):
+        """Records an objective as a {reaction ID: coefficient} dictionary"""
+        self.objective = dict(objective_reactions)
+        self.maximize = maximize
+
+    def set_media(self, media, default_uptake=None, default_excretion=None):
+        """Records only the exchange bounds that the media changes relative to the base model"""
+        if default_uptake is None:
+            default_uptake = 0
+            if media and media.name == "Complete":
+                default_uptake = 100
+        if default_excretion is None:
+            default_excretion = 100
+        media_bounds = self.mdlutl.pkgmgr.getpkg("KBaseMediaPkg").media_bounds(
+            media, default_uptake, default_excretion
+        )
+        for rxn_id, bounds in media_bounds.items():
+            if self.model.reactions.get_by_id(rxn_id).bounds != bounds:
+                self.bounds[rxn_id] = bounds
+            elif rxn_id in self.bounds:
+                del self.bounds[rxn_id]
+        self.media = media
+
+    def apply(self):
+        """Writes the recorded deltas into the shared model, saving what they replace"""
+        self.applied += 1
+        if self.applied > 1:
+            return
+        self.original_bounds = {}
+        for rxn_id in set(self.bounds) | self.knockouts:
+            rxn = self.model.reactions.get_by_id(rxn_id)
+            self.original_bounds[rxn_id] = rxn.bounds
+            rxn.bounds = self.get_bounds(rxn_id)
+        if self.objective is not None:
+            self.original_objective = self.model.objective
+            self.original_direction = self.model.objective.direction
+            obj = self.model.problem.Objective(
+                Zero, direction="max" if self.maximize else "min"
+            )
+            self.model.objective = obj
+            objcoef = {}
+            for rxn_id, coef in self.objective.items():
+                if rxn_id in self.model.reactions:
+                    rxn = self.model.reactions.get_by_id(rxn_id)
+                    objcoef[rxn.forward_variable] = coef
+                    objcoef[rxn.reverse_variable] = -1 * coef
+                else:
+                    logger.warning(f"Objective reaction {rxn_id} not found in model")
+            obj.set_linear_coefficients(objcoef)
+
+    def revert(self):
+        """Restores the bounds and objective the overlay replaced"""
+        if self.applied == 0:
+            return
+        self.applied -= 1
+        if self.applied > 0:
+            return
+        for rxn_id, bounds in self.original_bounds.items():
+            self.model.reactions.get_by_id(rxn_id).bounds = bounds
+        self.original_bounds = None
+        if self.original_objective is not None:
+            self.model.objective = self.original_objective
+            self.model.objective.direction = self.original_direction
+            self.original_objective = None
+
+    def __enter__(self):
+        self.apply()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.revert()
+
+    def slim_optimize(self):
+        with self:
+            return self.model.slim_optimize()
+
+    def optimize(self):
+        with self:
+            return self.model.optimize()
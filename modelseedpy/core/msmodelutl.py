@@ -4,13 +4,19 @@ import re
 import time
 import json
 import sys
+from copy import copy, deepcopy
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pd
 import cobra
 from cobra import Model, Reaction, Metabolite
+from cobra.core import Group
+from cobra.util.solver import linear_reaction_coefficients
 from optlang.symbolics import Zero
 from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
 from modelseedpy.biochem.modelseed_biochem import ModelSEEDBiochem
 from modelseedpy.core.fbahelper import FBAHelper
+from modelseedpy.core.msworker import MSWorkerState
 from multiprocessing import Value
 
 # from builtins import None
@@ -20,6 +26,30 @@ logger.setLevel(
     logging.INFO
 )  # When debugging - set this to INFO then change needed messages below from DEBUG to INFO
 
+def _run_expansion_worker(args):
+    """Runs the expansion test for one condition on the worker model with the given knockouts"""
+    state, reaction_list, condition, knockouts, options = args
+    model = state.get()
+    with model:
+        MSModelUtil.knockout_reaction_list(
+            [
+                [model.reactions.get_by_id(rxn_id), direction]
+                for rxn_id, direction in knockouts
+            ]
+        )
+        mdlutl = MSModelUtil(model)
+        tested_list = [
+            [model.reactions.get_by_id(rxn_id), direction]
+            for rxn_id, direction in reaction_list
+        ]
+        filtered = mdlutl.reaction_expansion_test(tested_list, [condition], **options)
+    if filtered is not None:
+        filtered = [[item[0].id] + item[1:] for item in filtered]
+    # Breaking reactions kept in the model are dropped from the tested list
+    remaining = {(item[0].id, item[1]) for item in tested_list}
+    retained = [item for item in reaction_list if tuple(item) not in remaining]
+    return filtered, mdlutl.test_stats, retained
+
 
 class MSModelUtil:
     mdlutls = {}
@@ -98,6 +128,171 @@ class MSModelUtil:
         else:
             return None
 
+    @staticmethod
+    def clone(model_or_mdlutl, share_data=False):
+        """Clones a model without serializing it through JSON
+
+        Parameters
+        ----------
+        model_or_mdlutl : cobra.Model or MSModelUtil
+            Model to be cloned
+        share_data : bool, default False
+            If True, annotation and notes dictionaries and gene reaction rules of metabolites,
+            reactions and genes are shared by reference with the source model instead of being copied
+
+        Returns
+        -------
+        cobra.Model
+            New model with the same reactions, metabolites, genes, groups, objective and
+            computed_attributes. Like the JSON round trip it replaces, the solver problem is
+            rebuilt from the reactions alone, so package variables and constraints are not copied.
+
+        Raises
+        ------
+        """
+        if isinstance(model_or_mdlutl, MSModelUtil):
+            model_or_mdlutl = model_or_mdlutl.model
+        source = model_or_mdlutl
+        copy_data = (lambda value: value) if share_data else MSModelUtil._copy_data
+        new = source.__class__()
+        do_not_copy = {
+            "notes",
+            "_annotation",
+            "genes",
+            "reactions",
+            "metabolites",
+            "groups",
+            "_compartments",
+            "_contexts",
+            "_solver",
+            "computed_attributes",
+        }
+        for attr, value in source.__dict__.items():
+            if attr not in do_not_copy:
+                new.__dict__[attr] = value
+        new.notes = deepcopy(source.notes)
+        new.annotation = deepcopy(source.annotation)
+        new._compartments = dict(source._compartments)
+        if getattr(source, "computed_attributes", None) is not None:
+            new.computed_attributes = deepcopy(source.computed_attributes)
+        # Copying metabolites, genes and reactions directly from their attribute dictionaries
+        met_hash = {}
+        for met in source.metabolites:
+            new_met = met.__class__()
+            for attr, value in met.__dict__.items():
+                if attr not in ("_model", "_reaction"):
+                    new_met.__dict__[attr] = value
+            new_met.notes = copy_data(met.notes)
+            new_met.annotation = copy_data(met.annotation)
+            new_met._model = new
+            met_hash[met.id] = new_met
+        new.metabolites.extend(met_hash.values())
+        new_genes = []
+        for gene in source.genes:
+            new_gene = gene.__class__(None)
+            for attr, value in gene.__dict__.items():
+                if attr not in ("_model", "_reaction"):
+                    new_gene.__dict__[attr] = value
+            new_gene.notes = copy_data(gene.notes)
+            new_gene.annotation = copy_data(gene.annotation)
+            new_gene._model = new
+            new_genes.append(new_gene)
+        new.genes.extend(new_genes)
+        new_reactions = []
+        for rxn in source.reactions:
+            new_rxn = rxn.__class__()
+            for attr, value in rxn.__dict__.items():
+                if attr not in ("_model", "_metabolites", "_genes"):
+                    new_rxn.__dict__[attr] = value
+            if not share_data:
+                new_rxn._gpr = copy(rxn._gpr)
+            new_rxn.notes = copy_data(rxn.notes)
+            new_rxn.annotation = copy_data(rxn.annotation)
+            new_rxn._model = new
+            for met, coef in rxn._metabolites.items():
+                new_met = met_hash[met.id]
+                new_rxn._metabolites[new_met] = coef
+                new_met._reaction.add(new_rxn)
+            new_rxn.update_genes_from_gpr()
+            new_reactions.append(new_rxn)
+        new.reactions.extend(new_reactions)
+        for group in source.groups:
+            new_group = group.__class__(group.id, name=group.name, kind=group.kind)
+            new_group.notes = copy_data(group.notes)
+            new_group.annotation = copy_data(group.annotation)
+            new.groups.append(new_group)
+        for group in source.groups:
+            members = []
+            for member in group.members:
+                if isinstance(member, Reaction):
+                    members.append(new.reactions.get_by_id(member.id))
+                elif isinstance(member, Metabolite):
+                    members.append(new.metabolites.get_by_id(member.id))
+                elif isinstance(member, Group):
+                    members.append(new.groups.get_by_id(member.id))
+                else:
+                    members.append(new.genes.get_by_id(member.id))
+            new.groups.get_by_id(group.id).add_members(members)
+        # Building the solver problem in bulk rather than one reaction at a time
+        new._solver = source.problem.Model()
+        new.tolerance = source.tolerance
+        constraints = {}
+        for met in new.metabolites:
+            constraints[met.id] = source.problem.Constraint(
+                Zero, name=met.id, lb=met._bound, ub=met._bound
+            )
+        variables = []
+        for rxn in new.reactions:
+            variables.append(source.problem.Variable(rxn.id))
+            variables.append(source.problem.Variable(rxn.reverse_id))
+        new.add_cons_vars(variables + list(constraints.values()))
+        new.solver.update()
+        constraint_terms = {}
+        for rxn in new.reactions:
+            rxn.update_variable_bounds()
+            forward = rxn.forward_variable
+            reverse = rxn.reverse_variable
+            for met, coef in rxn._metabolites.items():
+                terms = constraint_terms.setdefault(met.id, {})
+                terms[forward] = coef
+                terms[reverse] = -coef
+        for met_id, terms in constraint_terms.items():
+            constraints[met_id].set_linear_coefficients(terms)
+        obj_coef = {}
+        for rxn, coef in linear_reaction_coefficients(source).items():
+            new_rxn = new.reactions.get_by_id(rxn.id)
+            obj_coef[new_rxn.forward_variable] = coef
+            obj_coef[new_rxn.reverse_variable] = -coef
+        new.objective = source.problem.Objective(
+            Zero, direction=source.objective.direction
+        )
+        new.objective.set_linear_coefficients(obj_coef)
+        return new
+
+    @staticmethod
+    def _copy_data(data):
+        # Annotations and notes are nested dicts and lists of strings, which copy much faster than deepcopy
+        if isinstance(data, dict):
+            return {key: MSModelUtil._copy_data(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [MSModelUtil._copy_data(value) for value in data]
+        if isinstance(data, (str, int, float, bool)) or data is None:
+            return data
+        return deepcopy(data)
+
+    @staticmethod
+    def member_signature(members):
+        """Returns a cheap signature of a model DictList that changes when members are added or removed
+
+        Cobra appends added members and removing members shortens the list, so the length or the
+        last member change with every addition or removal. The only replacements missed are
+        those adding the previous last member back last, like removing A and L then adding B and
+        L. Edits that keep the same members, like renaming them, do not change the signature.
+        """
+        if len(members) == 0:
+            return (0, None)
+        return (len(members), members[-1])
+
     @staticmethod
     def from_cobrapy_json(filename):
         model = cobra.io.load_json_model(filename)
@@ -127,6 +322,11 @@ class MSModelUtil:
         self.gfutl = None
         self.metabolite_hash = None
         self.search_metabolite_hash = None
+        self.metabolite_names = None
+        self.metabolite_signature = None
+        self.exchange_reactions = None
+        self.exchange_reaction_hash = None
+        self.exchange_reaction_signature = None
         self.test_objective = None
         self.reaction_scores = None
         self.score = None
@@ -134,6 +334,13 @@ class MSModelUtil:
         self.integrated_gapfillings = []
         self.attributes = {}
         self.atp_tests = None
+        self.applied_condition = None
+        self.test_stats = {
+            "solves": 0,
+            "solve_time": 0,
+            "conditions_applied": 0,
+            "conditions_skipped": 0,
+        }
         if hasattr(self.model, "computed_attributes"):
             if self.model.computed_attributes:
                 self.attributes = self.model.computed_attributes
@@ -233,6 +440,132 @@ class MSModelUtil:
         """
         self.reaction_scores = {}
 
+    def model_fingerprint(self, include_exchange_bounds=True):
+        """Returns a hash of the reactions and reaction bounds in the model
+
+        The fingerprint changes when reactions are added or removed, when reaction bounds change
+        (including gene knockouts and integrated gapfilling) and when packages add or remove
+        variables or constraints. It is only comparable within one process.
+
+        Parameters
+        ----------
+        include_exchange_bounds : bool
+            Includes the bounds of exchange reactions, which are set by every media application
+        """
+        return hash(
+            (
+                tuple(
+                    (rxn.id, rxn.lower_bound, rxn.upper_bound)
+                    if include_exchange_bounds or rxn.id[:3] != "EX_"
+                    else rxn.id
+                    for rxn in self.model.reactions
+                ),
+                len(self.model.variables),
+                len(self.model.constraints),
+            )
+        )
+
+    def bound_snapshot(self, reactions=None):
+        """Saves reaction bounds as numpy arrays aligned to the order of the reactions
+
+        Parameters
+        ----------
+        reactions : list<obj reaction>
+            Reactions to include in the snapshot (default: all reactions in the model)
+
+        Returns
+        -------
+        dict
+            Snapshot with the "reactions" list, an "index" from reaction ID to array position
+            and the "lower_bounds" and "upper_bounds" arrays
+        """
+        if reactions is None:
+            reactions = self.model.reactions
+        reactions = list(reactions)
+        return {
+            "reactions": reactions,
+            "index": {rxn.id: i for i, rxn in enumerate(reactions)},
+            "lower_bounds": np.fromiter(
+                (rxn.lower_bound for rxn in reactions),
+                dtype=float,
+                count=len(reactions),
+            ),
+            "upper_bounds": np.fromiter(
+                (rxn.upper_bound for rxn in reactions),
+                dtype=float,
+                count=len(reactions),
+            ),
+        }
+
+    def apply_bound_snapshot(
+        self, snapshot, lower_bounds=None, upper_bounds=None, positions=None
+    ):
+        """Sets the bounds of snapshot reactions, updating only reactions whose bounds change
+
+        The new bounds are compared with the current bounds as arrays, but the changed reactions
+        are then set one at a time in a Python loop over rxn.bounds, not in one bulk solver
+        update. Going through the reaction setter keeps the changes reverted with any
+        "with model" block they are made in.
+
+        Parameters
+        ----------
+        snapshot : dict
+            Snapshot returned by bound_snapshot
+        lower_bounds, upper_bounds : numpy.ndarray
+            Bounds aligned to the snapshot reactions (default: the bounds saved in the snapshot)
+        positions : list<int> | numpy.ndarray
+            Snapshot positions to apply (default: all reactions in the snapshot)
+
+        Returns
+        -------
+        int
+            Number of reactions whose bounds were changed
+
+        Raises
+        ------
+        ValueError
+            If a lower bound is higher than its upper bound
+        """
+        if lower_bounds is None:
+            lower_bounds = snapshot["lower_bounds"]
+        if upper_bounds is None:
+            upper_bounds = snapshot["upper_bounds"]
+        if positions is None:
+            positions = np.arange(len(snapshot["reactions"]))
+        positions = np.asarray(positions, dtype=np.int64)
+        if len(positions) == 0:
+            return 0
+        reactions = snapshot["reactions"]
+        lower = np.asarray(lower_bounds, dtype=float)[positions]
+        upper = np.asarray(upper_bounds, dtype=float)[positions]
+        invalid = np.flatnonzero(lower > upper)
+        if len(invalid) > 0:
+            rxn = reactions[positions[invalid[0]]]
+            raise ValueError(
+                f"The lower bound must be less than or equal to the upper bound "
+                f"({lower[invalid[0]]} <= {upper[invalid[0]]}) for {rxn.id}"
+            )
+        current_lower = np.fromiter(
+            (reactions[i].lower_bound for i in positions),
+            dtype=float,
+            count=len(positions),
+        )
+        current_upper = np.fromiter(
+            (reactions[i].upper_bound for i in positions),
+            dtype=float,
+            count=len(positions),
+        )
+        changed = np.flatnonzero((current_lower != lower) | (current_upper != upper))
+        count = 0
+        for i in changed:
+            rxn = reactions[positions[i]]
+            # Reactions removed from the model since the snapshot are skipped
+            if rxn.model is None:
+                continue
+            rxn.bounds = (lower[i].item(), upper[i].item())
+            count += 1
+        return count
+
     def printlp(self, lpfilename="debug.lp"):
         with open(lpfilename, "w") as out:
             out.write(str(self.model.solver))
@@ -240,19 +573,62 @@ class MSModelUtil:
     def build_metabolite_hash(self):
         self.metabolite_hash = {}
         self.search_metabolite_hash = {}
+        self.metabolite_names = {}
         for met in self.model.metabolites:
-            if len(met.id.split("_")) == 2:
-                self.add_name_to_metabolite_hash(met.id.split("_")[0],met)
-            self.add_name_to_metabolite_hash(met.id, met)
-            self.add_name_to_metabolite_hash(met.name, met)
-            for anno in met.annotation:
-                if isinstance(met.annotation[anno], list):
-                    for item in met.annotation[anno]:
-                        self.add_name_to_metabolite_hash(item, met)
-                else:
-                    self.add_name_to_metabolite_hash(met.annotation[anno], met)
+            self.add_metabolite_to_hash(met)
+        self.metabolite_signature = MSModelUtil.member_signature(self.model.metabolites)
+
+    def update_metabolite_hash(self):
+        """Brings the metabolite hash up to date with the metabolites in the model
+
+        Metabolites added to or removed from the model since the hash was built are indexed or
+        dropped incrementally. The model is only scanned when its member_signature changed, so
+        the check is constant time. Call build_metabolite_hash after renaming or re-annotating
+        metabolites.
+        """
+        if self.metabolite_hash is None:
+            self.build_metabolite_hash()
+            return
+        signature = MSModelUtil.member_signature(self.model.metabolites)
+        if self.metabolite_signature == signature:
+            return
+        current = set(self.model.metabolites)
+        for met in [met for met in self.metabolite_names if met not in current]:
+            self.remove_metabolite_from_hash(met)
+        for met in self.model.metabolites:
+            if met not in self.metabolite_names:
+                self.add_metabolite_to_hash(met)
+        self.metabolite_signature = signature
+
+    def add_metabolite_to_hash(self, met):
+        self.metabolite_names[met] = []
+        if len(met.id.split("_")) == 2:
+            self.add_name_to_metabolite_hash(met.id.split("_")[0],met)
+        self.add_name_to_metabolite_hash(met.id, met)
+        self.add_name_to_metabolite_hash(met.name, met)
+        for anno in met.annotation:
+            if isinstance(met.annotation[anno], list):
+                for item in met.annotation[anno]:
+                    self.add_name_to_metabolite_hash(item, met)
+            else:
+                self.add_name_to_metabolite_hash(met.annotation[anno], met)
+
+    def remove_metabolite_from_hash(self, met):
+        for name in self.metabolite_names.pop(met):
+            for name_hash, key in [
+                (self.metabolite_hash, name),
+                (self.search_metabolite_hash, MSModelUtil.search_name(name)),
+            ]:
+                if key in name_hash and met in name_hash[key]:
+                    name_hash[key].remove(met)
+                    if len(name_hash[key]) == 0:
+                        del name_hash[key]
 
     def add_name_to_metabolite_hash(self, name, met):
+        if self.metabolite_names is not None and met in self.metabolite_names:
+            if name in self.metabolite_names[met]:
+                return
+            self.metabolite_names[met].append(name)
         if name not in self.metabolite_hash:
             self.metabolite_hash[name] = []
         if met not in self.metabolite_hash[name]:
@@ -264,8 +640,7 @@ class MSModelUtil:
             self.search_metabolite_hash[sname].append(met)
 
     def find_met(self, name, compartment=None):
-        if self.metabolite_hash == None:
-            self.build_metabolite_hash()
+        self.update_metabolite_hash()
         if name in self.metabolite_hash:
             if not compartment:
                 return self.metabolite_hash[name]
@@ -312,12 +687,30 @@ class MSModelUtil:
                 output[msid].append(cpd)
         return output
 
-    def exchange_list(self):
-        exchange_reactions = []
+    def update_exchange_index(self):
+        """Rescans the model for exchange reactions if reactions were added or removed since the last scan
+
+        Changes are detected through the member_signature of the reactions, so the check is
+        constant time.
+        """
+        signature = MSModelUtil.member_signature(self.model.reactions)
+        if self.exchange_reaction_signature == signature:
+            return
+        self.exchange_reactions = []
+        self.exchange_reaction_hash = {}
         for reaction in self.model.reactions:
             if reaction.id[:3] == "EX_":
-                exchange_reactions.append(reaction)
-        return exchange_reactions
+                self.exchange_reactions.append(reaction)
+                for met in reaction.metabolites:
+                    if reaction.metabolites[met] == -1:
+                        self.exchange_reaction_hash[met] = reaction
+                    else:
+                        logger.warn("Nonstandard exchange reaction ignored:" + reaction.id)
+        self.exchange_reaction_signature = signature
+
+    def exchange_list(self):
+        self.update_exchange_index()
+        return list(self.exchange_reactions)
 
     def nonexchange_reaction_count(self):
         count = 0
@@ -444,21 +837,13 @@ class MSModelUtil:
         return transport
     
     def exchange_hash(self):
-        exchange_reactions = {}
-        exlist = self.exchange_list()
-        for reaction in exlist:
-            for met in reaction.metabolites:
-                if reaction.metabolites[met] == -1:
-                    exchange_reactions[met] = reaction
-                else:
-                    logger.warn("Nonstandard exchange reaction ignored:" + reaction.id)
-        return exchange_reactions
+        self.update_exchange_index()
+        return dict(self.exchange_reaction_hash)
     
     def add_missing_exchanges(self, media):
         output = []
         exchange_hash = self.exchange_hash()
         exchange_list = []
-        self.build_metabolite_hash()
         for mediacpd in media.mediacompounds:
             mets = self.find_met(mediacpd.id)
             if len(mets) > 0:
@@ -825,7 +1210,8 @@ class MSModelUtil:
                     rxnobj.lower_bound = 0
                 #Computing the objective value
                 objective = self.model.slim_optimize()
-                if objective < thresholds[i]:
+                #An infeasible knockout returns nan, which also means the reaction is needed
+                if not objective >= thresholds[i]:
                     needed = True
                     logger.info(
                         medias[i].id + "/" + target + ":" +rxn_id
@@ -977,12 +1363,78 @@ class MSModelUtil:
             pkgmgr = self.pkgmgr
         else:
             pkgmgr = MSPackageManager.get_pkg_mgr(model)
+        # Skipping the rebuild if the model still holds exactly what this condition last set
+        if self.applied_condition and self.same_condition_state(
+            self.applied_condition["state"], self.condition_state(condition, model)
+        ):
+            self.test_stats["conditions_skipped"] += 1
+            return
         model.objective = condition["objective"]
         #if condition["is_max_threshold"]:
         model.objective.direction = "max"
         #else: TODO - need to revisit this
         #    model.objective.direction = "min"
         pkgmgr.getpkg("KBaseMediaPkg").build_package(condition["media"])
+        self.test_stats["conditions_applied"] += 1
+        self.applied_condition = {"state": self.condition_state(condition, model)}
+
+    def same_condition_state(self, state, other):
+        return state["values"] == other["values"] and all(
+            item is other_item
+            for item, other_item in zip(state["objects"], other["objects"])
+        )
+
+    def condition_state(self, condition, model):
+        """Captures what applying a test condition sets, in constant time
+
+        The objective is kept by identity because setting any other objective replaces the
+        objective object, and exiting a "with model" block restores the original one. The
+        exchange bounds are represented by the last media state of KBaseMediaPkg, which is
+        replaced by every media application and restored with any "with model" block it was
+        made in. Exchange bounds set directly on the model are not detected; set
+        applied_condition to None after changing them.
+        """
+        objective = model.solver.objective
+        media_pkg = MSPackageManager.get_pkg_mgr(model).getpkg("KBaseMediaPkg")
+        return {
+            "objects": (
+                model,
+                condition,
+                condition["media"],
+                objective,
+                media_pkg.applied_state,
+            ),
+            "values": (condition["objective"], objective.direction),
+        }
+
+    def set_lp_method(self, method, model=None):
+        """Sets the simplex method used for LP solves and returns the previous setting
+
+        Re-solving after tightening bounds leaves the previous basis dual feasible, so the
+        dual simplex restarts from that basis instead of searching from scratch. Only solvers
+        whose optlang configuration has an lp_method option are changed; for others, such as
+        GLPK, nothing is set and None is returned.
+
+        Parameters
+        ----------
+        method : string | int
+            "primal" or "dual", or a value previously returned by this function
+        model : cobra.Model, optional
+            Specific instance of model to configure
+
+        Returns
+        -------
+        string | int
+            Previous setting, which can be passed back to restore it (None if nothing was set)
+        """
+        if model is None:
+            model = self.model
+        configuration = model.solver.configuration
+        if method is not None and hasattr(configuration, "lp_method"):
+            previous = configuration.lp_method
+            configuration.lp_method = method
+            return previous
+        return None
 
     def test_single_condition(self, condition, apply_condition=True, model=None):
         """Runs a single test condition to determine if objective value on set media exceeds threshold
@@ -1008,7 +1460,10 @@ class MSModelUtil:
             model = self.model
         if apply_condition:
             self.apply_test_condition(condition, model)
+        tic = time.perf_counter()
         new_objective = model.slim_optimize()
+        self.test_stats["solves"] += 1
+        self.test_stats["solve_time"] += time.perf_counter() - tic
         value = new_objective
         if "change" in condition and condition["change"]:
             if self.test_objective:
@@ -1082,7 +1537,7 @@ class MSModelUtil:
         ------
         """
         # First run the full test
-        if self.test_single_condition(condition, apply_condition=False, model=currmodel,positive_growth=positive_growth):
+        if self.test_single_condition(condition, apply_condition=False, model=currmodel):
             return []
         # First knockout all reactions in the input list and save original bounds
         filtered_list = []
@@ -1118,7 +1573,16 @@ class MSModelUtil:
             count += 1
         return filtered_list
 
-    def binary_expansion_test(self, reaction_list, condition, currmodel, depth=0,positive_growth=[]):
+    def binary_expansion_test(
+        self,
+        reaction_list,
+        condition,
+        currmodel,
+        depth=0,
+        positive_growth=[],
+        split_count=2,
+        order_by_flux=False,
+    ):
         """Conducts a binary search for bad reaction combinations
         Parameters
         ----------
@@ -1126,6 +1590,10 @@ class MSModelUtil:
             List of reactions and directions to test for addition in the model (should already be in model)
         condition_list : list<dict>
             Specifies set of conditions to be tested with media, objective, is_max_threshold, threshold.
+        split_count : int
+            Number of sublists the reaction list is split into at each level of the search
+        order_by_flux : bool
+            Tests the reactions carrying flux in the failing solution first, as a separate sublist
 
         Returns
         -------
@@ -1142,7 +1610,7 @@ class MSModelUtil:
             return []
         # Check if input list contains only one reaction:
         if len(reaction_list) == 1:
-            print("Failed:"+reaction_list[0][1]+reaction_list[0][0].id)
+            logger.debug("Failed:" + reaction_list[0][1] + reaction_list[0][0].id)
             if reaction_list[0][1] == ">":
                 reaction_list[0].append(reaction_list[0][0].upper_bound)
                 reaction_list[0][0].upper_bound = 0
@@ -1155,7 +1623,11 @@ class MSModelUtil:
                 #Testing positive growth conditions
                 for pos_condition in positive_growth:
                     if not self.test_single_condition(pos_condition,apply_condition=True,model=currmodel):
-                        print("Does not pass positive growth tests:"+reaction_list[0][1]+reaction_list[0][0].id)
+                        logger.debug(
+                            "Does not pass positive growth tests:"
+                            + reaction_list[0][1]
+                            + reaction_list[0][0].id
+                        )
                         success = False
                         break
                 #Restoring current test condition
@@ -1171,62 +1643,214 @@ class MSModelUtil:
                     reaction_list[0][0].lower_bound = reaction_list[0][2]
                 self.breaking_reaction = reaction_list[0][0]
             return filtered_list
-        # Break reaction list into two
+        # Break reaction list into sublists, all but the first of which are knocked out
+        sub_lists = None
+        if order_by_flux:
+            sub_lists = self.split_by_test_flux(reaction_list, currmodel)
+        if sub_lists is None:
+            sub_lists = self.split_reaction_list(reaction_list, max(2, split_count))
         original_bound = []
-        sub_lists = [[], []]
-        midway_point = int(len(reaction_list) / 2)
-        for i, item in enumerate(reaction_list):
+        for i, sub_list in enumerate(sub_lists):
+            original_bound.append(self.knockout_reaction_list(sub_list, i > 0))
+        for i, sub_list in enumerate(sub_lists):
+            # Restoring the next sublist - only filtered reactions remain removed from earlier sublists
+            if i > 0:
+                self.restore_reaction_list(sub_list, original_bound[i])
+            new_filter = self.binary_expansion_test(
+                sub_list,
+                condition,
+                currmodel,
+                depth=newdepth,
+                positive_growth=positive_growth,
+                split_count=split_count,
+                order_by_flux=order_by_flux,
+            )
+            for item in new_filter:
+                filtered_list.append(item)
+            if self.breaking_reaction != None:
+                logger.info(
+                    "Ending early due to breaking reaction:" + self.breaking_reaction.id
+                )
+                for j in range(i + 1, len(sub_lists)):
+                    self.restore_reaction_list(sub_lists[j], original_bound[j])
+                return filtered_list
+        return filtered_list
+
+    def group_expansion_test(
+        self, reaction_list, condition, currmodel, group_count=8, positive_growth=[]
+    ):
+        """Screens groups of reactions independently before searching the failing groups
+
+        Every group is first tested alone with all other reactions in the list knocked out.
+        If the groups that pass also pass together, they are kept and only the failing groups
+        are searched with binary_expansion_test; otherwise the whole list is searched.
+
+        Parameters
+        ----------
+        reaction_list : list<[obj reaction,{>|>}]>
+            List of reactions and directions to test for addition in the model (should already be in model)
+        group_count : int
+            Number of groups screened in the first round
+
+        Returns
+        -------
+        list<[obj reaction,{>|>}]>
+            List of reactions and directions filtered because they fail tests when in the model
+        """
+        if self.test_single_condition(condition, apply_condition=False, model=currmodel):
+            return []
+        groups = self.split_reaction_list(reaction_list, group_count)
+        original_bound = [self.knockout_reaction_list(group) for group in groups]
+        failing = []
+        for i, group in enumerate(groups):
+            self.restore_reaction_list(group, original_bound[i])
+            if not self.test_single_condition(condition, apply_condition=False, model=currmodel):
+                failing.append(i)
+            self.knockout_reaction_list(group)
+        for i, group in enumerate(groups):
+            if i not in failing:
+                self.restore_reaction_list(group, original_bound[i])
+        if len(failing) == len(groups) or not self.test_single_condition(
+            condition, apply_condition=False, model=currmodel
+        ):
+            for i in failing:
+                self.restore_reaction_list(groups[i], original_bound[i])
+            return self.binary_expansion_test(
+                reaction_list, condition, currmodel, positive_growth=positive_growth
+            )
+        filtered_list = []
+        for count, i in enumerate(failing):
+            self.restore_reaction_list(groups[i], original_bound[i])
+            filtered_list += self.binary_expansion_test(
+                groups[i], condition, currmodel, positive_growth=positive_growth
+            )
+            if self.breaking_reaction != None:
+                for j in failing[count + 1 :]:
+                    self.restore_reaction_list(groups[j], original_bound[j])
+                break
+        return filtered_list
+
+    def expansion_search(
+        self,
+        reaction_list,
+        condition,
+        currmodel,
+        search_strategy="binary",
+        split_count=2,
+        positive_growth=[],
+    ):
+        """Searches the reaction list for reactions failing the condition with the specified strategy
+
+        Parameters
+        ----------
+        search_strategy : string
+            "binary" halves the list at each level, "kway" splits it into split_count sublists,
+            "flux" tests the reactions carrying flux in the failing solution first and "group"
+            screens split_count groups before searching the failing ones
+        split_count : int
+            Number of sublists or groups used by the "kway", "flux" and "group" strategies
+
+        Returns
+        -------
+        list<[obj reaction,{>|>}]>
+            List of reactions and directions filtered because they fail tests when in the model
+        """
+        if search_strategy == "binary":
+            return self.binary_expansion_test(
+                reaction_list, condition, currmodel, positive_growth=positive_growth
+            )
+        elif search_strategy == "kway":
+            return self.binary_expansion_test(
+                reaction_list,
+                condition,
+                currmodel,
+                positive_growth=positive_growth,
+                split_count=split_count,
+            )
+        elif search_strategy == "flux":
+            return self.binary_expansion_test(
+                reaction_list,
+                condition,
+                currmodel,
+                positive_growth=positive_growth,
+                split_count=split_count,
+                order_by_flux=True,
+            )
+        elif search_strategy == "group":
+            return self.group_expansion_test(
+                reaction_list,
+                condition,
+                currmodel,
+                group_count=split_count,
+                positive_growth=positive_growth,
+            )
+        raise ValueError("Unknown expansion search strategy: " + str(search_strategy))
+
+    @staticmethod
+    def split_reaction_list(reaction_list, split_count):
+        split_count = max(1, min(split_count, len(reaction_list)))
+        boundaries = [
+            int(i * len(reaction_list) / split_count) for i in range(split_count + 1)
+        ]
+        return [
+            reaction_list[boundaries[i] : boundaries[i + 1]] for i in range(split_count)
+        ]
+
+    @staticmethod
+    def split_by_test_flux(reaction_list, model, tolerance=1e-9):
+        """Splits reactions by whether they carry flux in their direction in the last solution
+
+        Returns None if there is no usable solution or all or none of the reactions carry flux
+        """
+        if model.solver.status != "optimal":
+            return None
+        carriers = []
+        others = []
+        for item in reaction_list:
             if item[1] == ">":
-                original_bound.append(item[0].upper_bound)
+                carries_flux = item[0].forward_variable.primal > tolerance
             else:
-                original_bound.append(item[0].lower_bound)
-            if i < midway_point:
-                sub_lists[0].append(item)
+                carries_flux = item[0].reverse_variable.primal > tolerance
+            if carries_flux:
+                carriers.append(item)
             else:
-                sub_lists[1].append(item)
-                if item[1] == ">":
-                    item[0].upper_bound = 0
-                else:
-                    item[0].lower_bound = 0
-        # Submitting first half of reactions for testing
-        new_filter = self.binary_expansion_test(
-            sub_lists[0], condition, currmodel,depth=newdepth,positive_growth=positive_growth
-        )
-        for item in new_filter:
-            filtered_list.append(item)
-        if self.breaking_reaction != None:
-            print("Ending early due to breaking reaction:"+self.breaking_reaction.id)
-            return filtered_list
-        # Submitting second half of reactions for testing - now only breaking reactions are removed from the first list
-        for i, item in enumerate(reaction_list):
-            if i >= midway_point:
-                if item[1] == ">":
-                    item[0].upper_bound = original_bound[i]
-                else:
-                    item[0].lower_bound = original_bound[i]
-        new_filter = self.binary_expansion_test(
-            sub_lists[1], condition, currmodel,depth=newdepth,positive_growth=positive_growth
-        )
-        for item in new_filter:
-            filtered_list.append(item)
-        return filtered_list
+                others.append(item)
+        if len(carriers) == 0 or len(others) == 0:
+            return None
+        return [carriers, others]
 
-    def check_if_solution_exists(self, reaction_list, condition, model):
+    @staticmethod
+    def knockout_reaction_list(reaction_list, knockout=True):
+        """Returns the current bounds of the reaction directions in the list, knocking them out if specified"""
         original_bound = []
-        for i, item in enumerate(reaction_list):
+        for item in reaction_list:
             if item[1] == ">":
                 original_bound.append(item[0].upper_bound)
-                item[0].upper_bound = 0
+                if knockout:
+                    item[0].upper_bound = 0
             else:
                 original_bound.append(item[0].lower_bound)
-                item[0].lower_bound = 0
-        result = self.test_single_condition(condition,model=model)
+                if knockout:
+                    item[0].lower_bound = 0
+        return original_bound
+
+    @staticmethod
+    def restore_reaction_list(reaction_list, original_bound):
         for i, item in enumerate(reaction_list):
             if item[1] == ">":
                 item[0].upper_bound = original_bound[i]
             else:
                 item[0].lower_bound = original_bound[i]
-        return result          
+
+    def check_if_solution_exists(self, reaction_list, condition, model):
+        # Media and objective of the condition are reverted along with the knockouts
+        with model:
+            for item in reaction_list:
+                if item[1] == ">":
+                    item[0].upper_bound = 0
+                else:
+                    item[0].lower_bound = 0
+            return self.test_single_condition(condition, model=model)          
     
     def reaction_expansion_test(
         self,
@@ -1234,7 +1858,11 @@ class MSModelUtil:
         condition_list,
         binary_search=True,
         attribute_label="gf_filter",
-        positive_growth=[]
+        positive_growth=[],
+        processes=None,
+        executor=None,
+        search_strategy="binary",
+        split_count=2,
     ):
         """Adds reactions in reaction list one by one and appplies tests, filtering reactions that fail
 
@@ -1244,6 +1872,19 @@ class MSModelUtil:
             List of reactions and directions to test for addition in the model (should already be in model)
         condition_list : list<dict>
             Specifies set of conditions to be tested with media, objective, is_max_threshold, threshold.
+        processes : int
+            Number of worker processes used to test conditions in parallel (see run_parallel_expansion_tests).
+            Parallel conditions are all tested from the starting model and their filtered reactions
+            are combined, while serial conditions each start from the reactions filtered by the
+            conditions before them. A reaction that only breaks a condition together with reactions
+            an earlier condition filtered is therefore filtered in parallel but kept serially, so
+            the parallel result can filter more reactions than the serial one.
+        executor : concurrent.futures.Executor
+            Existing executor used to test conditions in parallel instead of creating a process pool
+        search_strategy : string
+            Strategy used to search for failing reactions when binary_search is True (see expansion_search)
+        split_count : int
+            Number of sublists or groups used by the "kway", "flux" and "group" search strategies
 
         Returns
         -------
@@ -1256,106 +1897,240 @@ class MSModelUtil:
         logger.debug(f"Expansion started! Binary = {binary_search}")
         self.breaking_reaction = None
         filtered_list = []
-        for condition in condition_list:
-            logger.debug(f"testing condition {condition}")
-            currmodel = self.model
-            tic = time.perf_counter()
-            new_filtered = []
-            if not self.check_if_solution_exists(reaction_list, condition, currmodel):
-                print("No solution exists that passes tests for condition "+condition["media"].id)
-                return None
-            with currmodel:
-                self.apply_test_condition(condition)
-                if binary_search:
-                    done = False
-                    while not done:
-                        new_filtered = self.binary_expansion_test(
-                            reaction_list, condition, currmodel,positive_growth=positive_growth
+        # Each test only flips bounds, so every re-solve is warm started from the last basis
+        lp_method = self.set_lp_method("dual")
+        try:
+            parallel = (
+                (processes is not None or executor is not None)
+                and len(condition_list) > 1
+                and len(positive_growth) == 0
+            )
+            if parallel:
+                # All conditions are tested at once from the starting model and then combined
+                parallel_results = self.run_parallel_expansion_tests(
+                    reaction_list,
+                    condition_list,
+                    binary_search,
+                    processes,
+                    executor,
+                    search_strategy,
+                    split_count,
+                )
+            for index, condition in enumerate(condition_list):
+                logger.debug(f"testing condition {condition}")
+                currmodel = self.model
+                tic = time.perf_counter()
+                start_solves = self.test_stats["solves"]
+                start_solve_time = self.test_stats["solve_time"]
+                new_filtered = []
+                if parallel:
+                    result, stats, retained = parallel_results[index]
+                    for key in stats:
+                        self.test_stats[key] += stats[key]
+                    for rxn_id, direction in retained:
+                        logger.info("Keeping breaking reaction:" + rxn_id)
+                        reaction_list[:] = [
+                            item
+                            for item in reaction_list
+                            if item[0].id != rxn_id or item[1] != direction
+                        ]
+                    if result is None:
+                        logger.warning(
+                            "No solution exists that passes tests for condition "
+                            + condition["media"].id
                         )
-                        for item in new_filtered:
-                            if item not in filtered_list:
-                                filtered_list.append(item)
-                        if self.breaking_reaction == None:
-                            done = True
-                        else:
-                            #Remove breaking reaction from reaction_list
-                            print("Keeping breaking reaction:"+self.breaking_reaction.id)
-                            for i in range(len(reaction_list)):
-                                if reaction_list[i][0] == self.breaking_reaction:
-                                    del reaction_list[i]
-                                    break
-                            if not self.check_if_solution_exists(reaction_list, condition, currmodel):
-                                print("No solution exists after retaining breaking reaction:"+self.breaking_reaction.id)
-                                return None
-                            self.breaking_reaction = None
-                else:
-                    new_filtered = self.linear_expansion_test(
-                        reaction_list, condition, currmodel,positive_growth=positive_growth
-                    )
-                    for item in new_filtered:
+                        return None
+                    items = {(item[0].id, item[1]): item for item in reaction_list}
+                    for rxn_id, direction, *extras in result:
+                        # Breaking reactions kept for an earlier condition are no longer tested
+                        item = items.get((rxn_id, direction))
+                        if item is None:
+                            continue
+                        # Reactions filtered by several conditions keep the data of the first
                         if item not in filtered_list:
+                            item.extend(extras)
                             filtered_list.append(item)
-            # Restoring knockout of newly filtered reactions, which expire after exiting the "with" block above
-            for item in new_filtered:
-                if item[1] == ">":
-                    item[0].upper_bound = 0
+                        new_filtered.append(item)
+                elif not self.check_if_solution_exists(reaction_list, condition, currmodel):
+                    logger.warning(
+                        "No solution exists that passes tests for condition "
+                        + condition["media"].id
+                    )
+                    return None
                 else:
-                    item[0].lower_bound = 0
-            toc = time.perf_counter()
-            logger.info(
-                "Expansion time:" + condition["media"].id + ":" + str((toc - tic))
-            )
-            logger.info(
-                "Filtered count:"
-                + str(len(filtered_list))
-                + " out of "
-                + str(len(reaction_list))
-            )
-            # Adding filter results to attributes
-            gf_filter_att = self.get_attributes(attribute_label, {})
-            if condition["media"].id not in gf_filter_att:
-                gf_filter_att[condition["media"].id] = {}
-            if condition["objective"] not in gf_filter_att[condition["media"].id]:
-                gf_filter_att[condition["media"].id][condition["objective"]] = {}
-            if (
-                condition["threshold"]
-                not in gf_filter_att[condition["media"].id][condition["objective"]]
-            ):
-                gf_filter_att[condition["media"].id][condition["objective"]][
-                    condition["threshold"]
-                ] = {}
-            for item in new_filtered:
+                    with currmodel:
+                        self.apply_test_condition(condition)
+                        if binary_search:
+                            done = False
+                            while not done:
+                                new_filtered = self.expansion_search(
+                                    reaction_list,
+                                    condition,
+                                    currmodel,
+                                    search_strategy,
+                                    split_count,
+                                    positive_growth=positive_growth,
+                                )
+                                for item in new_filtered:
+                                    if item not in filtered_list:
+                                        filtered_list.append(item)
+                                if self.breaking_reaction == None:
+                                    done = True
+                                else:
+                                    #Remove breaking reaction from reaction_list
+                                    logger.info(
+                                        "Keeping breaking reaction:"
+                                        + self.breaking_reaction.id
+                                    )
+                                    for i in range(len(reaction_list)):
+                                        if reaction_list[i][0] == self.breaking_reaction:
+                                            del reaction_list[i]
+                                            break
+                                    if not self.check_if_solution_exists(reaction_list, condition, currmodel):
+                                        logger.warning(
+                                            "No solution exists after retaining breaking reaction:"
+                                            + self.breaking_reaction.id
+                                        )
+                                        return None
+                                    self.breaking_reaction = None
+                        else:
+                            new_filtered = self.linear_expansion_test(
+                                reaction_list, condition, currmodel,positive_growth=positive_growth
+                            )
+                            for item in new_filtered:
+                                if item not in filtered_list:
+                                    filtered_list.append(item)
+                # Restoring knockout of newly filtered reactions, which expire after exiting the "with" block above
+                for item in new_filtered:
+                    if item[1] == ">":
+                        item[0].upper_bound = 0
+                    else:
+                        item[0].lower_bound = 0
+                toc = time.perf_counter()
+                logger.info(
+                    "Expansion time:" + condition["media"].id + ":" + str((toc - tic))
+                )
+                solves = self.test_stats["solves"] - start_solves
+                solve_time = self.test_stats["solve_time"] - start_solve_time
+                logger.info(
+                    "Expansion solves:"
+                    + condition["media"].id
+                    + ":"
+                    + str(solves)
+                    + " in "
+                    + str(solve_time)
+                    + "s ("
+                    + str(solves / solve_time if solve_time > 0 else 0)
+                    + " solves/s)"
+                )
+                logger.info(
+                    "Filtered count:"
+                    + str(len(filtered_list))
+                    + " out of "
+                    + str(len(reaction_list))
+                )
+                # Adding filter results to attributes
+                gf_filter_att = self.get_attributes(attribute_label, {})
+                if condition["media"].id not in gf_filter_att:
+                    gf_filter_att[condition["media"].id] = {}
+                if condition["objective"] not in gf_filter_att[condition["media"].id]:
+                    gf_filter_att[condition["media"].id][condition["objective"]] = {}
                 if (
-                    item[0].id
-                    not in gf_filter_att[condition["media"].id][condition["objective"]][
-                        condition["threshold"]
-                    ]
+                    condition["threshold"]
+                    not in gf_filter_att[condition["media"].id][condition["objective"]]
                 ):
                     gf_filter_att[condition["media"].id][condition["objective"]][
                         condition["threshold"]
-                    ][item[0].id] = {}
-                if (
-                    item[1]
-                    not in gf_filter_att[condition["media"].id][condition["objective"]][
-                        condition["threshold"]
-                    ][item[0].id]
-                ):
-                    if len(item) < 3:
-                        gf_filter_att[condition["media"].id][condition["objective"]][
+                    ] = {}
+                for item in new_filtered:
+                    if (
+                        item[0].id
+                        not in gf_filter_att[condition["media"].id][condition["objective"]][
                             condition["threshold"]
-                        ][item[0].id][item[1]] = None
-                    else:
+                        ]
+                    ):
                         gf_filter_att[condition["media"].id][condition["objective"]][
                             condition["threshold"]
-                        ][item[0].id][item[1]] = item[2]
-        return filtered_list
+                        ][item[0].id] = {}
+                    if (
+                        item[1]
+                        not in gf_filter_att[condition["media"].id][condition["objective"]][
+                            condition["threshold"]
+                        ][item[0].id]
+                    ):
+                        if len(item) < 3:
+                            gf_filter_att[condition["media"].id][condition["objective"]][
+                                condition["threshold"]
+                            ][item[0].id][item[1]] = None
+                        else:
+                            gf_filter_att[condition["media"].id][condition["objective"]][
+                                condition["threshold"]
+                            ][item[0].id][item[1]] = item[2]
+            return filtered_list
+        finally:
+            self.set_lp_method(lp_method)
+
+    def run_parallel_expansion_tests(
+        self,
+        reaction_list,
+        condition_list,
+        binary_search=True,
+        processes=None,
+        executor=None,
+        search_strategy="binary",
+        split_count=2,
+        knockouts=[],
+    ):
+        """Runs the expansion test of every condition independently in worker processes
+
+        Each worker loads a pickled copy of the model once and tests one condition against the
+        current bounds with the reaction directions in knockouts closed, so the results match
+        what reaction_expansion_test computes for that condition after earlier conditions
+        filtered exactly those reactions.
+
+        Parameters
+        ----------
+        reaction_list : list<[obj reaction,{>|>}]>
+            List of reactions and directions to test for addition in the model (should already be in model)
+        condition_list : list<dict>
+            Specifies set of conditions to be tested with media, objective, is_max_threshold, threshold.
+        processes : int
+            Number of worker processes to create when no executor is provided
+        executor : concurrent.futures.Executor
+            Existing executor to submit conditions to
+        knockouts : list<[obj reaction,{>|<}]>
+            Reaction directions filtered by earlier conditions
+
+        Returns
+        -------
+        list<(list<[string,{>|<},...]>|None, dict, list<[string,{>|<}]>)>
+            Filtered reaction IDs, directions and original bounds and scores for each condition
+            (None when no solution passes the condition) along with the solve statistics of each worker
+            and the breaking reactions it kept in the model
+        """
+        rxn_list = [[item[0].id, item[1]] for item in reaction_list]
+        knockout_list = [[item[0].id, item[1]] for item in knockouts]
+        options = {
+            "binary_search": binary_search,
+            "search_strategy": search_strategy,
+            "split_count": split_count,
+        }
+        with MSWorkerState(self.model, "expansion") as state:
+            args = [
+                (state, rxn_list, condition, knockout_list, options)
+                for condition in condition_list
+            ]
+            if executor is not None:
+                return list(executor.map(_run_expansion_worker, args))
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                return list(pool.map(_run_expansion_worker, args))
 
     #################################################################################
     # Functions related to biomass sensitivity analysis
     #################################################################################
     def find_unproducible_biomass_compounds(self, target_rxn="bio1", ko_list=None):
         # Cloning the model because we don't want to modify the original model with this analysis
-        tempmodel = cobra.io.json.from_json(cobra.io.json.to_json(self.model))
+        tempmodel = MSModelUtil.clone(self.model)
         # Getting target reaction and making sure it exists
         if target_rxn not in tempmodel.reactions:
             logger.critical(target_rxn + " not in model!")
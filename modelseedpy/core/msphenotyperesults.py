@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+import logging
+import numpy as np
+import pandas as pd
+from collections.abc import Mapping
+
+logger = logging.getLogger(__name__)
+
+# Result fields holding lists, stored as ";" joined strings in saved files
+LIST_FIELDS = ["missing_transports", "reactions"]
+
+
+class MSPhenotypeResults(Mapping):
+    """Columnar store for the simulation results of a phenotype set
+
+    Scalar result fields (objective value, class, reaction counts, ...) are kept as one
+    column per field, and fluxes as one float32 row per phenotype over a reaction index
+    shared by all phenotypes, instead of one pandas Series per phenotype. Sparse stores keep
+    only the nonzero fluxes of each row. The store is a read-only mapping from phenotype ID
+    to the result dict returned by MSGrowthPhenotype.simulate; the fluxes Series of a
+    phenotype is only built when its result is accessed:
+
+        results = MSPhenotypeResults(sparse=True)
+        phenotypes.simulate_phenotypes(model, save_fluxes=True, results=results)
+        results["glc__D"]["fluxes"]
+        results.flux_dataframe()
+        results.save("phenotypes.npz")
+
+    Fluxes are stored in single precision, so values keep about seven significant digits.
+    """
+
+    def __init__(self, reaction_ids=None, sparse=False):
+        self.reaction_ids = []
+        self.reaction_index = {}
+        self.sparse = sparse
+        self.phenotype_ids = []
+        self.phenotype_index = {}
+        self.columns = {}
+        # Whether each phenotype's output had the field, so None values are kept apart from
+        # fields missing from the output
+        self.present = {}
+        # Dense rows may be shorter than the reaction index if reactions were added after them
+        self.rows = []
+        # Reaction positions of the last flux index added, reused while the model is unchanged
+        self.last_index = None
+        self.last_positions = None
+        self.add_reactions(reaction_ids or [])
+
+    def add_reactions(self, reaction_ids):
+        for rxn_id in reaction_ids:
+            if rxn_id not in self.reaction_index:
+                self.reaction_index[rxn_id] = len(self.reaction_ids)
+                self.reaction_ids.append(rxn_id)
+
+    def __getitem__(self, phenotype_id):
+        return self.result(phenotype_id)
+
+    def __iter__(self):
+        return iter(self.phenotype_ids)
+
+    def __len__(self):
+        return len(self.phenotype_ids)
+
+    def __contains__(self, phenotype_id):
+        return phenotype_id in self.phenotype_index
+
+    def add(self, phenotype_id, output):
+        """Adds the simulation output of a phenotype, converting its fluxes into a row
+
+        Parameters
+        ----------
+        phenotype_id : string
+            ID of the simulated phenotype
+        output : dict
+            Result of MSGrowthPhenotype.simulate; a "fluxes" Series is not kept in the dict
+        """
+        if phenotype_id in self.phenotype_index:
+            raise ValueError(f"Results for phenotype {phenotype_id} already stored")
+        row = len(self.phenotype_ids)
+        self.phenotype_index[phenotype_id] = row
+        self.phenotype_ids.append(phenotype_id)
+        for field, value in output.items():
+            if field == "fluxes":
+                continue
+            if field not in self.columns:
+                self.columns[field] = [None] * row
+                self.present[field] = [False] * row
+            self.columns[field].append(value)
+            self.present[field].append(True)
+        for field in self.columns:
+            if len(self.columns[field]) == row:
+                self.columns[field].append(None)
+                self.present[field].append(False)
+        fluxes = output.get("fluxes")
+        if fluxes is None:
+            self.rows.append(None)
+            return
+        if self.last_index is not None and fluxes.index.equals(self.last_index):
+            positions = self.last_positions
+        else:
+            self.add_reactions(fluxes.index)
+            positions = np.fromiter(
+                (self.reaction_index[rxn_id] for rxn_id in fluxes.index),
+                dtype=np.int64,
+                count=len(fluxes),
+            )
+            self.last_index = fluxes.index
+            self.last_positions = positions
+        values = np.asarray(fluxes.values, dtype=np.float32)
+        if self.sparse:
+            nonzero = values != 0
+            self.rows.append(
+                (positions[nonzero].astype(np.int32), values[nonzero])
+            )
+        else:
+            dense = np.zeros(len(self.reaction_ids), dtype=np.float32)
+            dense[positions] = values
+            self.rows.append(dense)
+
+    def extend(self, other):
+        """Adds all results of another store, such as the results of a worker process"""
+        for i, phenotype_id in enumerate(other.phenotype_ids):
+            output = {
+                field: other.columns[field][i]
+                for field in other.columns
+                if other.present[field][i]
+            }
+            output["fluxes"] = other.fluxes(phenotype_id)
+            self.add(phenotype_id, output)
+
+    def flux_row(self, phenotype_id):
+        """Returns the fluxes of a phenotype as a float32 array over reaction_ids, or None if none were saved"""
+        row = self.rows[self.phenotype_index[phenotype_id]]
+        if row is None:
+            return None
+        dense = np.zeros(len(self.reaction_ids), dtype=np.float32)
+        if self.sparse:
+            dense[row[0]] = row[1]
+        else:
+            dense[: len(row)] = row
+        return dense
+
+    def fluxes(self, phenotype_id):
+        """Returns the fluxes of a phenotype as a pandas Series, or None if none were saved"""
+        row = self.flux_row(phenotype_id)
+        if row is None:
+            return None
+        return pd.Series(row, index=self.reaction_ids, name="fluxes")
+
+    def result(self, phenotype_id, include_fluxes=True):
+        """Returns the result dict of a phenotype in the format of MSGrowthPhenotype.simulate"""
+        row = self.phenotype_index[phenotype_id]
+        output = {
+            field: values[row]
+            for field, values in self.columns.items()
+            if self.present[field][row]
+        }
+        if include_fluxes and self.rows[row] is not None:
+            output["fluxes"] = self.fluxes(phenotype_id)
+        return output
+
+    def flux_matrix(self):
+        """Returns the fluxes of all phenotypes (rows) and reactions (columns)
+
+        Phenotypes without saved fluxes are all zero. Sparse stores return a
+        scipy.sparse.csr_matrix, dense stores a float32 numpy array.
+        """
+        shape = (len(self.phenotype_ids), len(self.reaction_ids))
+        if self.sparse:
+            from scipy.sparse import csr_matrix
+
+            indptr, indices, data = self.csr_arrays()
+            return csr_matrix((data, indices, indptr), shape=shape)
+        matrix = np.zeros(shape, dtype=np.float32)
+        for i, row in enumerate(self.rows):
+            if row is not None:
+                matrix[i, : len(row)] = row
+        return matrix
+
+    def csr_arrays(self):
+        indptr = np.zeros(len(self.rows) + 1, dtype=np.int64)
+        indices = []
+        data = []
+        for i, row in enumerate(self.rows):
+            if row is not None:
+                if self.sparse:
+                    row_indices, row_data = row
+                else:
+                    row_indices = np.flatnonzero(row).astype(np.int32)
+                    row_data = row[row_indices]
+                indices.append(row_indices)
+                data.append(row_data)
+            indptr[i + 1] = indptr[i] + (len(indices[-1]) if row is not None else 0)
+        if len(indices) == 0:
+            return indptr, np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        return indptr, np.concatenate(indices), np.concatenate(data)
+
+    def flux_dataframe(self):
+        """Returns the fluxes as a phenotypes x reactions DataFrame"""
+        matrix = self.flux_matrix()
+        if self.sparse:
+            return pd.DataFrame.sparse.from_spmatrix(
+                matrix, index=self.phenotype_ids, columns=self.reaction_ids
+            )
+        return pd.DataFrame(matrix, index=self.phenotype_ids, columns=self.reaction_ids)
+
+    def to_dataframe(self):
+        """Returns the scalar result fields as a DataFrame indexed by phenotype ID"""
+        data = {}
+        for field, values in self.columns.items():
+            if field in LIST_FIELDS:
+                values = [None if value is None else ";".join(value) for value in values]
+            data[field] = values
+        return pd.DataFrame(data, index=self.phenotype_ids)
+
+    def save(self, filename):
+        """Saves the store as a compressed .npz file readable without pickle"""
+        arrays = {
+            "phenotype_ids": np.array(self.phenotype_ids, dtype=str),
+            "reaction_ids": np.array(self.reaction_ids, dtype=str),
+            "sparse": np.array(self.sparse),
+            "has_fluxes": np.array([row is not None for row in self.rows], dtype=bool),
+        }
+        arrays["indptr"], arrays["indices"], arrays["data"] = self.csr_arrays()
+        fields = []
+        for field, values in self.columns.items():
+            present = np.array(self.present[field], dtype=bool)
+            null = np.array([value is None for value in values], dtype=bool)
+            if field in LIST_FIELDS:
+                kind = "list"
+                column = np.array(
+                    [";".join(value) if value is not None else "" for value in values],
+                    dtype=str,
+                )
+            elif all(
+                isinstance(value, (bool, np.bool_)) for value in values if value is not None
+            ):
+                kind = "bool"
+                column = np.array([bool(value) for value in values], dtype=bool)
+            elif all(
+                isinstance(value, (int, np.integer))
+                for value in values
+                if value is not None
+            ):
+                kind = "int"
+                column = np.array(
+                    [0 if value is None else value for value in values], dtype=np.int64
+                )
+            elif all(
+                isinstance(value, (int, float, np.number))
+                for value in values
+                if value is not None
+            ):
+                kind = "float"
+                column = np.array(
+                    [np.nan if value is None else value for value in values],
+                    dtype=float,
+                )
+            else:
+                kind = "str"
+                column = np.array(
+                    ["" if value is None else str(value) for value in values], dtype=str
+                )
+            fields.append([field, kind])
+            arrays["column_" + field] = column
+            arrays["present_" + field] = present
+            arrays["null_" + field] = null
+        arrays["fields"] = np.array(fields, dtype=str).reshape(len(fields), 2)
+        np.savez_compressed(filename, **arrays)
+
+    @staticmethod
+    def load(filename):
+        arrays = np.load(filename, allow_pickle=False)
+        results = MSPhenotypeResults(
+            arrays["reaction_ids"].tolist(), bool(arrays["sparse"])
+        )
+        results.phenotype_ids = arrays["phenotype_ids"].tolist()
+        results.phenotype_index = {
+            phenotype_id: i for i, phenotype_id in enumerate(results.phenotype_ids)
+        }
+        for field, kind in arrays["fields"].tolist():
+            present = arrays["present_" + field]
+            null = arrays["null_" + field]
+            values = arrays["column_" + field].tolist()
+            if kind == "list":
+                values = [value.split(";") if value else [] for value in values]
+            results.columns[field] = [
+                None if null[i] else value for i, value in enumerate(values)
+            ]
+            results.present[field] = present.tolist()
+        indptr, indices, data = arrays["indptr"], arrays["indices"], arrays["data"]
+        for i, has_fluxes in enumerate(arrays["has_fluxes"]):
+            if not has_fluxes:
+                results.rows.append(None)
+                continue
+            row_indices = indices[indptr[i] : indptr[i + 1]]
+            row_data = data[indptr[i] : indptr[i + 1]]
+            if results.sparse:
+                results.rows.append((row_indices, row_data))
+            else:
+                dense = np.zeros(len(results.reaction_ids), dtype=np.float32)
+                dense[row_indices] = row_data
+                results.rows.append(dense)
+        return results
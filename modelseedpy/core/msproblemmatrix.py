@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+import logging
+import numpy as np
+from optlang.symbolics import Zero
+
+logger = logging.getLogger(__name__)
+
+try:
+    import swiglpk
+except ImportError:
+    swiglpk = None
+
+
+class MSProblemMatrix:
+    """Compact CSR representation of a complete solver problem
+
+    Every row of the live problem (mass balances as well as rows added by FBA packages such
+    as GapfillingPkg or ProblemReplicationPkg) is exported together with variable and
+    constraint bounds, variable types and the linear objective. The arrays can be saved to
+    an .npz file and rebuilt into a solver problem without constructing any sympy
+    expressions, which makes it cheap to cache large problems:
+
+        matrix = MSProblemMatrix.from_model(model)
+        matrix.save("gapfill_problem.npz")
+        ...
+        MSProblemMatrix.load("gapfill_problem.npz").to_model(model)
+
+    GLPK problems are read and written directly through swiglpk; other solvers go through
+    the optlang coefficient API. Unbounded limits are stored as -inf/inf.
+    """
+
+    def __init__(
+        self,
+        variable_names,
+        variable_lb,
+        variable_ub,
+        variable_types,
+        constraint_names,
+        constraint_lb,
+        constraint_ub,
+        indptr,
+        indices,
+        data,
+        objective,
+        direction="max",
+    ):
+        self.variable_names = list(variable_names)
+        self.variable_lb = np.asarray(variable_lb, dtype=float)
+        self.variable_ub = np.asarray(variable_ub, dtype=float)
+        self.variable_types = list(variable_types)
+        self.constraint_names = list(constraint_names)
+        self.constraint_lb = np.asarray(constraint_lb, dtype=float)
+        self.constraint_ub = np.asarray(constraint_ub, dtype=float)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=float)
+        self.objective = np.asarray(objective, dtype=float)
+        self.direction = direction
+
+    @property
+    def shape(self):
+        return (len(self.constraint_names), len(self.variable_names))
+
+    def to_scipy(self):
+        """Returns the constraint matrix as a scipy.sparse.csr_matrix"""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.data, self.indices, self.indptr), shape=self.shape)
+
+    @staticmethod
+    def _bound(value, default):
+        return default if value is None else value
+
+    @staticmethod
+    def _limit(value):
+        return None if np.isinf(value) else float(value)
+
+    @staticmethod
+    def is_glpk(solver):
+        return swiglpk is not None and solver.interface.__name__.endswith(
+            "glpk_interface"
+        )
+
+    @staticmethod
+    def from_model(model):
+        """Exports the problem attached to a cobra model or an optlang model
+
+        Parameters
+        ----------
+        model : cobra.Model | optlang.interface.Model
+            Model whose current solver problem should be exported
+
+        Returns
+        -------
+        MSProblemMatrix
+        """
+        solver = getattr(model, "solver", model)
+        solver.update()
+        variables = list(solver.variables)
+        variable_index = {var.name: i for i, var in enumerate(variables)}
+        constraints = list(solver.constraints)
+        indptr = [0]
+        indices = []
+        data = []
+        if MSProblemMatrix.is_glpk(solver):
+            prob = solver.problem
+            num_cols = swiglpk.glp_get_num_cols(prob)
+            ia = swiglpk.intArray(num_cols + 1)
+            da = swiglpk.doubleArray(num_cols + 1)
+            for constraint in constraints:
+                nnz = swiglpk.glp_get_mat_row(prob, constraint._index, ia, da)
+                for i in range(1, nnz + 1):
+                    indices.append(
+                        variable_index[swiglpk.glp_get_col_name(prob, ia[i])]
+                    )
+                    data.append(da[i])
+                indptr.append(len(indices))
+            objective = [
+                swiglpk.glp_get_obj_coef(prob, var._index) for var in variables
+            ]
+        else:
+            for constraint in constraints:
+                coefficients = constraint.get_linear_coefficients(
+                    constraint.variables
+                )
+                for var, coef in coefficients.items():
+                    if coef != 0:
+                        indices.append(variable_index[var.name])
+                        data.append(coef)
+                indptr.append(len(indices))
+            objective = np.zeros(len(variables))
+            obj_coefficients = solver.objective.get_linear_coefficients(
+                solver.objective.variables
+            )
+            for var, coef in obj_coefficients.items():
+                objective[variable_index[var.name]] = coef
+        return MSProblemMatrix(
+            [var.name for var in variables],
+            [MSProblemMatrix._bound(var.lb, -np.inf) for var in variables],
+            [MSProblemMatrix._bound(var.ub, np.inf) for var in variables],
+            [var.type for var in variables],
+            [const.name for const in constraints],
+            [MSProblemMatrix._bound(const.lb, -np.inf) for const in constraints],
+            [MSProblemMatrix._bound(const.ub, np.inf) for const in constraints],
+            indptr,
+            indices,
+            data,
+            objective,
+            solver.objective.direction,
+        )
+
+    def to_solver(self, interface):
+        """Builds a new solver problem from the stored arrays
+
+        Parameters
+        ----------
+        interface : module | optlang.interface.Model
+            optlang solver interface (e.g. optlang.glpk_interface) or an existing problem whose
+            interface should be used
+
+        Returns
+        -------
+        optlang.interface.Model
+        """
+        if not hasattr(interface, "Model"):
+            interface = interface.interface
+        solver = interface.Model()
+        variables = [
+            interface.Variable(
+                name,
+                lb=self._limit(self.variable_lb[i]),
+                ub=self._limit(self.variable_ub[i]),
+                type=self.variable_types[i],
+            )
+            for i, name in enumerate(self.variable_names)
+        ]
+        constraints = [
+            interface.Constraint(
+                Zero,
+                lb=self._limit(self.constraint_lb[i]),
+                ub=self._limit(self.constraint_ub[i]),
+                name=name,
+            )
+            for i, name in enumerate(self.constraint_names)
+        ]
+        solver.add(variables)
+        solver.add(constraints)
+        solver.update()
+        if self.is_glpk(solver):
+            prob = solver.problem
+            for i, constraint in enumerate(constraints):
+                start, end = int(self.indptr[i]), int(self.indptr[i + 1])
+                if end == start:
+                    continue
+                ia = swiglpk.intArray(end - start + 1)
+                da = swiglpk.doubleArray(end - start + 1)
+                # Variables were added in order, so column j + 1 holds variable j
+                for k in range(start, end):
+                    ia[k - start + 1] = int(self.indices[k]) + 1
+                    da[k - start + 1] = float(self.data[k])
+                swiglpk.glp_set_mat_row(prob, constraint._index, end - start, ia, da)
+        else:
+            for i, constraint in enumerate(constraints):
+                start, end = self.indptr[i], self.indptr[i + 1]
+                if end > start:
+                    constraint.set_linear_coefficients(
+                        {
+                            variables[self.indices[k]]: float(self.data[k])
+                            for k in range(start, end)
+                        }
+                    )
+        solver.objective = interface.Objective(Zero, direction=self.direction)
+        solver.objective.set_linear_coefficients(
+            {
+                variables[i]: float(self.objective[i])
+                for i in np.flatnonzero(self.objective)
+            }
+        )
+        solver.update()
+        return solver
+
+    def to_model(self, model):
+        """Replaces the solver problem of a cobra model with one rebuilt from the stored arrays
+
+        The model must contain the reactions and metabolites the problem was exported from,
+        because cobra looks up reaction variables and metabolite constraints by name. FBA
+        packages hold references to the variables of the replaced problem, so packages
+        needed after this call should be built on the restored problem's model afresh.
+        """
+        missing = [
+            rxn.id for rxn in model.reactions if rxn.id not in self.variable_names
+        ]
+        if len(missing) > 0:
+            logger.warning(
+                f"{len(missing)} model reactions have no variables in the stored problem"
+            )
+        model._solver = self.to_solver(model.solver)
+        return model
+
+    def save(self, filename):
+        np.savez_compressed(
+            filename,
+            variable_names=np.array(self.variable_names, dtype=str),
+            variable_lb=self.variable_lb,
+            variable_ub=self.variable_ub,
+            variable_types=np.array(self.variable_types, dtype=str),
+            constraint_names=np.array(self.constraint_names, dtype=str),
+            constraint_lb=self.constraint_lb,
+            constraint_ub=self.constraint_ub,
+            indptr=self.indptr,
+            indices=self.indices,
+            data=self.data,
+            objective=self.objective,
+            direction=np.array(self.direction),
+        )
+
+    @staticmethod
+    def load(filename):
+        arrays = np.load(filename, allow_pickle=False)
+        return MSProblemMatrix(
+            arrays["variable_names"].tolist(),
+            arrays["variable_lb"],
+            arrays["variable_ub"],
+            arrays["variable_types"].tolist(),
+            arrays["constraint_names"].tolist(),
+            arrays["constraint_lb"],
+            arrays["constraint_ub"],
+            arrays["indptr"],
+            arrays["indices"],
+            arrays["data"],
+            arrays["objective"],
+            str(arrays["direction"]),
+        )
@@ -5,10 +5,11 @@ import math
 from enum import Enum
 import pandas as pd
 import numpy as np
-from cobra.core import Metabolite, Reaction
+from cobra.core import GPR, Metabolite, Reaction
 from cobra.core.dictlist import DictList
 from cobra.util import format_long_string
 from modelseedpy.core.fbahelper import FBAHelper
+from modelseedpy.core.msgenome import normalize_role
 from modelseedpy.core.msmodel import (
     get_direction_from_constraints,
     get_reaction_constraints_from_direction,
@@ -25,6 +26,9 @@ logger = logging.getLogger(__name__)
 
 SBO_ANNOTATION = "sbo"
 
+# Template reactions have no genes, their gene_reaction_rule lists complexes
+EMPTY_GPR = GPR()
+
 
 class AttrDict(dict):
     """
@@ -51,6 +55,22 @@ class TemplateBiomassCoefficientType(Enum):
 
 
 class MSTemplateMetabolite:
+    # Templates hold tens of thousands of entities, so the plain ones have no __dict__
+    __slots__ = (
+        "id",
+        "formula",
+        "name",
+        "abbreviation",
+        "default_charge",
+        "mass",
+        "delta_g",
+        "delta_g_error",
+        "is_cofactor",
+        "aliases",
+        "species",
+        "_template",
+    )
+
     def __init__(
         self,
         cpd_id,
@@ -161,12 +181,12 @@ class MSTemplateSpecies(Metabolite):
                     self.cpd_id
                 )
 
-    def to_metabolite(self, index="0", force=False):
+    def model_index(self, index="0", force=False):
         """
-        Create cobra.core.Metabolite instance
+        Returns the compartment index used for this species in a model
         :param index: compartment index
         :@param force: force index
-        :return: cobra.core.Metabolite
+        :return: str
         """
         if index is None:
             index = ""
@@ -179,7 +199,16 @@ class MSTemplateSpecies(Metabolite):
                 )
             else:
                 index = "0"
+        return index
 
+    def to_metabolite(self, index="0", force=False):
+        """
+        Create cobra.core.Metabolite instance
+        :param index: compartment index
+        :@param force: force index
+        :return: cobra.core.Metabolite
+        """
+        index = self.model_index(index, force)
         cpd_id = f"{self.id}{index}"
         compartment = f"{self.compartment}{index}"
         name = f"{self.compound.name} [{compartment}]"
@@ -269,6 +298,7 @@ class MSTemplateReaction(Reaction):
         :param template:
         """
         super().__init__(rxn_id, name, subsystem, lower_bound, upper_bound)
+        self._gpr = EMPTY_GPR
         self.reference_id = reference_id
         self.GapfillDirection = gapfill_direction
         self.base_cost = base_cost
@@ -301,28 +331,65 @@ class MSTemplateReaction(Reaction):
         """
         return get_cmp_token(self.compartments)
 
-    def to_reaction(self, model=None, index="0"):
+    def get_prototype(self, index="0"):
+        """
+        Returns the model reaction ID, name, stoichiometry by model metabolite ID and annotation
+        of the reaction for an index, cached in the template for each index
+        :param index: compartment index
+        :return: dict
+        """
         if index is None:
             index = ""
         index = str(index)
-        rxn_id = f"{self.id}{index}"
-        compartment = f"{self.compartment}{index}"
+        prototypes = None
+        if self._template is not None:
+            prototypes = self._template.get_reaction_prototypes(index)
+            if self.id in prototypes:
+                return prototypes[self.id]
         name = f"{self.name}"
-        metabolites = {}
-        for m, v in self.metabolites.items():
-            _metabolite = m.to_metabolite(index)
-            if _metabolite.id in model.metabolites:
-                metabolites[model.metabolites.get_by_id(_metabolite.id)] = v
-            else:
-                metabolites[_metabolite] = v
+        if len(index) > 0:
+            name = f"{self.name} [{self.compartment}{index}]"
+        prototype = {
+            "id": f"{self.id}{index}",
+            "name": name,
+            "stoichiometry": [
+                (f"{m.id}{m.model_index(index)}", m, v)
+                for m, v in self.metabolites.items()
+            ],
+            "annotation": {"seed.reaction": self.reference_id},
+        }
+        if prototypes is not None:
+            prototypes[self.id] = prototype
+        return prototype
 
-        if len(str(index)) > 0:
-            name = f"{self.name} [{compartment}]"
+    def to_reaction(self, model=None, index="0"):
+        """
+        Create cobra.core.Reaction instance from the cached prototype of the reaction
+        :param model: model the reaction will be added to, whose metabolites are reused
+        :param index: compartment index
+        :return: cobra.core.Reaction
+        """
+        if index is None:
+            index = ""
+        index = str(index)
+        prototype = self.get_prototype(index)
         reaction = Reaction(
-            rxn_id, name, self.subsystem, self.lower_bound, self.upper_bound
+            prototype["id"],
+            prototype["name"],
+            self.subsystem,
+            self.lower_bound,
+            self.upper_bound,
         )
-        reaction.add_metabolites(metabolites)
-        reaction.annotation["seed.reaction"] = self.reference_id
+        # Stamping the stoichiometry directly: metabolites already in the model are linked to
+        # the reaction when it is added to that model, rather than copied by add_metabolites
+        for met_id, m, v in prototype["stoichiometry"]:
+            if model is not None and met_id in model.metabolites:
+                metabolite = model.metabolites.get_by_id(met_id)
+            else:
+                metabolite = m.to_metabolite(index)
+                metabolite._reaction.add(reaction)
+            reaction._metabolites[metabolite] = v
+        reaction.annotation.update(prototype["annotation"])
         return reaction
 
     @staticmethod
@@ -463,6 +530,15 @@ class MSTemplateReaction(Reaction):
 
 
 class MSTemplateBiomassComponent:
+    __slots__ = (
+        "id",
+        "metabolite",
+        "comp_class",
+        "coefficient",
+        "coefficient_type",
+        "linked_metabolites",
+    )
+
     def __init__(
         self,
         metabolite,
@@ -888,6 +964,16 @@ class MSTemplateBiomass:
 
 
 class NewModelTemplateRole:
+    __slots__ = (
+        "id",
+        "name",
+        "source",
+        "features",
+        "aliases",
+        "_complexes",
+        "_template",
+    )
+
     def __init__(self, role_id, name, features=None, source="", aliases=None):
         """
 
@@ -905,6 +991,19 @@ class NewModelTemplateRole:
         self._complexes = set()
         self._template = None
 
+    def __getstate__(self):
+        # The complexes of a role add themselves back when unpickled, so pickling a template
+        # does not recurse through the whole role-complex graph
+        return {
+            slot: getattr(self, slot) for slot in self.__slots__ if slot != "_complexes"
+        }
+
+    def __setstate__(self, state):
+        if not hasattr(self, "_complexes"):
+            self._complexes = set()
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
     @staticmethod
     def from_dict(d):
         return NewModelTemplateRole(
@@ -950,6 +1049,16 @@ class NewModelTemplateRole:
 
 
 class NewModelTemplateComplex:
+    __slots__ = (
+        "id",
+        "name",
+        "source",
+        "reference",
+        "confidence",
+        "roles",
+        "_template",
+    )
+
     def __init__(
         self, complex_id, name, source="", reference="", confidence=0, template=None
     ):
@@ -970,6 +1079,17 @@ class NewModelTemplateComplex:
         self.roles = {}
         self._template = template
 
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        for role in self.roles:
+            if not hasattr(role, "_complexes"):
+                role._complexes = set()
+            role._complexes.add(self)
+
     @staticmethod
     def from_dict(d, template):
         protein_complex = NewModelTemplateComplex(
@@ -1056,6 +1176,8 @@ class NewModelTemplateComplex:
 
 
 class MSTemplateCompartment:
+    __slots__ = ("id", "name", "ph", "hierarchy", "aliases", "_template")
+
     def __init__(
         self, compartment_id: str, name: str, ph: float, hierarchy=0, aliases=None
     ):
@@ -1109,6 +1231,8 @@ class MSTemplate:
         self.pathways = DictList()
         self.subsystems = DictList()
         self.drains = None
+        self._role_index = None
+        self._reaction_prototypes = {}
 
     ################# Replaces biomass reactions from an input TSV table ############################
     def overwrite_biomass_from_table(
@@ -1191,6 +1315,7 @@ class MSTemplate:
         :param roles:
         :return:
         """
+        self._role_index = None
         duplicates = list(filter(lambda x: x.id in self.roles, roles))
         if len(duplicates) > 0:
             logger.error(
@@ -1208,6 +1333,7 @@ class MSTemplate:
         :param complexes:
         :return:
         """
+        self._role_index = None
         duplicates = list(filter(lambda x: x.id in self.complexes, complexes))
         if len(duplicates) > 0:
             logger.error(
@@ -1257,6 +1383,7 @@ class MSTemplate:
         :param comp_compounds:
         :return:
         """
+        self._reaction_prototypes = {}
         duplicates = list(filter(lambda x: x.id in self.compcompounds, comp_compounds))
         if len(duplicates) > 0:
             logger.error(
@@ -1296,6 +1423,8 @@ class MSTemplate:
         :param reaction_list:
         :return:
         """
+        self._role_index = None
+        self._reaction_prototypes = {}
         duplicates = list(filter(lambda x: x.id in self.reactions, reaction_list))
         if len(duplicates) > 0:
             logger.error(
@@ -1357,6 +1486,75 @@ class MSTemplate:
     def get_role(self, id):
         return self.roles.get_by_id(id)
 
+    def get_role_index(self):
+        """Returns the normalized role -> complex -> reaction index of the template
+
+        The index is built once and rebuilt only when reactions, complexes or roles are
+        added or removed, so matching many genomes against one template does not normalize
+        every role name of every complex again. It holds:
+
+            roles: {normalized role name: set of complex IDs}
+            complex_roles: {complex ID: {role ID: (normalized name, triggering, optional)}}
+            complex_reactions: {complex ID: list of reaction positions}
+            complexes: {complex ID: complex}
+        """
+        size = (len(self.reactions), len(self.complexes), len(self.roles))
+        role_index = getattr(self, "_role_index", None)
+        if role_index is not None and role_index["size"] == size:
+            return role_index
+        role_index = {
+            "size": size,
+            "roles": {},
+            "complex_roles": {},
+            "complex_reactions": {},
+            "complexes": {},
+        }
+        for position, template_reaction in enumerate(self.reactions):
+            for cpx in template_reaction.get_complexes():
+                if cpx.id not in role_index["complexes"]:
+                    role_index["complexes"][cpx.id] = cpx
+                    role_index["complex_reactions"][cpx.id] = []
+                    complex_roles = {}
+                    for role, (triggering, optional) in cpx.roles.items():
+                        sn = normalize_role(role.name)
+                        complex_roles[role.id] = (sn, triggering, optional)
+                        role_index["roles"].setdefault(sn, set()).add(cpx.id)
+                    role_index["complex_roles"][cpx.id] = complex_roles
+                role_index["complex_reactions"][cpx.id].append(position)
+        self._role_index = role_index
+        return role_index
+
+    def get_reaction_prototypes(self, index="0"):
+        """Returns the cache of reaction prototypes for an index (see MSTemplateReaction.get_prototype)
+
+        The cache is cleared when reactions or species are added to or removed from the template.
+        """
+        if not hasattr(self, "_reaction_prototypes"):
+            self._reaction_prototypes = {}
+        if index not in self._reaction_prototypes:
+            self._reaction_prototypes[index] = {}
+        return self._reaction_prototypes[index]
+
+    def get_reactions_from_roles(self, normalized_roles):
+        """Returns the reactions with a complex containing any of the normalized role names
+
+        Parameters
+        ----------
+        normalized_roles : iterable<string>
+            Role names normalized with normalize_role, e.g. the annotated roles of a genome
+
+        Returns
+        -------
+        list<MSTemplateReaction>
+            Matching template reactions in template order
+        """
+        role_index = self.get_role_index()
+        positions = set()
+        for sn in normalized_roles:
+            for cpx_id in role_index["roles"].get(sn, []):
+                positions.update(role_index["complex_reactions"][cpx_id])
+        return [self.reactions[position] for position in sorted(positions)]
+
     # def _to_object(self, key, data):
     #    if key == 'compounds':
     #        return NewModelTemplateCompound.from_dict(data, self)
@@ -1487,6 +1685,8 @@ class MSTemplate:
 
             else:
                 self.reactions.remove(reaction)
+                self._role_index = None
+                self._reaction_prototypes = {}
                 
                 """ for met in reaction._metabolites:
                     if reaction in met._reaction:
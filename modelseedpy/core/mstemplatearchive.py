@@ -0,0 +1,499 @@
+# -*- coding: utf-8 -*-
+import logging
+import json
+import re
+import zipfile
+import numpy as np
+from modelseedpy.core.msgenome import normalize_role
+
+logger = logging.getLogger(__name__)
+
+# Columns stored for each template table as (field, kind): "str" fields are indices into the
+# interned string table, "num" fields are floats, "json" fields are interned JSON strings,
+# "strlist" fields are lists of interned strings and a list of (field, kind) pairs describes
+# a list of records. Fields not in the schema are kept in an interned JSON "extra" column.
+TABLES = {
+    "compounds": [
+        ("id", "str"),
+        ("name", "str"),
+        ("abbreviation", "str"),
+        ("formula", "str"),
+        ("defaultCharge", "num"),
+        ("mass", "num"),
+        ("deltaG", "num"),
+        ("deltaGErr", "num"),
+        ("isCofactor", "num"),
+        ("aliases", "json"),
+    ],
+    "compcompounds": [
+        ("id", "str"),
+        ("charge", "num"),
+        ("maxuptake", "num"),
+        ("templatecompartment_ref", "str"),
+        ("templatecompound_ref", "str"),
+    ],
+    "roles": [
+        ("id", "str"),
+        ("name", "str"),
+        ("source", "str"),
+        ("features", "strlist"),
+        ("aliases", "json"),
+    ],
+    "complexes": [
+        ("id", "str"),
+        ("name", "str"),
+        ("source", "str"),
+        ("reference", "str"),
+        ("confidence", "num"),
+        (
+            "complexroles",
+            [
+                ("templaterole_ref", "str"),
+                ("triggering", "num"),
+                ("optional_role", "num"),
+            ],
+        ),
+    ],
+    "reactions": [
+        ("id", "str"),
+        ("name", "str"),
+        ("reaction_ref", "str"),
+        ("type", "str"),
+        ("direction", "str"),
+        ("GapfillDirection", "str"),
+        ("status", "str"),
+        ("templatecompartment_ref", "str"),
+        ("lower_bound", "num"),
+        ("upper_bound", "num"),
+        ("maxforflux", "num"),
+        ("maxrevflux", "num"),
+        ("base_cost", "num"),
+        ("forward_penalty", "num"),
+        ("reverse_penalty", "num"),
+        (
+            "templateReactionReagents",
+            [("templatecompcompound_ref", "str"), ("coefficient", "num")],
+        ),
+        ("templatecomplex_refs", "strlist"),
+    ],
+}
+
+# Small parts of the template that are stored as one JSON header
+HEADER_FIELDS = [
+    "__VERSION__",
+    "id",
+    "name",
+    "domain",
+    "type",
+    "biochemistry_ref",
+    "compartments",
+    "biomasses",
+    "pathways",
+    "subsystems",
+]
+
+COMPCOMPOUND_REF = re.compile(r"~/compcompounds/id/([^\"/]+)")
+
+
+class _StringTable:
+    """Interns strings so every distinct string is stored once"""
+
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        if value not in self.index:
+            self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return self.index[value]
+
+    def to_arrays(self):
+        """Returns the strings as one UTF-8 buffer and the offsets of each string in it"""
+        encoded = [value.encode("utf-8") for value in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(value) for value in encoded])
+        return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _ref_id(ref):
+    return ref.split("/")[-1]
+
+
+def _encode_columns(records, schema, strings, arrays, prefix):
+    for field, kind in schema:
+        arrays[prefix + field + ".present"] = np.array(
+            [field in record for record in records], dtype=bool
+        )
+        values = [record.get(field) for record in records]
+        if kind == "str":
+            arrays[prefix + field] = np.array(
+                [-1 if value is None else strings.add(value) for value in values],
+                dtype=np.int32,
+            )
+        elif kind == "num":
+            arrays[prefix + field] = np.array(
+                [np.nan if value is None else value for value in values], dtype=float
+            )
+            arrays[prefix + field + ".int"] = np.array(
+                [isinstance(value, int) for value in values], dtype=bool
+            )
+        elif kind == "json":
+            arrays[prefix + field] = np.array(
+                [strings.add(json.dumps(value)) for value in values], dtype=np.int32
+            )
+        elif kind == "strlist":
+            lengths = [len(value) if value else 0 for value in values]
+            arrays[prefix + field + ".indptr"] = np.concatenate(
+                [[0], np.cumsum(lengths)]
+            ).astype(np.int64)
+            arrays[prefix + field] = np.array(
+                [strings.add(item) for value in values if value for item in value],
+                dtype=np.int32,
+            )
+        else:
+            lengths = [len(value) if value else 0 for value in values]
+            arrays[prefix + field + ".indptr"] = np.concatenate(
+                [[0], np.cumsum(lengths)]
+            ).astype(np.int64)
+            _encode_columns(
+                [item for value in values if value for item in value],
+                kind,
+                strings,
+                arrays,
+                prefix + field + ".",
+            )
+    known = {field for field, _ in schema}
+    arrays[prefix + "extra"] = np.array(
+        [
+            strings.add(
+                json.dumps({k: v for k, v in record.items() if k not in known})
+            )
+            for record in records
+        ],
+        dtype=np.int32,
+    )
+
+
+class MSTemplateArchive:
+    """Compact array representation of a template with lazy materialization of its objects
+
+    Every string of the template (IDs, names, references) is interned into one UTF-8 string
+    table, and the compounds, species, roles, complexes and reactions are stored as columns of
+    indices into it, with stoichiometries, complex roles and complex references as CSR arrays.
+    Compartments and biomasses are small and kept in a JSON header. Archives are saved as an
+    uncompressed .npz file, whose arrays are memory-mapped when loaded, so loading a large
+    template in a worker process costs neither parsing nor object construction:
+
+        MSTemplateArchive.from_dict(template_json).save("template.npz")
+        archive = MSTemplateArchive.load("template.npz")
+        template = archive.to_template(archive.get_reactions_from_roles(roles))
+
+    to_template only builds the MSTemplateReaction objects (and the species, complexes and
+    roles they use) of the requested reactions, in template order, through the regular
+    MSTemplateBuilder path.
+    """
+
+    def __init__(self, arrays, header, filename=None):
+        # Plain array views of memory maps avoid the memmap overhead on every element access
+        self.arrays = {name: np.asarray(values) for name, values in arrays.items()}
+        self.header = header
+        self.filename = filename
+        self._string_data = self.arrays["strings"]
+        self._string_offsets = self.arrays["strings.offsets"]
+        self._decoded = {}
+        self._columns = {}
+        self._indices = {}
+        self._normalized_roles = None
+
+    def __getstate__(self):
+        # Archives loaded from a file are sent to worker processes as their file name
+        if self.filename is not None:
+            return {"filename": self.filename}
+        return {"arrays": dict(self.arrays), "header": self.header}
+
+    def __setstate__(self, state):
+        if "filename" in state:
+            loaded = MSTemplateArchive.load(state["filename"])
+            self.__init__(loaded.arrays, loaded.header, loaded.filename)
+        else:
+            self.__init__(state["arrays"], state["header"])
+
+    @staticmethod
+    def from_dict(d):
+        """Converts a template in the JSON format read by MSTemplateBuilder.from_dict
+
+        Parameters
+        ----------
+        d : dict
+            Template data, e.g. as returned by helpers.get_template or MSTemplate.get_data
+
+        Returns
+        -------
+        MSTemplateArchive
+        """
+        strings = _StringTable()
+        arrays = {}
+        for table, schema in TABLES.items():
+            _encode_columns(d.get(table, []), schema, strings, arrays, table + ".")
+        # Normalized names and positions of referenced objects let genomes be matched to
+        # reactions without decoding any record
+        arrays["roles.normalized"] = np.array(
+            [strings.add(normalize_role(role["name"])) for role in d.get("roles", [])],
+            dtype=np.int32,
+        )
+        role_index = {role["id"]: i for i, role in enumerate(d.get("roles", []))}
+        arrays["complexes.complexroles.role"] = np.array(
+            [
+                role_index.get(_ref_id(complex_role["templaterole_ref"]), -1)
+                for cpx in d.get("complexes", [])
+                for complex_role in cpx["complexroles"]
+            ],
+            dtype=np.int32,
+        )
+        complex_index = {cpx["id"]: i for i, cpx in enumerate(d.get("complexes", []))}
+        arrays["reactions.templatecomplex_refs.complex"] = np.array(
+            [
+                complex_index.get(_ref_id(ref), -1)
+                for rxn in d.get("reactions", [])
+                for ref in rxn["templatecomplex_refs"]
+            ],
+            dtype=np.int32,
+        )
+        arrays["strings"], arrays["strings.offsets"] = strings.to_arrays()
+        header = {field: d[field] for field in HEADER_FIELDS if field in d}
+        return MSTemplateArchive(arrays, header)
+
+    @staticmethod
+    def from_template(template):
+        return MSTemplateArchive.from_dict(template.get_data())
+
+    def save(self, filename):
+        """Saves the archive as an uncompressed .npz file that load can memory-map"""
+        arrays = dict(self.arrays)
+        arrays["header"] = np.array(json.dumps(self.header))
+        np.savez(filename, **arrays)
+
+    @staticmethod
+    def load(filename, mmap=True):
+        """Loads an archive saved with save, memory-mapping its arrays if mmap is True"""
+        arrays = {}
+        with zipfile.ZipFile(filename) as archive, open(filename, "rb") as fh:
+            for info in archive.infolist():
+                name = info.filename[: -len(".npy")]
+                if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                    with archive.open(info) as member:
+                        arrays[name] = np.lib.format.read_array(member)
+                    continue
+                # Data of stored members starts after the local file header
+                fh.seek(info.header_offset + 26)
+                name_length, extra_length = (
+                    int(length) for length in np.frombuffer(fh.read(4), dtype="<u2")
+                )
+                fh.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(fh)
+                if version == (1, 0):
+                    header = np.lib.format.read_array_header_1_0(fh)
+                else:
+                    header = np.lib.format.read_array_header_2_0(fh)
+                shape, fortran_order, dtype = header
+                if dtype.hasobject:
+                    raise ValueError(f"Array {name} in {filename} holds objects")
+                if len(shape) == 0 or 0 in shape:
+                    fh.seek(info.header_offset + 30 + name_length + extra_length)
+                    arrays[name] = np.lib.format.read_array(fh)
+                    continue
+                arrays[name] = np.memmap(
+                    filename,
+                    dtype=dtype,
+                    mode="r",
+                    offset=fh.tell(),
+                    shape=shape,
+                    order="F" if fortran_order else "C",
+                )
+        header = json.loads(str(arrays.pop("header")))
+        return MSTemplateArchive(arrays, header, filename)
+
+    def column(self, name):
+        """Returns an array as a list, converted once, for fast access to single elements"""
+        if name not in self._columns:
+            self._columns[name] = self.arrays[name].tolist()
+        return self._columns[name]
+
+    def string(self, index):
+        if index < 0:
+            return None
+        if index not in self._decoded:
+            start, end = self._string_offsets[index], self._string_offsets[index + 1]
+            self._decoded[index] = bytes(self._string_data[start:end]).decode("utf-8")
+        return self._decoded[index]
+
+    def size(self, table):
+        return len(self.arrays[table + ".id"])
+
+    def ids(self, table):
+        return [self.string(i) for i in self.column(table + ".id")]
+
+    def index(self, table):
+        """Returns a {ID: position} dict for a table, built on first use"""
+        if table not in self._indices:
+            self._indices[table] = {
+                object_id: i for i, object_id in enumerate(self.ids(table))
+            }
+        return self._indices[table]
+
+    def _json(self, index):
+        value = self.string(index)
+        if value == "[]":
+            return []
+        if value == "{}":
+            return {}
+        return json.loads(value)
+
+    def _number(self, prefix, field):
+        ints = self.column(prefix + field + ".int")
+        values = self.column(prefix + field)
+        return lambda i: None if values[i] != values[i] else (
+            int(values[i]) if ints[i] else values[i]
+        )
+
+    def _decode_records(self, prefix, schema, positions):
+        """Decodes the records at positions column by column"""
+        records = [{} for _ in positions]
+        for field, kind in schema:
+            present = self.column(prefix + field + ".present")
+            rows = [
+                (record, i) for record, i in zip(records, positions) if present[i]
+            ]
+            if isinstance(kind, list) or kind == "strlist":
+                indptr = self.column(prefix + field + ".indptr")
+                spans = [(indptr[i], indptr[i + 1]) for _, i in rows]
+                if kind == "strlist":
+                    values = self.column(prefix + field)
+                    for (record, _), (start, end) in zip(rows, spans):
+                        record[field] = [self.string(j) for j in values[start:end]]
+                    continue
+                nested = self._decode_records(
+                    prefix + field + ".",
+                    kind,
+                    [j for start, end in spans for j in range(start, end)],
+                )
+                offset = 0
+                for (record, _), (start, end) in zip(rows, spans):
+                    record[field] = nested[offset : offset + end - start]
+                    offset += end - start
+                continue
+            if kind == "num":
+                decode = self._number(prefix, field)
+            else:
+                values = self.column(prefix + field)
+                if kind == "str":
+                    decode = lambda i, values=values: self.string(values[i])
+                else:
+                    decode = lambda i, values=values: self._json(values[i])
+            for record, i in rows:
+                record[field] = decode(i)
+        extra = self.column(prefix + "extra")
+        for record, i in zip(records, positions):
+            record.update(self._json(extra[i]))
+        return records
+
+    def get_records(self, table, positions):
+        """Returns the JSON records of objects, e.g. reactions, from their positions"""
+        return self._decode_records(table + ".", TABLES[table], list(positions))
+
+    def get_reactions_from_roles(self, normalized_roles):
+        """Returns the IDs of reactions with a complex containing any of the normalized roles
+
+        Parameters
+        ----------
+        normalized_roles : iterable<string>
+            Role names normalized with normalize_role, e.g. the annotated roles of a genome
+
+        Returns
+        -------
+        list<string>
+            Matching reaction IDs in template order
+        """
+        if self._normalized_roles is None:
+            self._normalized_roles = {}
+            for i, sn in enumerate(self.arrays["roles.normalized"]):
+                self._normalized_roles.setdefault(self.string(sn), []).append(i)
+        roles = set()
+        for sn in normalized_roles:
+            roles.update(self._normalized_roles.get(sn, []))
+        if len(roles) == 0:
+            return []
+        complexes = self._positions(
+            "complexes.complexroles", "role", np.fromiter(roles, dtype=np.int64)
+        )
+        return self._reaction_ids(
+            self._positions("reactions.templatecomplex_refs", "complex", complexes)
+        )
+
+    def _positions(self, prefix, link, targets):
+        """Returns the positions of the records whose linked objects include any target"""
+        matched = np.flatnonzero(np.isin(self.arrays[prefix + "." + link], targets))
+        indptr = self.arrays[prefix + ".indptr"]
+        return np.unique(np.searchsorted(indptr, matched, side="right") - 1)
+
+    def _reaction_ids(self, positions):
+        return [self.string(self.column("reactions.id")[i]) for i in positions]
+
+    def get_reactions_by_type(self, reaction_types):
+        """Returns the IDs of reactions of the given types (e.g. universal), in template order"""
+        types = self.arrays["reactions.type"]
+        selected = [
+            index for index in np.unique(types) if self.string(index) in reaction_types
+        ]
+        return self._reaction_ids(np.flatnonzero(np.isin(types, selected)))
+
+    def to_dict(self, reaction_ids=None):
+        """Returns the template in JSON format, limited to reaction_ids and the objects they use
+
+        Species used by biomasses are always included, as are all compartments and biomasses.
+        """
+        d = {field: self.header[field] for field in HEADER_FIELDS if field in self.header}
+        if reaction_ids is None:
+            for table in TABLES:
+                d[table] = self.get_records(table, range(self.size(table)))
+            return d
+        reaction_index = self.index("reactions")
+        reactions = self.get_records(
+            "reactions", sorted({reaction_index[rxn_id] for rxn_id in reaction_ids})
+        )
+        species_ids = set(
+            COMPCOMPOUND_REF.findall(json.dumps(self.header.get("biomasses", [])))
+        )
+        complex_ids = set()
+        for rxn in reactions:
+            for reagent in rxn["templateReactionReagents"]:
+                species_ids.add(_ref_id(reagent["templatecompcompound_ref"]))
+            for ref in rxn["templatecomplex_refs"]:
+                complex_ids.add(_ref_id(ref))
+        complexes = self._records("complexes", complex_ids)
+        role_ids = {
+            _ref_id(complex_role["templaterole_ref"])
+            for cpx in complexes
+            for complex_role in cpx["complexroles"]
+        }
+        compcompounds = self._records("compcompounds", species_ids)
+        compound_ids = {_ref_id(cpd["templatecompound_ref"]) for cpd in compcompounds}
+        d["compounds"] = self._records("compounds", compound_ids)
+        d["compcompounds"] = compcompounds
+        d["roles"] = self._records("roles", role_ids)
+        d["complexes"] = complexes
+        d["reactions"] = reactions
+        return d
+
+    def _records(self, table, ids):
+        index = self.index(table)
+        return self.get_records(
+            table, sorted(index[object_id] for object_id in ids if object_id in index)
+        )
+
+    def to_template(self, reaction_ids=None):
+        """Builds an MSTemplate with only the reactions in reaction_ids (default: all reactions)"""
+        from modelseedpy.core.mstemplate import MSTemplateBuilder
+
+        return MSTemplateBuilder.from_dict(self.to_dict(reaction_ids)).build()
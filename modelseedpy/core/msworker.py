@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import pickle
+import tempfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Objects loaded by this (worker) process, as slot: [key, object, worker data]
+_loaded = {}
+
+
+class MSWorkerState:
+    """Object shared read-only with the worker processes of a parallel run
+
+    The object (a model, gapfilling problem, template, ...) is pickled once into a temporary
+    file. Tasks carry the MSWorkerState itself, which pickles to the file name and a key, and
+    get() loads the object at most once per worker process, whether the tasks run on a pool
+    created by the runner or on an executor passed in by the caller:
+
+        with MSWorkerState(self.model, "expansion") as state:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                results = list(pool.map(_run_expansion_worker, [(state, ...), ...]))
+
+    Each slot holds one object per worker, so loading a new object for a slot releases the
+    previous one. Model utilities returned by get_modelutls are registered in MSModelUtil and
+    MSPackageManager while loaded, so packages retrieved by model are the unpickled ones.
+    """
+
+    def __init__(self, obj, slot, get_modelutls=None):
+        """
+        Parameters
+        ----------
+        obj : object
+            Object to share with the workers
+        slot : string
+            Name of the runner the object is loaded for in each worker
+        get_modelutls : function
+            Module level function returning the MSModelUtil objects held by obj
+        """
+        self.slot = slot
+        self.key = uuid.uuid4().hex
+        self.get_modelutls = get_modelutls
+        fd, self.filename = tempfile.mkstemp(prefix="modelseedpy_", suffix=".pkl")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(obj, fh, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __getstate__(self):
+        return {
+            "slot": self.slot,
+            "key": self.key,
+            "filename": self.filename,
+            "get_modelutls": self.get_modelutls,
+        }
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Deletes the file holding the object once all tasks are done"""
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def get(self, reload=False):
+        """Returns the object, loading it if this process has not loaded it yet
+
+        Parameters
+        ----------
+        reload : bool
+            Loads a fresh copy of the object, e.g. when a worker modified its copy
+        """
+        loaded = _loaded.get(self.slot)
+        if loaded is None or loaded[0] != self.key or reload:
+            if loaded is not None:
+                self._release(loaded[1])
+            with open(self.filename, "rb") as fh:
+                obj = pickle.load(fh)
+            if self.get_modelutls is not None:
+                from modelseedpy.core.msmodelutl import MSModelUtil
+                from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
+
+                for modelutl in self.get_modelutls(obj):
+                    MSModelUtil.mdlutls[modelutl.model] = modelutl
+                    MSPackageManager.pkgmgrs[modelutl.model] = modelutl.pkgmgr
+            _loaded[self.slot] = [self.key, obj, {}]
+        return _loaded[self.slot][1]
+
+    def worker_data(self):
+        """Returns a dict kept by this process alongside the loaded object, reset on each load"""
+        self.get()
+        return _loaded[self.slot][2]
+
+    def _release(self, obj):
+        if self.get_modelutls is None:
+            return
+        from modelseedpy.core.msmodelutl import MSModelUtil
+        from modelseedpy.fbapkg.mspackagemanager import MSPackageManager
+
+        for modelutl in self.get_modelutls(obj):
+            MSModelUtil.mdlutls.pop(modelutl.model, None)
+            MSPackageManager.pkgmgrs.pop(modelutl.model, None)
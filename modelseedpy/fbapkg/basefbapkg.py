@@ -60,6 +60,7 @@ class BaseFBAPkg:
             self.variables[type] = dict()
         for type in constraint_types:
             self.constraints[type] = dict()
+        self.batch = None
 
     def validate_parameters(self, params, required, defaults):
         for item in required:
@@ -80,6 +81,34 @@ class BaseFBAPkg:
             self.constraints[obj_type] = {}
         self.model.remove_cons_vars(cobra_objs)
 
+    def begin_batch(self):
+        """Starts queuing variables and constraints instead of adding them to the solver one at a time
+
+        Variables and constraints returned while a batch is open are not yet part of the model, so
+        their coefficients and primal values are only available after end_batch is called. Objects
+        that later steps solve against, such as the thermo constraints of SimpleThermoPkg, must be
+        built outside a batch.
+        """
+        if self.batch is None:
+            self.batch = {"variables": [], "constraints": {}, "coefficients": {}, "remove": []}
+
+    def end_batch(self):
+        """Adds all queued variables and constraints in one call and sets their coefficients in bulk"""
+        if self.batch is None:
+            return
+        batch = self.batch
+        self.batch = None
+        if len(batch["remove"]) > 0:
+            self.model.remove_cons_vars(batch["remove"])
+        new_objects = batch["variables"] + list(batch["constraints"].values())
+        if len(new_objects) > 0:
+            self.model.add_cons_vars(new_objects)
+            self.model.solver.update()
+        for name, coef in batch["coefficients"].items():
+            batch["constraints"][name].set_linear_coefficients(coef)
+        if len(batch["coefficients"]) > 0:
+            self.model.solver.update()
+
     def build_variable(
         self, obj_type, lower_bound, upper_bound, vartype, cobra_obj=None
     ):
@@ -95,7 +124,10 @@ class BaseFBAPkg:
             self.variables[obj_type][name] = self.model.problem.Variable(
                 name + "_" + obj_type, lb=lower_bound, ub=upper_bound, type=vartype
             )
-            self.model.add_cons_vars(self.variables[obj_type][name])
+            if self.batch is not None:
+                self.batch["variables"].append(self.variables[obj_type][name])
+            else:
+                self.model.add_cons_vars(self.variables[obj_type][name])
         return self.variables[obj_type][name]
 
     def build_constraint(
@@ -109,10 +141,25 @@ class BaseFBAPkg:
             name = cobra_obj
         else:
             name = cobra_obj.id
+        constraint_name = name + "_" + obj_type
+        if self.batch is not None:
+            if name in self.constraints[obj_type]:
+                if constraint_name in self.batch["constraints"]:
+                    del self.batch["constraints"][constraint_name]
+                    self.batch["coefficients"].pop(constraint_name, None)
+                else:
+                    self.batch["remove"].append(self.constraints[obj_type][name])
+            self.constraints[obj_type][name] = self.model.problem.Constraint(
+                Zero, lb=lower_bound, ub=upper_bound, name=constraint_name
+            )
+            self.batch["constraints"][constraint_name] = self.constraints[obj_type][name]
+            if len(coef) > 0:
+                self.batch["coefficients"][constraint_name] = coef
+            return self.constraints[obj_type][name]
         if name in self.constraints[obj_type]:
             self.model.remove_cons_vars(self.constraints[obj_type][name])
         self.constraints[obj_type][name] = self.model.problem.Constraint(
-            Zero, lb=lower_bound, ub=upper_bound, name=name + "_" + obj_type
+            Zero, lb=lower_bound, ub=upper_bound, name=constraint_name
         )
         self.model.add_cons_vars(self.constraints[obj_type][name])
         self.model.solver.update()
@@ -30,12 +30,14 @@ class ElementUptakePkg(BaseFBAPkg):
             if met in exchange_hash:
                 exception_reactions.append(exchange_hash[met])
         # Now building or rebuilding constraints
+        self.begin_batch()
         for element in element_limits:
             if element not in self.variables["elements"]:
                 self.build_variable(element, element_limits[element])
         for element in element_limits:
             # This call will first remove existing constraints then build the new constraint
             self.build_constraint(element, exception_reactions)
+        self.end_batch()
 
     def build_variable(self, element, limit):
         return BaseFBAPkg.build_variable(
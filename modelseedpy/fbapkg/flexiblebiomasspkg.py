@@ -137,6 +137,7 @@ class FlexibleBiomassPkg(BaseFBAPkg):
             prefix="FLEX_" + self.parameters["bio_rxn"].id + "_",
             prefix_name="Biomass flex for ",
         )
+        self.begin_batch()
         for metabolite in flexcpds:
             self.build_constraint(metabolite, "flxcpd")
         # Creating metabolite class constraints
@@ -211,6 +212,7 @@ class FlexibleBiomassPkg(BaseFBAPkg):
                     )
         if parameters["add_total_biomass_constraint"]:
             self.build_constraint(self.parameters["bio_rxn"], "flxbio")
+        self.end_batch()
 
     def build_variable(self, object, type):  # !!! can the function be removed?
         pass
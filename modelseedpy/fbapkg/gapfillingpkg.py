@@ -18,6 +18,7 @@ from cobra.io import (
 )
 from modelseedpy.fbapkg.basefbapkg import BaseFBAPkg
 from modelseedpy.core.fbahelper import FBAHelper
+from modelseedpy.core.msgapfilldatabase import MSGapfillDatabase
 
 logger = logging.getLogger(__name__)
 logger.setLevel(
@@ -92,7 +93,8 @@ class GapfillingPkg(BaseFBAPkg):
                 "base_media": None,
                 "objective":self.model.objective,
                 "base_media_target_element": "C",
-                "default_exchange_penalty":0.1
+                "default_exchange_penalty":0.1,
+                "gapfill_database_cache": None
             }
         )
         
@@ -239,6 +241,7 @@ class GapfillingPkg(BaseFBAPkg):
         Parameters
         ----------
         """           
+        self.begin_batch()
         for reaction in self.model.reactions:
             if reaction.id in self.gapfilling_penalties:
                 if "reverse" in self.gapfilling_penalties[reaction.id]:
@@ -273,6 +276,7 @@ class GapfillingPkg(BaseFBAPkg):
                         },
                         reaction,
                     )
+        self.end_batch()
 
     def set_base_objective(self,objective,minobjective):
         """Sets the base objective for the model
@@ -294,6 +298,8 @@ class GapfillingPkg(BaseFBAPkg):
         #Setting minimal objective constraint
         self.pkgmgr.getpkg("ObjConstPkg").clear()
         if minobjective:
+            # Kept so test_gapfill_database restores this minimum rather than the initial one
+            self.parameters["minimum_obj"] = minobjective
             if self.model.objective.direction == "max":
                 self.pkgmgr.getpkg("ObjConstPkg").build_package(
                     minobjective, None
@@ -457,64 +463,65 @@ class GapfillingPkg(BaseFBAPkg):
     # Possible new function to add to the KBaseFBAModelToCobraBuilder to extend a model with a template for gapfilling for a specific index
     def extend_model_with_template_for_gapfilling(self, template, index):
         logger.debug(f"extend model with template: {template}, index: {index}")
+        # The converted template is built once per template and index and then reused
+        database = MSGapfillDatabase.get(
+            template,
+            index,
+            self.parameters["blacklist"],
+            self.parameters["gapfill_database_cache"],
+            base_blacklist,
+        )
+        return self.extend_model_with_gapfill_database(database)
 
-        new_reactions = {}
+    def extend_model_with_gapfill_database(self, database):
+        """Splices a precompiled gapfilling database into the model
+        Parameters
+        ----------
+        database : MSGapfillDatabase
+            Database built from a template for a specific index
+        Returns
+        -------
+        dict
+            Gapfilling penalties for the new and reversed reactions
+        """
+        new_reactions = []
         new_penalties = dict()
 
         # Adding all metabolites to model prior to adding reactions
-        new_exchange, new_demand = self.extend_model_with_template_metabolites(
-            template, index
-        )
-        
-        for template_reaction in template.reactions:
-            if template_reaction.reference_id in self.parameters["blacklist"]:
-                continue
-            cobra_reaction = self.convert_template_reaction(
-                template_reaction, index, template, 1
-            )  # TODO: move function out
-            if template_reaction.reference_id in base_blacklist:
-                if (
-                    base_blacklist[template_reaction.reference_id] == ">"
-                    or base_blacklist[template_reaction.reference_id] == "="
-                ):
-                    cobra_reaction.upper_bound = 0
-                if (
-                    base_blacklist[template_reaction.reference_id] == "<"
-                    or base_blacklist[template_reaction.reference_id] == "="
-                ):
-                    cobra_reaction.lower_bound = 0
-            new_penalties[cobra_reaction.id] = dict()
-            if (
-                cobra_reaction.id not in self.model.reactions
-                and cobra_reaction.id not in new_reactions
-            ):
+        new_metabolites, new_exchange = database.new_metabolites(self.model)
+        self.model.add_metabolites(new_metabolites)
+        new_demand = []
+        for metabolite in new_metabolites:
+            msid = FBAHelper.modelseed_id_from_cobra_metabolite(metabolite)
+            if msid in self.parameters["auto_sink"]:
+                if msid != "cpd11416" or metabolite.compartment == "c0":
+                    new_demand.append(metabolite)
+
+        new_ids = set()
+        for data in database.reactions:
+            rxn_id = data["id"]
+            new_penalties[rxn_id] = dict()
+            if rxn_id not in self.model.reactions and rxn_id not in new_ids:
                 # Adding any template reactions missing from the present model
-                new_reactions[cobra_reaction.id] = cobra_reaction
-                if cobra_reaction.lower_bound < 0:
-                    new_penalties[cobra_reaction.id]["reverse"] = (
-                        template_reaction.base_cost + template_reaction.reverse_penalty
-                    )
-                if cobra_reaction.upper_bound > 0:
-                    new_penalties[cobra_reaction.id]["forward"] = (
-                        template_reaction.base_cost + template_reaction.forward_penalty
-                    )
-                new_penalties[cobra_reaction.id]["added"] = 1
-            elif template_reaction.GapfillDirection == "=":
+                new_ids.add(rxn_id)
+                new_reactions.append(database.to_reaction(data, self.model))
+                if data["lower_bound"] < 0:
+                    new_penalties[rxn_id]["reverse"] = data["reverse_penalty"]
+                if data["upper_bound"] > 0:
+                    new_penalties[rxn_id]["forward"] = data["forward_penalty"]
+                new_penalties[rxn_id]["added"] = 1
+            elif data["gapfill_direction"] == "=":
                 # Adjusting directionality as needed for existing reactions
-                model_reaction = self.model.reactions.get_by_id(cobra_reaction.id)
-                new_penalties[cobra_reaction.id]["reversed"] = 1
+                model_reaction = self.model.reactions.get_by_id(rxn_id)
+                new_penalties[rxn_id]["reversed"] = 1
                 if model_reaction.lower_bound == 0:
-                    model_reaction.lower_bound = template_reaction.lower_bound
+                    model_reaction.lower_bound = data["template_lower_bound"]
                     model_reaction.update_variable_bounds()
-                    new_penalties[cobra_reaction.id]["reverse"] = (
-                        template_reaction.base_cost + template_reaction.reverse_penalty
-                    )
+                    new_penalties[rxn_id]["reverse"] = data["reverse_penalty"]
                 if model_reaction.upper_bound == 0:
-                    model_reaction.upper_bound = template_reaction.upper_bound
+                    model_reaction.upper_bound = data["template_upper_bound"]
                     model_reaction.update_variable_bounds()
-                    new_penalties[cobra_reaction.id]["forward"] = (
-                        template_reaction.base_cost + template_reaction.forward_penalty
-                    )
+                    new_penalties[rxn_id]["forward"] = data["forward_penalty"]
         # Only run this on new exchanges so we don't read for all exchanges
         exchanges = self.modelutl.add_exchanges_for_metabolites(
             new_exchange,
@@ -535,7 +542,7 @@ class GapfillingPkg(BaseFBAPkg):
             new_penalties[ex.id] = {"added": 1, "reverse": self.parameters["default_exchange_penalty"], "forward": self.parameters["default_exchange_penalty"]}
 
         # Adding all new reactions to the model at once (much faster than one at a time)
-        self.model.add_reactions(new_reactions.values())
+        self.model.add_reactions(new_reactions)
         return new_penalties
 
     def convert_template_compound(self, template_compound, index, template):
@@ -745,7 +752,13 @@ class GapfillingPkg(BaseFBAPkg):
             if min_objective < 0:
                 self.pkgmgr.getpkg("ObjConstPkg").constraints["objc"]["1"].ub = min_objective
 
-    def filter_database_based_on_tests(self,test_conditions,growth_conditions=[],base_filter=None,base_target="rxn00062_c0",base_filter_only=False):
+    def filter_database_based_on_tests(self,test_conditions,growth_conditions=[],base_filter=None,base_target="rxn00062_c0",base_filter_only=False,processes=None,executor=None,search_strategy="binary",split_count=2):
+        """Filters gapfilling reactions that cause the model to pass the specified tests
+
+        Conditions can be tested in parallel by specifying processes or an executor; the
+        resulting filter is identical to the one computed serially. The search_strategy and
+        split_count select how failing reactions are isolated (see MSModelUtil.expansion_search).
+        """
         #Saving the current media
         current_media = self.current_media()
         #Clearing element uptake constraints
@@ -779,7 +792,12 @@ class GapfillingPkg(BaseFBAPkg):
                         if "forward" in self.gapfilling_penalties[reaction.id]:
                             rxnlist.append([reaction, ">"])
                 filtered_list = self.modelutl.reaction_expansion_test(
-                    rxnlist, test_conditions
+                    rxnlist,
+                    test_conditions,
+                    processes=processes,
+                    executor=executor,
+                    search_strategy=search_strategy,
+                    split_count=split_count,
                 )
         #Adding base filter reactions to model
         if base_filter != None:
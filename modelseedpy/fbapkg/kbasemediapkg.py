@@ -3,6 +3,9 @@
 from __future__ import absolute_import
 
 import logging
+import numpy as np
+from functools import partial
+from cobra.util.context import get_context
 from modelseedpy.fbapkg.basefbapkg import BaseFBAPkg
 from modelseedpy.core.fbahelper import FBAHelper  # !!! imported but not used
 
@@ -17,10 +20,24 @@ class KBaseMediaPkg(BaseFBAPkg):
     def __init__(self, model):
         BaseFBAPkg.__init__(self, model, "kbase media", {}, {})
         self.current_media = None
+        self.applied_state = None
 
     def build_package(
-        self, media_or_parameters, default_uptake=None, default_excretion=None
+        self,
+        media_or_parameters,
+        default_uptake=None,
+        default_excretion=None,
+        delta=False,
     ):
+        """Sets the bounds of all exchanges to those imposed by the media
+
+        Only exchange bounds that differ from the requested ones are changed. With delta=True,
+        the package relies on the media it last applied and only looks up the exchanges of
+        compounds in the old or new media. To catch bounds changed outside the package, the
+        bounds of all exchanges are still read and compared as arrays with those the last media
+        left, so a delta switch remains O(exchanges); it falls back to a full application when
+        any of them, the default bounds or the exchange reactions changed.
+        """
         if isinstance(media_or_parameters, dict):
             self.validate_parameters(
                 media_or_parameters,
@@ -47,42 +64,123 @@ class KBaseMediaPkg(BaseFBAPkg):
         ) and self.parameters["default_uptake"] == 0:
             self.parameters["default_uptake"] = 100
 
-        # First initializing all exchanges to default uptake and excretion
-        exchange_list = self.modelutl.exchange_list()
-        for reaction in exchange_list:
-            if -1 * self.parameters["default_uptake"] > reaction.upper_bound:
-                reaction.upper_bound = self.parameters["default_excretion"]
-                reaction.lower_bound = -1 * self.parameters["default_uptake"]
-            else:
-                reaction.lower_bound = -1 * self.parameters["default_uptake"]
-                reaction.upper_bound = self.parameters["default_excretion"]
-
-        # Now constraining exchanges for specific compounds specified in the media
-        if self.parameters["media"]:
+        # Setting exchange bounds to default uptake and excretion and then constraining media compounds
+        default_bounds = (
+            -1 * self.parameters["default_uptake"],
+            self.parameters["default_excretion"],
+        )
+        media_bounds = self.media_overrides(self.parameters["media"])
+        context = get_context(self.model)
+        if context:
+            context(partial(setattr, self, "applied_state", self.applied_state))
+        if delta and self.delta_applicable(default_bounds):
+            # The snapshot arrays are copied, as the context above may restore the old ones
+            exchanges = dict(self.applied_state["exchanges"])
+            exchanges["lower_bounds"] = exchanges["lower_bounds"].copy()
+            exchanges["upper_bounds"] = exchanges["upper_bounds"].copy()
+            reactions = exchanges["reactions"]
+            changed = set(self.applied_state["media_bounds"]).union(media_bounds)
+            for rxn_id in changed:
+                index = exchanges["index"][rxn_id]
+                bounds = media_bounds.get(rxn_id, default_bounds)
+                if reactions[index].bounds != bounds:
+                    reactions[index].bounds = bounds
+                    exchanges["lower_bounds"][index] = reactions[index].lower_bound
+                    exchanges["upper_bounds"][index] = reactions[index].upper_bound
+        else:
+            for reaction in self.modelutl.exchange_list():
+                bounds = media_bounds.get(reaction.id, default_bounds)
+                if reaction.bounds != bounds:
+                    reaction.bounds = bounds
+            exchanges = self.modelutl.bound_snapshot(self.modelutl.exchange_list())
+        self.applied_state = {
+            "default_bounds": default_bounds,
+            "media_bounds": media_bounds,
+            "exchanges": exchanges,
+        }
+
+        # Applying media concentrations to thermodynamic variables if needed
+        if (
+            self.parameters["media"]
+            and self.pkgmgr != None
+            and "FullThermoPkg" in self.pkgmgr.packages
+        ):
             exchange_hash = self.modelutl.exchange_hash()
-            self.modelutl.build_metabolite_hash()
             for mediacpd in self.parameters["media"].mediacompounds:
+                for met in self.modelutl.find_met(mediacpd.id):
+                    if met in exchange_hash:
+                        logger.info("FullThermo constrained compound: ", met.id)
+                        if (
+                            met.id in self.variables["logconc"]
+                            and met.compartment[0:1] == "e"
+                        ):
+                            if mediacpd.concentration != 0.001:
+                                self.variables["logconc"][met.id].lb = ln(
+                                    mediacpd.concentration
+                                )
+                                self.variables["logconc"][met.id].ub = ln(
+                                    mediacpd.concentration
+                                )
+
+    def delta_applicable(self, default_bounds):
+        """Checks that the last applied media can be the starting point of a delta switch"""
+        if self.applied_state is None:
+            return False
+        if self.applied_state["default_bounds"] != default_bounds:
+            return False
+        applied = self.applied_state["exchanges"]
+        if self.modelutl.exchange_list() != applied["reactions"]:
+            return False
+        # Any exchange bound changed outside this package since the last media was applied
+        current = self.modelutl.bound_snapshot(applied["reactions"])
+        return np.array_equal(
+            current["lower_bounds"], applied["lower_bounds"]
+        ) and np.array_equal(current["upper_bounds"], applied["upper_bounds"])
+
+    def media_overrides(self, media):
+        """Computes the bounds of the exchanges for compounds in the media
+
+        Returns
+        -------
+        dict<string reaction ID,(float lower bound,float upper bound)>
+            Bounds for the exchange reactions of media compounds found in the model
+        """
+        bounds = {}
+        if media:
+            self.modelutl.update_exchange_index()
+            exchange_hash = self.modelutl.exchange_reaction_hash
+            for mediacpd in media.mediacompounds:
                 mets = self.modelutl.find_met(mediacpd.id)
                 if len(mets) > 0:
                     for met in mets:
                         if met in exchange_hash:
-                            exchange_hash[met].lower_bound = -1 * mediacpd.maxFlux
-                            exchange_hash[met].upper_bound = -1 * mediacpd.minFlux
-                            if (
-                                self.pkgmgr != None
-                                and "FullThermoPkg" in self.pkgmgr.packages
-                            ):
-                                logger.info("FullThermo constrained compound: ", met.id)
-                                if (
-                                    met.id in self.variables["logconc"]
-                                    and met.compartment[0:1] == "e"
-                                ):
-                                    if mediacpd.concentration != 0.001:
-                                        self.variables["logconc"][met.id].lb = ln(
-                                            mediacpd.concentration
-                                        )
-                                        self.variables["logconc"][met.id].ub = ln(
-                                            mediacpd.concentration
-                                        )
+                            bounds[exchange_hash[met].id] = (
+                                -1 * mediacpd.maxFlux,
+                                -1 * mediacpd.minFlux,
+                            )
                 else:
                     logger.info(f"Media compound: {mediacpd.id} not found in model.")
+        return bounds
+
+    def media_bounds(self, media, default_uptake=0, default_excretion=100):
+        """Computes the exchange bounds a media would impose without changing the model
+
+        Parameters
+        ----------
+        media : MSMedia
+            Media to be translated into exchange bounds (None for default bounds only)
+        default_uptake : float
+            Uptake allowed for exchanges of compounds not in the media
+        default_excretion : float
+            Excretion allowed for exchanges of compounds not in the media
+
+        Returns
+        -------
+        dict<string reaction ID,(float lower bound,float upper bound)>
+            Bounds for every exchange reaction in the model
+        """
+        bounds = {}
+        for reaction in self.modelutl.exchange_list():
+            bounds[reaction.id] = (-1 * default_uptake, default_excretion)
+        bounds.update(self.media_overrides(media))
+        return bounds
@@ -25,6 +25,7 @@ class ReactionUsePkg(BaseFBAPkg):
         )
 
     def build_package(self, rxn_filter=None, reversibility=False):
+        self.begin_batch()
         for rxn in self.model.reactions:
             # Checking that reaction passes input filter if one is provided
             if rxn_filter == None:
@@ -33,6 +34,7 @@ class ReactionUsePkg(BaseFBAPkg):
             elif rxn.id in rxn_filter:
                 self.build_variable(rxn, rxn_filter[rxn.id])
                 self.build_constraint(rxn, reversibility)
+        self.end_batch()
 
     def build_variable(self, cobra_obj, direction):
         variable = None
@@ -17,11 +17,13 @@ class RevBinPkg(BaseFBAPkg):
         )
 
     def build_package(self, filter=None):
+        self.begin_batch()
         for reaction in self.model.reactions:
             # Checking that reaction passes input filter if one is provided
             if filter == None or reaction.id in filter:
                 self.build_variable(reaction)
                 self.build_constraint(reaction)
+        self.end_batch()
 
     def build_variable(self, object):
         return BaseFBAPkg.build_variable(self, "revbin", 0, 1, "binary", object)
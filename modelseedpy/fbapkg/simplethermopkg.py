@@ -31,8 +31,12 @@ class SimpleThermoPkg(BaseFBAPkg):
             },
         )
         self.pkgmgr.getpkg("RevBinPkg").build_package(self.parameters["filter"])
+        self.begin_batch()
         for metabolite in self.model.metabolites:
             self.build_variable(metabolite)
+        self.end_batch()
+        # Thermo constraints are added one at a time, as each energy range solve below must see
+        # the constraints of the reactions before it
         for reaction in self.model.reactions:
             if reaction.id[:3] not in ["EX_", "SK_", "DM_"]:
                 # determine the range of Delta_rG values
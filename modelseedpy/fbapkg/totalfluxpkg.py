@@ -24,6 +24,8 @@ class TotalFluxPkg(BaseFBAPkg):
         )
 
     def build_package(self, reaction_filter=None, upper_bound=100):
+        new_reactions = []
+        new_objects = []
         for reaction in self.model.reactions:
             # Checking that variable has not yet been created
             if reaction.id not in self.variables["tf"]:
@@ -32,13 +34,22 @@ class TotalFluxPkg(BaseFBAPkg):
                     self.variables["tf"][reaction.id] = self.model.problem.Variable(
                         reaction.id + "_tf", lb=0, ub=upper_bound
                     )
-                    self.model.add_cons_vars(self.variables["tf"][reaction.id])
                     self.constraints["tf"][reaction.id] = self.model.problem.Constraint(
-                        reaction.forward_variable
-                        + reaction.reverse_variable
-                        - self.variables["tf"][reaction.id],
-                        lb=0,
-                        ub=0,
-                        name=reaction.id + "_tf",
+                        Zero, lb=0, ub=0, name=reaction.id + "_tf"
                     )
-                    self.model.add_cons_vars(self.constraints["tf"][reaction.id])
+                    new_reactions.append(reaction)
+                    new_objects.append(self.variables["tf"][reaction.id])
+                    new_objects.append(self.constraints["tf"][reaction.id])
+        if len(new_reactions) > 0:
+            # Adding everything in one call and setting coefficients in bulk is much faster
+            # than adding each symbolic expression separately
+            self.model.add_cons_vars(new_objects)
+            self.model.solver.update()
+            for reaction in new_reactions:
+                self.constraints["tf"][reaction.id].set_linear_coefficients(
+                    {
+                        reaction.forward_variable: 1,
+                        reaction.reverse_variable: 1,
+                        self.variables["tf"][reaction.id]: -1,
+                    }
+                )
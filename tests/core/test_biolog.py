@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import cobra
+import pandas as pd
+from modelseedpy.core.biolog import Biolog, BiologPlate
+
+
+@pytest.fixture
+def get_model():
+    def _method():
+        return cobra.io.load_json_model(
+            os.path.join(
+                os.path.dirname(__file__), "..", "test_data", "e_coli_core.json"
+            )
+        )
+
+    return _method
+
+
+@pytest.fixture
+def biolog():
+    plate = BiologPlate("PM1", ["A"], ["01", "02", "03", "04"])
+    plate.add_base(["o2", "h2o", "h", "pi", "nh4", "co2"], 1000)
+    for well_id, compound in zip(
+        ["A01", "A02", "A03", "A04"], ["glc__D", "ac", "none", "succ"]
+    ):
+        plate.wells[well_id] = {"desc": compound, "compounds": [compound], "value": 10}
+    biolog = Biolog()
+    biolog.add_plate(plate)
+    return biolog
+
+
+def test_growth_matrix_matches_medium(get_model, biolog):
+    model = get_model()
+    original_bounds = {rxn.id: rxn.bounds for rxn in model.exchanges}
+    matrix = biolog.growth_matrix(model)
+    assert matrix.shape == (1, 4)
+    assert {rxn.id: rxn.bounds for rxn in model.exchanges} == original_bounds
+
+    compound_exchange = Biolog.exchange_mapping(model)
+    plate = biolog.plates["PM1"]
+    for well_id in plate.wells:
+        media = plate.get_media(well_id)
+        with model:
+            model.medium = {
+                compound_exchange[cpd + "_e"].id: value
+                for cpd, value in media.items()
+                if cpd + "_e" in compound_exchange
+            }
+            expected = model.slim_optimize()
+        assert matrix.at["PM1", well_id] == pytest.approx(expected, nan_ok=True)
+    assert matrix.at["PM1", "A01"] > 0.1
+    # Without a carbon source the ATP maintenance requirement is infeasible
+    assert pd.isna(matrix.at["PM1", "A03"])
+
+
+def test_run_models(get_model, biolog):
+    model = get_model()
+    knockout = get_model()
+    knockout.id = "pgi_knockout"
+    knockout.reactions.PGI.knock_out()
+    growth = biolog.run_models([model, knockout])
+    assert growth.shape == (2, 4)
+    assert list(growth.index) == [model.id, "pgi_knockout"]
+    assert growth.loc[model.id, ("PM1", "A01")] > growth.loc[
+        "pgi_knockout", ("PM1", "A01")
+    ]
+    assert growth.loc[model.id].tolist() == pytest.approx(
+        biolog.growth_vector(model).tolist(), nan_ok=True
+    )
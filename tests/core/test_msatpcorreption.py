@@ -4,7 +4,7 @@ import pytest
 import json
 import cobra
 from modelseedpy.core.mstemplate import MSTemplateBuilder
-from modelseedpy import MSATPCorrection, MSMedia
+from modelseedpy import MSATPCorrection, MSGapfill, MSMedia
 
 
 @pytest.fixture
@@ -245,6 +245,29 @@ def test_ms_atp_correction1(get_model, template, media_all_aerobic):
         assert t["is_max_threshold"] is True
 
 
+def test_expand_model_without_solution_raises(
+    get_model, template, media_all_aerobic, monkeypatch
+):
+    model = get_model(["GLCpts_c0", "NADH16_c0", "CYTBD_c0", "O2t_c0"])
+    atp_correction = MSATPCorrection(
+        model,
+        template,
+        media_all_aerobic,
+        atp_hydrolysis_id="ATPM_c0",
+        load_default_medias=False,
+    )
+    atp_correction.evaluate_growth_media()
+    atp_correction.determine_growth_media()
+    atp_correction.apply_growth_media_gapfilling()
+    monkeypatch.setattr(
+        atp_correction.modelutl,
+        "reaction_expansion_test",
+        lambda *args, **kwargs: None,
+    )
+    with pytest.raises(ValueError):
+        atp_correction.expand_model_to_genome_scale()
+
+
 def test_ms_atp_correction_and_gap_fill1(
     get_model_with_infinite_atp_loop,
     template,
@@ -296,3 +319,103 @@ def test_ms_atp_correction_and_gap_fill1(
     gap_fill.integrate_gapfill_solution(result)
 
     # TODO: add some model testing assertion
+
+
+def test_evaluate_growth_media_parallel(get_model, template, media_all_aerobic):
+    results = []
+    for processes in [None, 2]:
+        model = get_model(["GLCpts_c0", "NADH16_c0", "CYTBD_c0", "O2t_c0"])
+        atp_correction = MSATPCorrection(
+            model, template, atp_hydrolysis_id="ATPM_c0", load_default_medias=False
+        )
+        atp_correction.atp_medias = [[media, 0.01] for media in media_all_aerobic]
+        output = atp_correction.evaluate_growth_media(processes=processes)
+        assert list(atp_correction.media_gapfill_stats) == media_all_aerobic
+        stats = {}
+        for media, solution in atp_correction.media_gapfill_stats.items():
+            assert solution is None or solution.get("media", media) is media
+            stats[media.id] = (
+                None if solution is None else (solution["new"], solution["reversed"])
+            )
+        results.append((output, stats))
+    assert results[0][0] == pytest.approx(results[1][0])
+    assert results[0][1] == results[1][1]
+    assert results[0][1]["glc/o2"] == ({"GLCpts_c0": ">"}, {})
+
+
+def test_cached_media_evaluation(
+    get_model, template, media_all_aerobic, tmp_path, monkeypatch
+):
+    MSATPCorrection.clear_cache()
+
+    def build():
+        model = get_model(["GLCpts_c0", "NADH16_c0", "CYTBD_c0", "O2t_c0"])
+        atp_correction = MSATPCorrection(
+            model,
+            template,
+            atp_hydrolysis_id="ATPM_c0",
+            load_default_medias=False,
+            cache_dir=os.path.join(tmp_path, "atp_cache"),
+        )
+        atp_correction.atp_medias = [[media, 0.01] for media in media_all_aerobic]
+        return atp_correction
+
+    def run(atp_correction):
+        output = atp_correction.evaluate_growth_media()
+        atp_correction.determine_growth_media()
+        atp_correction.apply_growth_media_gapfilling()
+        for rxn in atp_correction.modelutl.exchange_list():
+            rxn.lower_bound = 0
+        tests = atp_correction.build_tests()
+        stats = {
+            media.id: (solution["new"], solution["reversed"])
+            for media, solution in atp_correction.media_gapfill_stats.items()
+        }
+        # The media of the last test is applied whether or not its result was cached
+        bounds = {rxn.id: rxn.bounds for rxn in atp_correction.modelutl.exchange_list()}
+        return output, stats, [(t["media"].id, t["threshold"]) for t in tests], bounds
+
+    expected = run(build())
+    assert len(MSATPCorrection.cache) == 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached results were recomputed")
+
+    # Identical core models reuse the media evaluation from memory and then from disk
+    with monkeypatch.context() as m:
+        m.setattr(MSATPCorrection, "evaluate_media_range", fail)
+        for clear in [False, True]:
+            if clear:
+                MSATPCorrection.clear_cache()
+            atp_correction = build()
+            assert run(atp_correction) == expected
+            for media, solution in atp_correction.media_gapfill_stats.items():
+                assert solution["media"] is media
+    assert len(MSATPCorrection.cache) == 2
+
+    # A different core reaction set misses the cache
+    atp_correction = build()
+    fingerprint = atp_correction.reaction_set_fingerprint()
+    stoichiometry = atp_correction.stoichiometry_fingerprint
+    atp_correction.model.reactions.PGK_c0.bounds = (0, 0)
+    # Bound changes are read again, without serializing the stoichiometry again
+    assert atp_correction.reaction_set_fingerprint() != fingerprint
+    assert atp_correction.stoichiometry_fingerprint is stoichiometry
+    atp_correction.evaluate_growth_media()
+    assert len(MSATPCorrection.cache) == 3
+
+    # So do different gapfilling settings and template contents
+    atp_correction = build()
+    atp_correction.msgapfill = MSGapfill(
+        atp_correction.modelutl,
+        default_gapfill_templates=[template],
+        default_target="ATPM_c0",
+        blacklist=["GLCpts_c0"],
+    )
+    atp_correction.evaluate_growth_media()
+    assert len(MSATPCorrection.cache) == 4
+    atp_correction = build()
+    template.reactions.get_by_id("GLCpts_c").base_cost += 1
+    atp_correction.evaluate_growth_media()
+    assert len(MSATPCorrection.cache) == 5
+    MSATPCorrection.clear_cache()
@@ -1,6 +1,14 @@
 # -*- coding: utf-8 -*-
+import os
+import json
+import pickle
+import pytest
+from cobra import Model
+from modelseedpy.core.msgenome import MSGenome, MSFeature, normalize_role
+from modelseedpy.core.mstemplate import MSTemplateBuilder
 from modelseedpy.core.msmodel import get_direction_from_constraints
 from modelseedpy.core.msbuilder import MSBuilder
+from modelseedpy.core.mstemplatearchive import MSTemplateArchive
 from tests.test_data.mock_data import mock_template, mock_genome_rast, mock_model
 
 
@@ -62,3 +70,214 @@ def test_build():
     expect = mock_model()
 
     pass
+
+
+@pytest.fixture
+def template():
+    with open(
+        os.path.join(
+            os.path.dirname(__file__), "..", "test_data", "template_core_bigg.json"
+        ),
+        "r",
+    ) as fh:
+        data = json.load(fh)
+    data["compartments"] = [
+        {"id": "c", "name": "Cytosol", "aliases": [], "hierarchy": 3, "pH": 7},
+        {"id": "e", "name": "Extracellular", "aliases": [], "hierarchy": 0, "pH": 7},
+    ]
+    for cpd in data["compcompounds"]:
+        cpd["templatecompartment_ref"] = "~/compartments/id/" + cpd["id"][-1]
+    data["roles"] = [
+        {"id": role_id, "name": name, "features": [], "source": "", "aliases": []}
+        for role_id, name in [
+            ("ftr1", "Phosphofructokinase (EC 2.7.1.11)"),
+            ("ftr2", "Glucose-6-phosphate isomerase (EC 5.3.1.9)"),
+            ("ftr3", "Phosphoglycerate kinase (EC 2.7.2.3)"),
+        ]
+    ]
+    data["complexes"] = [
+        {
+            "id": cpx_id,
+            "name": cpx_id,
+            "source": "",
+            "reference": "",
+            "confidence": 0,
+            "complexroles": [
+                {
+                    "templaterole_ref": "~/roles/id/" + role_id,
+                    "triggering": 1,
+                    "optional_role": 0,
+                }
+                for role_id in role_ids
+            ],
+        }
+        for cpx_id, role_ids in [
+            ("cpx1", ["ftr1"]),
+            ("cpx2", ["ftr2", "ftr3"]),
+            ("cpx3", ["ftr3"]),
+        ]
+    ]
+    complexes = {"PFK_c": ["cpx1"], "PGI_c": ["cpx2"], "PGK_c": ["cpx2", "cpx3"]}
+    for rxn in data["reactions"]:
+        rxn["templatecomplex_refs"] = [
+            "~/complexes/id/" + cpx_id for cpx_id in complexes.get(rxn["id"], [])
+        ]
+    return MSTemplateBuilder.from_dict(data).build()
+
+
+def test_generate_reaction_complex_sets(template):
+    genome = MSGenome()
+    for gene_id, function in [
+        ("g1", "glucose-6-phosphate isomerase (EC 5.3.1.9)"),
+        ("g2", "Phosphoglycerate kinase (EC 2.7.2.3)"),
+        ("g3", "hypothetical protein"),
+    ]:
+        feature = MSFeature(gene_id, "")
+        feature.add_ontology_term("RAST", function)
+        genome.add_features([feature])
+    builder = MSBuilder(genome, template)
+    full_scan = {}
+    for template_reaction in template.reactions:
+        gpr_set = builder.get_gpr_from_template_reaction(template_reaction)
+        if gpr_set:
+            full_scan[template_reaction.id] = gpr_set
+    assert builder.generate_reaction_complex_sets() == full_scan
+    assert full_scan == {
+        "PGI_c": {"cpx2": {"ftr2": {"g1"}, "ftr3": {"g2"}}},
+        "PGK_c": {"cpx2": {"ftr2": {"g1"}, "ftr3": {"g2"}}, "cpx3": {"ftr3": {"g2"}}},
+    }
+    # The role index is rebuilt when reactions are removed from the template
+    template.remove_reactions([template.reactions.PGI_c])
+    assert set(builder.generate_reaction_complex_sets()) == {"PGK_c"}
+
+
+def build_test_genomes():
+    genomes = []
+    for i, functions in enumerate(
+        [
+            ["glucose-6-phosphate isomerase (EC 5.3.1.9)"],
+            ["Phosphofructokinase (EC 2.7.1.11)"],
+            ["Phosphoglycerate kinase (EC 2.7.2.3)", "Phosphofructokinase"],
+        ]
+    ):
+        genome = MSGenome()
+        genome.id = "genome" + str(i)
+        genome.add_features([MSFeature("g" + str(j), "") for j in range(len(functions))])
+        for j, function in enumerate(functions):
+            genome.features[j].add_ontology_term("RAST", function)
+        genomes.append(genome)
+    return genomes
+
+
+def test_build_many(template):
+    genomes = build_test_genomes()
+    serial = dict(
+        MSBuilder.build_many(genomes, template, annotate_with_rast=False, processes=1)
+    )
+    assert list(serial) == ["genome0", "genome1", "genome2"]
+    assert {rxn.id for rxn in serial["genome1"].reactions} == {"PFK_c0"}
+    parallel = dict(
+        MSBuilder.build_many(
+            genomes, template, output="json", annotate_with_rast=False, processes=2
+        )
+    )
+    assert set(parallel) == set(serial)
+    for model_id, model_json in parallel.items():
+        assert {rxn["id"] for rxn in json.loads(model_json)["reactions"]} == {
+            rxn.id for rxn in serial[model_id].reactions
+        }
+
+
+def test_build_many_archive(template, tmp_path, monkeypatch):
+    genomes = build_test_genomes()
+    filename = str(tmp_path / "template.npz")
+    MSTemplateArchive.from_template(template).save(filename)
+    archive = MSTemplateArchive.load(filename)
+    expected = dict(
+        MSBuilder.build_many(genomes, template, annotate_with_rast=False, processes=1)
+    )
+    parallel = dict(
+        MSBuilder.build_many(
+            genomes, archive, output="json", annotate_with_rast=False, processes=2
+        )
+    )
+    assert set(parallel) == set(expected)
+    for model_id, model_json in parallel.items():
+        assert {rxn["id"] for rxn in json.loads(model_json)["reactions"]} == {
+            rxn.id for rxn in expected[model_id].reactions
+        }
+    # Models built from a subset of the archive are gapfilled against the full archive,
+    # which is built only once
+    gapfill_templates = []
+
+    def gapfill_model(model, target_reaction, template, media):
+        gapfill_templates.append(template)
+        return model
+
+    monkeypatch.setattr(MSBuilder, "gapfill_model", gapfill_model)
+    models = dict(
+        MSBuilder.build_many(
+            genomes, archive, gapfill_media="media", annotate_with_rast=False
+        )
+    )
+    assert {rxn.id for rxn in models["genome1"].reactions} == {
+        rxn.id for rxn in expected["genome1"].reactions
+    }
+    assert len(gapfill_templates) == 3
+    assert all(loaded is gapfill_templates[0] for loaded in gapfill_templates)
+    assert {rxn.id for rxn in gapfill_templates[0].reactions} == {
+        rxn.id for rxn in template.reactions
+    }
+
+
+def test_to_reaction_prototype_cache(template):
+    model = Model("test")
+    template_reaction = template.reactions.PGI_c
+    model.add_reactions([template_reaction.to_reaction(model, "0")])
+    assert "PGI_c" in template.get_reaction_prototypes("0")
+    reaction = template_reaction.to_reaction(model, "0")
+    assert reaction.id == "PGI_c0"
+    assert reaction.annotation["seed.reaction"] == template_reaction.reference_id
+    assert {met.id: coef for met, coef in reaction.metabolites.items()} == {
+        met.id: coef for met, coef in model.reactions.PGI_c0.metabolites.items()
+    }
+    assert all(met.model is model for met in reaction.metabolites)
+    # Reactions stamped for a new index get new metabolites
+    reaction = template_reaction.to_reaction(model, "1")
+    assert {met.id for met in reaction.metabolites} == {"g6p_c1", "f6p_c1"}
+    assert all(reaction in met.reactions for met in reaction.metabolites)
+
+
+def test_template_archive(template, tmp_path):
+    data = template.get_data()
+    filename = str(tmp_path / "template.npz")
+    MSTemplateArchive.from_template(template).save(filename)
+    archive = MSTemplateArchive.load(filename)
+    assert archive.to_dict() == data
+    assert archive.get_reactions_from_roles(
+        [normalize_role("Phosphoglycerate kinase (EC 2.7.2.3)")]
+    ) == ["PGI_c", "PGK_c"]
+    subset = archive.to_template(["PGK_c"])
+    assert [rxn.id for rxn in subset.reactions] == ["PGK_c"]
+    assert {cpx.id for cpx in subset.complexes} == {"cpx2", "cpx3"}
+    assert {met.id for met in subset.reactions.PGK_c.metabolites} == {
+        met.id for met in template.reactions.PGK_c.metabolites
+    }
+
+
+def test_template_entities_pickle(template):
+    assert not hasattr(template.roles.ftr1, "__dict__")
+    assert not hasattr(template.complexes.cpx1, "__dict__")
+    loaded = pickle.loads(pickle.dumps(template))
+    data, loaded_data = template.get_data(), loaded.get_data()
+    # Complexes of a reaction are a set, so their order is not kept
+    for rxn in data["reactions"] + loaded_data["reactions"]:
+        rxn["templatecomplex_refs"].sort()
+    assert loaded_data == data
+    cpx2 = loaded.complexes.cpx2
+    assert {role.id for role in cpx2.roles} == {"ftr2", "ftr3"}
+    assert cpx2 in loaded.roles.ftr2._complexes
+    assert set(loaded.reactions.PGK_c.gene_reaction_rule.split(" or ")) == {
+        "cpx2",
+        "cpx3",
+    }
@@ -117,3 +117,147 @@ def test_ms_gap_fill2(template, get_model, media_glucose_aerobic):
     assert "CYTBD_c0" in result["new"] and result["new"]["CYTBD_c0"] == ">"
     assert "NADH16_c0" in result["new"] and result["new"]["NADH16_c0"] == ">"
     assert "O2t_c0" in result["new"] and result["new"]["O2t_c0"] == ">"
+
+
+def test_run_gapfilling_keeps_requested_minimum(
+    template, get_model, media_glucose_aerobic
+):
+    """
+    Test the minimum passed to run_gapfilling is the one the solution is tested against
+    """
+    model = get_model(["CYTBD_c0", "NADH16_c0", "GLCpts_c0", "O2t_c0"])
+    gap_fill = MSGapfill(model, [template], minimum_obj=0.01)
+    gap_fill.run_gapfilling(
+        media_glucose_aerobic, "BIOMASS_Ecoli_core_w_GAM_c0", minimum_obj=0.8
+    )
+    gfpkg = gap_fill.gfpkgmgr.getpkg("GapfillingPkg")
+    assert gfpkg.parameters["minimum_obj"] == 0.8
+    assert gap_fill.last_solution["minobjective"] == 0.8
+
+
+def test_run_multi_gapfill_parallel(template, get_model, media_glucose_aerobic):
+    """
+    Test that parallel independent gapfilling matches serial gapfilling
+    """
+    media_high_glucose = MSMedia.from_dict(
+        {
+            "glc__D": (-20, 1000),
+            "o2": (-1000, 1000),
+            "h": (-1000, 1000),
+            "h2o": (-1000, 1000),
+            "pi": (-1000, 1000),
+            "co2": (-1000, 1000),
+            "nh4": (-1000, 1000),
+        }
+    )
+    media_high_glucose.id = "glc_high"
+    results = []
+    for processes in [None, 2]:
+        model = get_model(["CYTBD_c0", "NADH16_c0", "GLCpts_c0", "O2t_c0"])
+        gap_fill = MSGapfill(model, [template])
+        media_list = [media_glucose_aerobic, media_high_glucose]
+        solutions = gap_fill.run_multi_gapfill(
+            media_list,
+            "BIOMASS_Ecoli_core_w_GAM_c0",
+            default_minimum_objective=0.1,
+            prefilter=False,
+            gapfilling_mode="Independent",
+            run_sensitivity_analysis=False,
+            processes=processes,
+        )
+        assert list(solutions) == media_list
+        results.append(
+            [
+                (solutions[media]["new"], solutions[media]["reversed"])
+                for media in media_list
+            ]
+        )
+        assert solutions[media_glucose_aerobic]["new"]["GLCpts_c0"] == ">"
+        assert "GLCpts_c0" in model.reactions
+    assert results[0] == results[1]
+
+
+def test_gapfill_phenotypes_parallel(template, get_model):
+    """
+    Test that phenotypes gapfilled in parallel on a shared prefiltered database match serial gapfilling
+    """
+    from modelseedpy.core.msgrowthphenotypes import MSGrowthPhenotypes
+
+    base_media = MSMedia.from_dict(
+        {"o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000, "co2": 1000}
+    )
+    atp_condition = {
+        "media": MSMedia.from_dict({"h2o": 1000, "h": 1000}),
+        "objective": "ATPM_c0",
+        "is_max_threshold": True,
+        "threshold": 0.1,
+    }
+    results = []
+    for processes in [None, 2]:
+        model = get_model(["GLCpts_c0", "FRUpts2_c0"])
+        model.reactions.BIOMASS_Ecoli_core_w_GAM_c0.id = "bio1"
+        model.repair()
+        model.reactions.ATPM_c0.lower_bound = 0
+        gap_fill = MSGapfill(
+            model, [template], test_conditions=[atp_condition], default_target="bio1"
+        )
+        phenotypes = MSGrowthPhenotypes.from_compound_hash(
+            {"glc__D": 1, "fru": 1, "ac": 1}, base_media=base_media
+        )
+        output = phenotypes.simulate_phenotypes(
+            model, gapfill_negatives=True, msgapfill=gap_fill, processes=processes
+        )
+        results.append(list(output["details"]["Gapfilled reactions"]))
+    assert results[0] == results[1]
+    assert results[0][0] == ">GLCpts_c0"
+    assert results[0][1] == ">FRUpts2_c0"
+    assert results[0][2] is None
+
+
+def test_gapfill_phenotypes_prefilter_threshold(template, get_model, monkeypatch):
+    """
+    Test that the database is prefiltered with the minimum objective the phenotypes are gapfilled to
+    """
+    from modelseedpy.core.msgrowthphenotypes import MSGrowthPhenotypes
+
+    model = get_model(["GLCpts_c0"])
+    model.reactions.BIOMASS_Ecoli_core_w_GAM_c0.id = "bio1"
+    model.repair()
+    gap_fill = MSGapfill(model, [template], default_target="bio1")
+    phenotypes = MSGrowthPhenotypes.from_compound_hash(
+        {"glc__D": 1},
+        base_media=MSMedia.from_dict(
+            {"o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000, "co2": 1000}
+        ),
+    )
+    thresholds = []
+    monkeypatch.setattr(
+        gap_fill,
+        "prefilter",
+        lambda test_conditions, growth_conditions: thresholds.extend(
+            cond["threshold"] for cond in growth_conditions
+        ),
+    )
+    solutions = phenotypes.gapfill_phenotypes(
+        gap_fill, multiplier=3, baseline_objective=0.05
+    )
+    assert thresholds == [pytest.approx(0.15)]
+    assert solutions[0]["new"]["GLCpts_c0"] == ">"
+
+
+def test_run_parallel_gapfilling_sensitivity(template, get_model):
+    """
+    Test that sensitivity data saved by workers for failing media reaches the caller's model
+    """
+    model = get_model(["CYTBD_c0", "NADH16_c0", "GLCpts_c0", "O2t_c0"])
+    # Without maintenance the no carbon media is feasible but cannot reach the minimum
+    model.reactions.ATPM_c0.lower_bound = 0
+    gap_fill = MSGapfill(model, [template])
+    media_no_carbon = MSMedia.from_dict({"h": (-1000, 1000), "h2o": (-1000, 1000)})
+    media_no_carbon.id = "no_carbon"
+    solutions = gap_fill.run_parallel_gapfilling(
+        [media_no_carbon], ["BIOMASS_Ecoli_core_w_GAM_c0"], [0.1], processes=2
+    )
+    assert solutions == [None]
+    gf_sensitivity = gap_fill.mdlutl.get_attributes("gf_sensitivity", {})
+    assert "FAF" in gf_sensitivity["no_carbon"]["BIOMASS_Ecoli_core_w_GAM_c0"]
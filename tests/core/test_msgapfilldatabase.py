@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import gc
+import pytest
+from modelseedpy.core.mstemplate import MSTemplateBuilder
+from modelseedpy.core.msgapfilldatabase import MSGapfillDatabase
+
+
+@pytest.fixture
+def template():
+    with open(
+        os.path.join(
+            os.path.dirname(__file__), "..", "test_data", "template_core_bigg.json"
+        ),
+        "r",
+    ) as fh:
+        return MSTemplateBuilder.from_dict(json.load(fh)).build()
+
+
+def test_build(template):
+    database = MSGapfillDatabase.build(template, "0")
+    ids = [rxn["id"] for rxn in database.reactions]
+    assert len(database.metabolites) == len(template.compcompounds)
+    assert len(ids) == len(template.reactions)
+    assert "GLCpts_c0" in ids
+    glcpts = next(rxn for rxn in database.reactions if rxn["id"] == "GLCpts_c0")
+    assert "glc__D_e0" in glcpts["metabolites"]
+    template_rxn = template.reactions.get_by_id("GLCpts_c")
+    assert glcpts["forward_penalty"] == (
+        template_rxn.base_cost + template_rxn.forward_penalty
+    )
+    # every reaction in the test template references rxn00000
+    assert len(MSGapfillDatabase.build(template, "0", ["rxn00000"]).reactions) == 0
+
+
+def test_get_caches_in_memory(template):
+    MSGapfillDatabase.clear_cache()
+    database = MSGapfillDatabase.get(template, "0")
+    assert MSGapfillDatabase.get(template, "0") is database
+    assert MSGapfillDatabase.get(template, "1") is not database
+    assert MSGapfillDatabase.get(template, "0", ["rxn00000"]) is not database
+
+
+def test_get_caches_on_disk(template, tmp_path):
+    MSGapfillDatabase.clear_cache()
+    database = MSGapfillDatabase.get(template, "0", cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    MSGapfillDatabase.clear_cache()
+    loaded = MSGapfillDatabase.get(template, "0", cache_dir=str(tmp_path))
+    assert loaded is not database
+    assert loaded.to_dict() == database.to_dict()
+
+
+def test_cache_releases_templates(template):
+    MSGapfillDatabase.clear_cache()
+    for index in range(MSGapfillDatabase.cache_size + 2):
+        MSGapfillDatabase.get(template, str(index))
+    assert len(MSGapfillDatabase.cache[template]) == MSGapfillDatabase.cache_size
+    copy = MSTemplateBuilder.from_dict(template.get_data()).build()
+    MSGapfillDatabase.get(copy, "0")
+    assert len(MSGapfillDatabase.cache) == 2
+    del copy
+    gc.collect()
+    assert list(MSGapfillDatabase.cache) == [template]
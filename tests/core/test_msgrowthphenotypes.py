@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import cobra
+import numpy as np
+from modelseedpy import MSMedia
+from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msgrowthphenotypes import MSGrowthPhenotypes
+
+
+@pytest.fixture
+def get_model():
+    def _method():
+        model = cobra.io.load_json_model(
+            os.path.join(
+                os.path.dirname(__file__), "..", "test_data", "e_coli_core.json"
+            )
+        )
+        model.reactions.BIOMASS_Ecoli_core_w_GAM.id = "bio1"
+        model.repair()
+        return MSModelUtil.get(model)
+
+    return _method
+
+
+@pytest.fixture
+def get_phenotypes():
+    def _method():
+        base_media = MSMedia.from_dict(
+            {"o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000, "co2": 1000}
+        )
+        compounds = {"glc__D": 1, "fru": 1, "ac": 1, "succ": 0, "etoh": 0, "for": 1, "akg": 1}
+        return MSGrowthPhenotypes.from_compound_hash(
+            compounds, base_media=base_media, global_atom_limits={"C": 60}
+        )
+
+    return _method
+
+
+def test_simulate_phenotypes_parallel(get_model, get_phenotypes):
+    serial_mdlutl = get_model()
+    serial = get_phenotypes().simulate_phenotypes(
+        serial_mdlutl, add_missing_exchanges=True, save_reaction_list=True
+    )
+    parallel_mdlutl = get_model()
+    parallel = get_phenotypes().simulate_phenotypes(
+        parallel_mdlutl,
+        add_missing_exchanges=True,
+        save_reaction_list=True,
+        processes=2,
+        chunk_size=2,
+    )
+    assert serial["summary"].equals(parallel["summary"])
+    assert list(serial["details"]["Class"]) == list(parallel["details"]["Class"])
+    assert list(serial["details"]["Simulated objective"]) == pytest.approx(
+        list(parallel["details"]["Simulated objective"])
+    )
+    for pheno_id, result in serial["data"].items():
+        assert result["class"] == parallel["data"][pheno_id]["class"]
+        assert result.get("reactions") == parallel["data"][pheno_id].get("reactions")
+    # The input model ends up with the exchanges a serial simulation adds
+    assert [rxn.id for rxn in serial_mdlutl.model.reactions] == [
+        rxn.id for rxn in parallel_mdlutl.model.reactions
+    ]
+
+
+def test_media_switching_order(get_model, get_phenotypes):
+    from modelseedpy.core.msgrowthphenotypes import MSGrowthPhenotype
+
+    phenotypes = get_phenotypes()
+    phenotypes.add_phenotypes(
+        [MSGrowthPhenotype("glc__D-ac", None, 1, [], ["glc__D", "ac"])]
+    )
+    order = phenotypes.media_switching_order()
+    assert sorted(order) == list(range(len(phenotypes.phenotypes)))
+    ids = [phenotypes.phenotypes[index].id for index in order]
+    # The two compound media sits next to one of its single compound media
+    position = ids.index("glc__D-ac")
+    assert {"glc__D", "ac"}.intersection(ids[position - 1 : position + 2])
+    serial = get_phenotypes().simulate_phenotypes(get_model())
+    ordered = phenotypes.simulate_phenotypes(get_model(), order_by_media=True)
+    assert list(ordered["details"]["Phenotype"])[:-1] == list(serial["details"]["Phenotype"])
+    assert list(ordered["details"]["Simulated objective"])[:-1] == pytest.approx(
+        list(serial["details"]["Simulated objective"])
+    )
+
+
+def test_simulate_phenotypes_classification_only(get_model, get_phenotypes):
+    full = get_phenotypes().simulate_phenotypes(get_model(), save_reaction_list=True)
+    lean = get_phenotypes().simulate_phenotypes(get_model(), classification_only=True)
+    assert list(full["details"]["Class"]) == list(lean["details"]["Class"])
+    assert list(full["details"]["Simulated objective"]) == pytest.approx(
+        list(lean["details"]["Simulated objective"])
+    )
+    assert full["summary"].equals(lean["summary"])
+    for pheno_id, result in full["data"].items():
+        if result["objective_value"] > 0:
+            assert result["reaction_count"] == len(result["reactions"])
+            assert result["gapfill_count"] <= result["reaction_count"]
+        assert "reaction_count" not in lean["data"][pheno_id]
+    # Requested reaction lists come with the same counts as a full simulation
+    listed = get_phenotypes().simulate_phenotypes(
+        get_model(), save_reaction_list=True, classification_only=True
+    )
+    for pheno_id, result in full["data"].items():
+        for key in ["reactions", "reaction_count", "gapfill_count"]:
+            assert result.get(key) == listed["data"][pheno_id].get(key)
+
+
+def test_baseline_objective_cache(get_model, get_phenotypes):
+    mdlutl = get_model()
+    phenotypes = get_phenotypes()
+    phenotypes.base_media.merge(MSMedia.from_dict({"glc__D": 1}))
+    baseline = phenotypes.baseline_objective(mdlutl, "bio1")
+    assert baseline > 0
+    count = len(phenotypes.cached_based_growth)
+    assert phenotypes.baseline_objective(mdlutl, "bio1") == baseline
+    assert len(phenotypes.cached_based_growth) == count
+    # Changing a bound invalidates the cached value
+    mdlutl.model.reactions.PGK.bounds = (0, 0)
+    assert phenotypes.baseline_objective(mdlutl, "bio1") == pytest.approx(0)
+    mdlutl.model.reactions.PGK.bounds = (-1000, 1000)
+    assert phenotypes.baseline_objective(mdlutl, "bio1") == baseline
+
+
+def test_baseline_objective_restores_model(get_model, get_phenotypes):
+    mdlutl = get_model()
+    phenotypes = get_phenotypes()
+    mdlutl.model.reactions.ATPM.lower_bound = 0
+    mdlutl.model.objective = "ATPM"
+    objective = str(mdlutl.model.objective)
+    bounds = {rxn.id: rxn.bounds for rxn in mdlutl.exchange_list()}
+    assert phenotypes.baseline_objective(mdlutl, "bio1") == pytest.approx(0)
+    assert str(mdlutl.model.objective) == objective
+    assert {rxn.id: rxn.bounds for rxn in mdlutl.exchange_list()} == bounds
+
+
+def test_columnar_results_keep_none_values(tmp_path):
+    from modelseedpy.core.msphenotyperesults import MSPhenotypeResults
+
+    results = MSPhenotypeResults()
+    results.add("a", {"objective": None, "objective_value": 0.5, "class": "CP"})
+    results.add("b", {"objective_value": None, "missing_transports": []})
+    merged = MSPhenotypeResults()
+    merged.extend(results)
+    filename = os.path.join(tmp_path, "results.npz")
+    results.save(filename)
+    for store in [results, merged, MSPhenotypeResults.load(filename)]:
+        assert store["a"] == {"objective": None, "objective_value": 0.5, "class": "CP"}
+        assert store["b"] == {"objective_value": None, "missing_transports": []}
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_columnar_results(get_model, get_phenotypes, tmp_path, sparse):
+    from modelseedpy.core.msphenotyperesults import MSPhenotypeResults
+
+    full = get_phenotypes().simulate_phenotypes(
+        get_model(), add_missing_exchanges=True, save_fluxes=True
+    )
+    stores = []
+    for processes in [None, 2]:
+        results = MSPhenotypeResults(sparse=sparse)
+        output = get_phenotypes().simulate_phenotypes(
+            get_model(),
+            add_missing_exchanges=True,
+            save_fluxes=True,
+            processes=processes,
+            results=results,
+        )
+        assert output["data"] is results
+        assert list(output["details"]["Class"]) == list(full["details"]["Class"])
+        stores.append(results)
+    filename = os.path.join(tmp_path, "results.npz")
+    stores[0].save(filename)
+    stores.append(MSPhenotypeResults.load(filename))
+    for results in stores:
+        assert list(results) == list(full["data"])
+        for pheno_id, expected in full["data"].items():
+            result = results[pheno_id]
+            assert result.keys() == expected.keys()
+            assert result["class"] == expected["class"]
+            assert result["missing_transports"] == expected["missing_transports"]
+            assert result["objective_value"] == pytest.approx(expected["objective_value"])
+            if "fluxes" in expected:
+                fluxes = expected["fluxes"]
+                assert result["fluxes"][fluxes.index].tolist() == pytest.approx(
+                    fluxes.tolist(), rel=1e-6, abs=1e-4
+                )
+            else:
+                assert "fluxes" not in result
+        matrix = results.flux_matrix()
+        assert matrix.shape == (len(results), len(results.reaction_ids))
+        assert matrix.dtype == np.float32
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import cobra
+from modelseedpy import MSMedia
+from modelseedpy.core.msfba import MSFBA
+from modelseedpy.core.msmodeloverlay import MSModelOverlay
+
+
+@pytest.fixture
+def model():
+    return cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+
+
+@pytest.fixture
+def media():
+    return MSMedia.from_dict(
+        {"glc__D": 10, "o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000}
+    )
+
+
+def test_overlay_apply_and_revert(model):
+    original = model.slim_optimize()
+    overlay = MSModelOverlay(model)
+    overlay.knock_out(["PGI"])
+    overlay.set_bounds("EX_glc__D_e", -5, 1000)
+    overlay.set_objective({"ATPM": 1})
+    with overlay:
+        assert model.reactions.PGI.bounds == (0, 0)
+        assert model.reactions.EX_glc__D_e.bounds == (-5, 1000)
+        assert model.slim_optimize() > 0
+    assert model.reactions.PGI.bounds == (-1000, 1000)
+    assert model.reactions.EX_glc__D_e.bounds == (-10, 1000)
+    assert model.slim_optimize() == pytest.approx(original)
+
+
+def test_overlay_knockouts_override_media(model, media):
+    overlay = MSModelOverlay(model)
+    overlay.knock_out(["EX_o2_e"])
+    overlay.set_media(media)
+    assert overlay.get_bounds("EX_o2_e") == (0, 0)
+    assert overlay.get_bounds("EX_glc__D_e") == (-10, 1000)
+    assert "EX_glc__D_e" not in overlay.bounds
+    assert overlay.get_bounds("EX_ac_e") == (0, 100)
+    assert "EX_ac_e" in overlay.bounds
+
+
+def test_msfba_overlay_matches_clone(model, media):
+    cloned = MSFBA(model, media, {"BIOMASS_Ecoli_core_w_GAM": 1}, reaction_ko=["PGI"], fva=False)
+    cloned.run()
+    shared = MSFBA(
+        model,
+        media,
+        {"BIOMASS_Ecoli_core_w_GAM": 1},
+        reaction_ko=["PGI"],
+        fva=False,
+        overlay=True,
+    )
+    shared.run()
+    assert shared.model is model
+    assert model.reactions.PGI.bounds == (-1000, 1000)
+    assert shared.primary_solution.fluxes["BIOMASS_Ecoli_core_w_GAM"] == pytest.approx(
+        cloned.primary_solution.fluxes["BIOMASS_Ecoli_core_w_GAM"]
+    )
+
+
+def test_msfba_clone_sets_objective(model, media):
+    cloned = MSFBA(model, media, {"ATPM": 1}, pfba=False, fva=False)
+    cloned.run()
+    shared = MSFBA(model, media, {"ATPM": 1}, pfba=False, fva=False, overlay=True)
+    shared.run()
+    assert cloned.primary_solution.objective_value > 0
+    assert cloned.primary_solution.objective_value == pytest.approx(
+        shared.primary_solution.objective_value
+    )
+
+
+def test_ensemble_unpack_models_matches_overlays(model):
+    from modelseedpy.core.msensemble import MSEnsemble
+
+    ensemble = MSEnsemble(model)
+    ensemble.data["size"] = 2
+    for rxn_id, rxn_data in ensemble.data["reactions"].items():
+        rxn_data["presence"] = "10" if rxn_id == "PGI" else "11"
+        for gene_data in rxn_data["genes"].values():
+            gene_data["presence"] = "11"
+    members = ensemble.unpack_models()
+    overlays = ensemble.build_member_overlays()
+    assert "PGI" in members[0].model.reactions
+    assert "PGI" not in members[1].model.reactions
+    assert overlays[0].knockouts == set()
+    assert overlays[1].knockouts == {"PGI"}
+    for member, overlay in zip(members, overlays):
+        with overlay:
+            expected = model.slim_optimize()
+        assert member.model.slim_optimize() == pytest.approx(expected)
@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import pytest
+import cobra
+import numpy as np
+from modelseedpy.core.msmodelutl import MSModelUtil
+
+
+@pytest.fixture
+def model():
+    return cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+
+
+def test_clone(model):
+    model.computed_attributes = {"pathways": {}, "gf_filter": {"media": {}}}
+    clone = MSModelUtil.clone(model)
+    assert clone is not model
+    assert len(clone.reactions) == len(model.reactions)
+    assert len(clone.metabolites) == len(model.metabolites)
+    assert len(clone.genes) == len(model.genes)
+    assert len(clone.variables) == len(model.variables)
+    assert len(clone.constraints) == len(model.constraints)
+    assert str(clone.objective.expression) == str(model.objective.expression)
+    assert clone.slim_optimize() == pytest.approx(model.slim_optimize())
+    for rxn in clone.reactions:
+        original = model.reactions.get_by_id(rxn.id)
+        assert rxn.model is clone
+        assert rxn.bounds == original.bounds
+        assert rxn.gene_reaction_rule == original.gene_reaction_rule
+        assert all(met.model is clone for met in rxn.metabolites)
+    assert clone.computed_attributes == model.computed_attributes
+    assert clone.computed_attributes is not model.computed_attributes
+
+
+def test_clone_is_independent(model):
+    clone = MSModelUtil.clone(model)
+    clone.reactions.get_by_id("BIOMASS_Ecoli_core_w_GAM").upper_bound = 0
+    clone.metabolites.get_by_id("glc__D_e").annotation["test"] = "clone"
+    assert model.reactions.get_by_id("BIOMASS_Ecoli_core_w_GAM").upper_bound == 1000
+    assert "test" not in model.metabolites.get_by_id("glc__D_e").annotation
+    assert clone.slim_optimize() == pytest.approx(0)
+    assert model.slim_optimize() > 0
+
+
+def test_clone_share_data(model):
+    clone = MSModelUtil.clone(MSModelUtil.get(model), share_data=True)
+    met = clone.metabolites.get_by_id("glc__D_e")
+    assert met.annotation is model.metabolites.get_by_id("glc__D_e").annotation
+    assert clone.slim_optimize() == pytest.approx(model.slim_optimize())
+
+
+def test_apply_test_condition_skips_unchanged(model):
+    from modelseedpy import MSMedia
+
+    media = MSMedia.from_dict({"glc__D": 10, "o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000})
+    condition = {
+        "media": media,
+        "objective": "BIOMASS_Ecoli_core_w_GAM",
+        "is_max_threshold": False,
+        "threshold": 0.1,
+    }
+    mdlutl = MSModelUtil.get(model)
+    assert mdlutl.test_single_condition(condition)
+    assert mdlutl.test_single_condition(condition)
+    assert mdlutl.test_stats["conditions_applied"] == 1
+    assert mdlutl.test_stats["conditions_skipped"] == 1
+    assert mdlutl.test_stats["solves"] == 2
+    # Applying another media invalidates the applied condition
+    mdlutl.pkgmgr.getpkg("KBaseMediaPkg").build_package(MSMedia.from_dict({"ac": 10}))
+    assert mdlutl.test_single_condition(condition)
+    assert model.reactions.EX_glc__D_e.lower_bound == -10
+    assert mdlutl.test_stats["conditions_applied"] == 2
+    # So does setting another objective
+    model.objective = "ATPM"
+    mdlutl.apply_test_condition(condition)
+    assert mdlutl.test_stats["conditions_applied"] == 3
+    assert str(model.objective.expression).startswith("1.0*BIOMASS")
+
+
+def test_set_lp_method(model):
+    mdlutl = MSModelUtil.get(model)
+    # GLPK has no lp_method option in optlang, so nothing is set
+    assert mdlutl.set_lp_method("dual") is None
+    model.solver.configuration.lp_method = "primal"
+    assert mdlutl.set_lp_method("dual") == "primal"
+    assert model.solver.configuration.lp_method == "dual"
+    assert model.slim_optimize() == pytest.approx(0.8739215)
+
+
+def test_expansion_test_restores_lp_method(model, monkeypatch):
+    from modelseedpy import MSMedia
+
+    mdlutl = MSModelUtil.get(model)
+    model.solver.configuration.lp_method = "primal"
+    condition = {
+        "media": MSMedia.from_dict({"glc__D": 10, "o2": 1000, "h2o": 1000, "h": 1000}),
+        "objective": "BIOMASS_Ecoli_core_w_GAM",
+        "is_max_threshold": True,
+        "threshold": 0.1,
+    }
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("search failed")
+
+    monkeypatch.setattr(mdlutl, "expansion_search", fail)
+    with pytest.raises(RuntimeError):
+        mdlutl.reaction_expansion_test([[model.reactions.PGI, ">"]], [condition])
+    assert model.solver.configuration.lp_method == "primal"
+
+
+def test_reaction_expansion_test_parallel(model):
+    from modelseedpy import MSMedia
+
+    aerobic = MSMedia.from_dict(
+        {"glc__D": 10, "o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000, "co2": 1000}
+    )
+    aerobic.id = "aerobic"
+    anaerobic = MSMedia.from_dict(
+        {"glc__D": 10, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000, "co2": 1000}
+    )
+    anaerobic.id = "anaerobic"
+    conditions = [
+        {"media": aerobic, "objective": "BIOMASS_Ecoli_core_w_GAM", "is_max_threshold": True, "threshold": 5},
+        {"media": anaerobic, "objective": "BIOMASS_Ecoli_core_w_GAM", "is_max_threshold": True, "threshold": 0.1},
+        {"media": aerobic, "objective": "BIOMASS_Ecoli_core_w_GAM", "is_max_threshold": True, "threshold": 0.5},
+    ]
+    model.reactions.ATPM.lower_bound = 0
+    results = []
+    for processes in [None, 2]:
+        test_model = MSModelUtil.clone(model)
+        mdlutl = MSModelUtil.get(test_model)
+        reaction_list = []
+        for rxn in test_model.reactions:
+            if rxn.id.startswith("EX_") or rxn.id.startswith("BIOMASS"):
+                continue
+            if rxn.upper_bound > 0:
+                reaction_list.append([rxn, ">"])
+            if rxn.lower_bound < 0:
+                reaction_list.append([rxn, "<"])
+        filtered = mdlutl.reaction_expansion_test(
+            reaction_list, conditions, processes=processes
+        )
+        results.append((filtered, test_model, mdlutl.get_attributes("gf_filter")))
+    (serial, serial_model, serial_att), (parallel, parallel_model, parallel_att) = results
+    assert len(serial) > 0
+    # Parallel conditions all start from the full model, so they filter at least as much
+    serial_filtered = {(item[0].id, item[1]) for item in serial}
+    parallel_filtered = {(item[0].id, item[1]) for item in parallel}
+    assert serial_filtered <= parallel_filtered
+    assert len(parallel_filtered) == len(parallel)
+    assert serial_att.keys() == parallel_att.keys()
+    for rxn in parallel_model.reactions:
+        lower, upper = rxn.bounds
+        if (rxn.id, ">") in parallel_filtered:
+            assert upper == 0
+        if (rxn.id, "<") in parallel_filtered:
+            assert lower == 0
+        if (rxn.id, ">") not in parallel_filtered and (rxn.id, "<") not in parallel_filtered:
+            assert rxn.bounds == serial_model.reactions.get_by_id(rxn.id).bounds
+    # Every condition still passes once the filtered reactions are knocked out
+    mdlutl = MSModelUtil.get(parallel_model)
+    for condition in conditions:
+        assert mdlutl.test_single_condition(condition)
+
+
+@pytest.mark.skipif(
+    (os.cpu_count() or 1) < 4, reason="parallel speedup needs at least four CPUs"
+)
+def test_reaction_expansion_test_parallel_benchmark(model):
+    """Conditions that each filter their own reaction run faster in parallel"""
+    from cobra import Metabolite, Reaction
+    from modelseedpy import MSMedia
+
+    # Every condition supplies a compound whose leak reaction makes ATP for free
+    model.reactions.ATPM.lower_bound = 0
+    mets = model.metabolites
+    conditions = []
+    for i in range(32):
+        external = Metabolite(f"leak{i}_e", compartment="e")
+        internal = Metabolite(f"leak{i}_c", compartment="c")
+        exchange = Reaction(f"EX_leak{i}_e", lower_bound=0, upper_bound=1000)
+        exchange.add_metabolites({external: -1})
+        transport = Reaction(f"LEAKt{i}", lower_bound=0, upper_bound=1000)
+        transport.add_metabolites({external: -1, internal: 1})
+        leak = Reaction(f"LEAK{i}", lower_bound=0, upper_bound=1000)
+        leak.add_metabolites({internal: -1, mets.adp_c: -1, mets.pi_c: -1, mets.h_c: -1})
+        leak.add_metabolites({mets.atp_c: 1, mets.h2o_c: 1})
+        model.add_reactions([exchange, transport, leak])
+        media = MSMedia.from_dict({f"leak{i}": 10, "h2o": 1000, "h": 1000, "pi": 1000})
+        media.id = f"leak{i}"
+        conditions.append(
+            {"media": media, "objective": "ATPM", "is_max_threshold": True, "threshold": 1}
+        )
+    times = []
+    results = []
+    for processes in [None, 4]:
+        test_model = MSModelUtil.clone(model)
+        mdlutl = MSModelUtil.get(test_model)
+        reaction_list = []
+        for rxn in test_model.reactions:
+            if rxn.id[:3] == "EX_" or rxn.id in ["BIOMASS_Ecoli_core_w_GAM", "ATPM"]:
+                continue
+            if rxn.upper_bound > 0:
+                reaction_list.append([rxn, ">"])
+            if rxn.lower_bound < 0:
+                reaction_list.append([rxn, "<"])
+        tic = time.perf_counter()
+        filtered = mdlutl.reaction_expansion_test(
+            reaction_list, conditions, binary_search=False, processes=processes
+        )
+        times.append(time.perf_counter() - tic)
+        results.append(sorted((item[0].id, item[1]) for item in filtered))
+    # The filtered sets are disjoint, so both runs filter exactly the leaks
+    assert results[0] == results[1] == sorted((f"LEAK{i}", ">") for i in range(32))
+    assert times[1] < times[0]
+
+
+@pytest.mark.parametrize(
+    "search_strategy,split_count",
+    [("binary", 2), ("kway", 4), ("flux", 2), ("group", 8)],
+)
+def test_reaction_expansion_search_strategies(model, search_strategy, split_count):
+    from cobra import Reaction
+    from modelseedpy import MSMedia
+
+    media = MSMedia.from_dict({"h2o": 1000, "h": 1000})
+    condition = {"media": media, "objective": "ATPM", "is_max_threshold": True, "threshold": 0.1}
+    model.reactions.ATPM.lower_bound = 0
+    bad = []
+    for i in range(3):
+        # Regenerating ATP from nothing lets ATPM carry flux on empty media
+        rxn = Reaction("BAD" + str(i), lower_bound=0, upper_bound=1000)
+        rxn.add_metabolites(
+            {
+                model.metabolites.adp_c: -1,
+                model.metabolites.pi_c: -1,
+                model.metabolites.h_c: -1,
+                model.metabolites.atp_c: 1,
+                model.metabolites.h2o_c: 1,
+            }
+        )
+        bad.append(rxn)
+    model.add_reactions(bad)
+    reaction_list = []
+    for rxn in model.reactions:
+        if rxn.id.startswith("EX_") or rxn.id.startswith("BIOMASS") or rxn.id == "ATPM":
+            continue
+        if rxn.upper_bound > 0:
+            reaction_list.append([rxn, ">"])
+        if rxn.lower_bound < 0:
+            reaction_list.append([rxn, "<"])
+    mdlutl = MSModelUtil.get(model)
+    filtered = mdlutl.reaction_expansion_test(
+        reaction_list,
+        [condition],
+        search_strategy=search_strategy,
+        split_count=split_count,
+    )
+    assert sorted(item[0].id for item in filtered) == ["BAD0", "BAD1", "BAD2"]
+    assert all(rxn.upper_bound == 0 for rxn in bad)
+    assert mdlutl.test_single_condition(condition)
+
+
+def test_metabolite_and_exchange_index_updates(model):
+    from cobra import Metabolite, Reaction
+
+    mdlutl = MSModelUtil.get(model)
+    assert mdlutl.find_met("glc__D", "e") == [model.metabolites.glc__D_e]
+    assert len(mdlutl.exchange_list()) == 20
+    # An unchanged model is not rescanned
+    exchange_reactions = mdlutl.exchange_reactions
+    mdlutl.exchange_list()
+    assert mdlutl.exchange_reactions is exchange_reactions
+    metabolite_hash = mdlutl.metabolite_hash
+    met = Metabolite("newcpd_e", name="New compound", compartment="e")
+    model.add_metabolites([met])
+    mdlutl.add_exchanges_for_metabolites([met], 10, 10)
+    # The index is updated in place rather than rebuilt
+    assert mdlutl.find_met("New compound") == [met]
+    assert mdlutl.metabolite_hash is metabolite_hash
+    assert mdlutl.exchange_hash()[met].id == "EX_newcpd_e"
+    assert len(mdlutl.exchange_list()) == 21
+    model.remove_reactions([model.reactions.EX_newcpd_e])
+    model.remove_metabolites([met])
+    assert mdlutl.find_met("New compound") == []
+    assert "newcpd" not in mdlutl.metabolite_hash
+    assert met not in mdlutl.exchange_hash()
+    assert len(mdlutl.exchange_list()) == 20
+    # Swapping an exchange for another one keeps the reaction count but changes the index
+    ac_e = model.metabolites.ac_e
+    model.remove_reactions([model.reactions.EX_ac_e])
+    exchange = Reaction("EX_ac_new", lower_bound=-10, upper_bound=1000)
+    exchange.add_metabolites({ac_e: -1})
+    model.add_reactions([exchange])
+    assert mdlutl.exchange_hash()[ac_e] is exchange
+    assert "EX_ac_e" not in [rxn.id for rxn in mdlutl.exchange_list()]
+    # Same for metabolites swapped without changing their number
+    model.remove_metabolites([model.metabolites.fru_e])
+    model.add_metabolites([Metabolite("newcpd2_e", name="Other compound", compartment="e")])
+    assert mdlutl.find_met("fru__D") == []
+    assert mdlutl.find_met("Other compound")[0].id == "newcpd2_e"
+
+
+def test_bound_snapshot(model):
+    mdlutl = MSModelUtil(model)
+    objective = model.slim_optimize()
+    snapshot = mdlutl.bound_snapshot()
+    assert list(snapshot["lower_bounds"]) == [rxn.lower_bound for rxn in model.reactions]
+    lower_bounds = np.zeros(len(model.reactions))
+    upper_bounds = np.zeros(len(model.reactions))
+    positions = [snapshot["index"]["PGI"], snapshot["index"]["PFK"]]
+    assert mdlutl.apply_bound_snapshot(
+        snapshot, lower_bounds, upper_bounds, positions
+    ) == 2
+    assert model.reactions.PGI.bounds == (0, 0)
+    assert model.reactions.PFK.forward_variable.ub == 0
+    assert model.reactions.PGK.bounds != (0, 0)
+    assert model.slim_optimize(error_value=0) < objective
+    # Bounds changed inside a model context are reverted with the context
+    with model:
+        assert mdlutl.apply_bound_snapshot(snapshot) == 2
+        assert model.slim_optimize() == pytest.approx(objective)
+    assert model.reactions.PGI.bounds == (0, 0)
+    assert mdlutl.apply_bound_snapshot(snapshot) == 2
+    assert mdlutl.apply_bound_snapshot(snapshot) == 0
+    assert model.slim_optimize() == pytest.approx(objective)
+    with pytest.raises(ValueError):
+        mdlutl.apply_bound_snapshot(snapshot, upper_bounds=-lower_bounds - 1)
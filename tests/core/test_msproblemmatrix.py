@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import cobra
+from modelseedpy.core.msmodelutl import MSModelUtil
+from modelseedpy.core.msproblemmatrix import MSProblemMatrix
+
+
+@pytest.fixture
+def model():
+    model = cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+    MSModelUtil.get(model).pkgmgr.getpkg("TotalFluxPkg").build_package()
+    return model
+
+
+def test_export(model):
+    matrix = MSProblemMatrix.from_model(model)
+    assert matrix.shape == (len(model.constraints), len(model.variables))
+    assert "PGI_tf" in matrix.constraint_names
+    row = matrix.constraint_names.index("PGI_tf")
+    coefficients = {
+        matrix.variable_names[matrix.indices[k]]: matrix.data[k]
+        for k in range(matrix.indptr[row], matrix.indptr[row + 1])
+    }
+    assert coefficients == {
+        model.reactions.PGI.forward_variable.name: 1,
+        model.reactions.PGI.reverse_variable.name: 1,
+        "PGI_tf": -1,
+    }
+    assert matrix.to_scipy().nnz == len(matrix.data)
+
+
+def test_save_load_round_trip(model, tmp_path):
+    expected = model.slim_optimize()
+    filename = os.path.join(tmp_path, "problem.npz")
+    MSProblemMatrix.from_model(model).save(filename)
+    matrix = MSProblemMatrix.load(filename)
+    solver = matrix.to_solver(model.solver)
+    assert solver.optimize() == "optimal"
+    assert solver.objective.value == pytest.approx(expected)
+    assert len(solver.constraints) == len(model.constraints)
+
+
+def test_to_model(model):
+    expected = model.slim_optimize()
+    matrix = MSProblemMatrix.from_model(model)
+    restored = cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+    matrix.to_model(restored)
+    assert "PGI_tf" in restored.constraints
+    assert restored.slim_optimize() == pytest.approx(expected)
+    restored.reactions.PGI.knock_out()
+    assert restored.solver.variables[restored.reactions.PGI.id].ub == 0
+
+
+def test_generic_interface_path(model, monkeypatch):
+    glpk_matrix = MSProblemMatrix.from_model(model)
+    monkeypatch.setattr(MSProblemMatrix, "is_glpk", staticmethod(lambda solver: False))
+    matrix = MSProblemMatrix.from_model(model)
+    assert (matrix.to_scipy() != glpk_matrix.to_scipy()).nnz == 0
+    solver = matrix.to_solver(model.solver)
+    solver.optimize()
+    assert solver.objective.value == pytest.approx(model.slim_optimize())
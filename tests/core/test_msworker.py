@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import os
+from concurrent.futures import ProcessPoolExecutor
+from modelseedpy.core.msworker import MSWorkerState
+
+
+def _count_worker_tasks(state):
+    obj = state.get()
+    obj["tasks"] += 1
+    return os.getpid(), obj["tasks"]
+
+
+def test_worker_state_loaded_once_per_worker():
+    with MSWorkerState({"tasks": 0}, "test") as state:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results = list(executor.map(_count_worker_tasks, [state] * 4))
+        assert os.path.exists(state.filename)
+    assert not os.path.exists(state.filename)
+    # Every task ran on the copy the single worker loaded for the first task
+    assert [tasks for _, tasks in results] == [1, 2, 3, 4]
+    assert len({pid for pid, _ in results}) == 1
+
+
+def test_worker_state_reload():
+    with MSWorkerState({"tasks": 0}, "test") as state:
+        state.get()["tasks"] += 1
+        state.worker_data()["end"] = 5
+        assert state.get()["tasks"] == 1
+        assert state.get(reload=True)["tasks"] == 0
+        assert state.worker_data() == {}
+        # A new object for the same slot replaces the loaded one
+        with MSWorkerState({"tasks": 10}, "test") as other:
+            assert other.get()["tasks"] == 10
+        assert state.get()["tasks"] == 0
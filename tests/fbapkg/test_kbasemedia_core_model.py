@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+import cobra
+from modelseedpy import MSMedia
+from modelseedpy.core.msmodelutl import MSModelUtil
+
+
+@pytest.fixture
+def model():
+    return cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+
+
+@pytest.fixture
+def medias():
+    base = {"o2": 1000, "h2o": 1000, "h": 1000, "pi": 1000, "nh4": 1000}
+    output = []
+    for cpd in ["glc__D", "ac", "succ"]:
+        media = dict(base)
+        media[cpd] = 10
+        output.append(MSMedia.from_dict(media))
+    return output
+
+
+def exchange_bounds(model):
+    return {rxn.id: rxn.bounds for rxn in model.reactions if rxn.id[:3] == "EX_"}
+
+
+def test_delta_media_switching(model, medias):
+    pkg = MSModelUtil.get(model).pkgmgr.getpkg("KBaseMediaPkg")
+    reference = cobra.io.load_json_model(
+        os.path.join(os.path.dirname(__file__), "..", "test_data", "e_coli_core.json")
+    )
+    reference_pkg = MSModelUtil.get(reference).pkgmgr.getpkg("KBaseMediaPkg")
+    for media in medias + medias[::-1]:
+        pkg.build_package(media, 0, 1000, delta=True)
+        reference_pkg.build_package(media, 0, 1000)
+        assert exchange_bounds(model) == exchange_bounds(reference)
+        assert model.slim_optimize() == pytest.approx(reference.slim_optimize())
+
+
+def test_delta_media_switching_after_context(model, medias):
+    pkg = MSModelUtil.get(model).pkgmgr.getpkg("KBaseMediaPkg")
+    pkg.build_package(medias[0], 0, 1000)
+    applied = exchange_bounds(model)
+    with model:
+        pkg.build_package(medias[1], 0, 1000, delta=True)
+    # The bounds and the tracked media both revert when the context exits
+    assert exchange_bounds(model) == applied
+    pkg.build_package(medias[2], 0, 1000, delta=True)
+    assert model.reactions.EX_ac_e.bounds == (0, 1000)
+    assert model.reactions.EX_glc__D_e.bounds == (0, 1000)
+    assert model.reactions.EX_succ_e.bounds == (-10, 1000)
+
+
+def test_delta_media_switching_after_external_change(model, medias):
+    pkg = MSModelUtil.get(model).pkgmgr.getpkg("KBaseMediaPkg")
+    pkg.build_package(medias[0], 0, 1000, delta=True)
+    # Exchanges outside both media changed by the caller are reset by the next media
+    model.reactions.EX_co2_e.bounds = (0, 0)
+    pkg.build_package(medias[1], 0, 1000, delta=True)
+    assert model.reactions.EX_co2_e.bounds == (0, 1000)
@@ -44,3 +44,44 @@ def test_build_package():
             assert rev_bin_cons.name == "{}_revbin{}".format(
                 reaction.id, constraint_type
             )
+
+
+def test_build_package_batch_matches_single():
+    batched = RevBinPkg(model=mock_model_ecoli_core(True))
+    batched.build_package()
+    single = RevBinPkg(model=mock_model_ecoli_core(True))
+    for reaction in single.model.reactions:
+        single.build_variable(reaction)
+        single.build_constraint(reaction)
+    assert len(batched.model.variables) == len(single.model.variables)
+    assert len(batched.model.constraints) == len(single.model.constraints)
+    for reaction in single.model.reactions:
+        for constraint_type in ["revbinF", "revbinR"]:
+            expected = single.constraints[constraint_type][reaction.id]
+            built = batched.constraints[constraint_type][reaction.id]
+            assert built.name == expected.name
+            assert {
+                var.name: coef
+                for var, coef in built.get_linear_coefficients(
+                    built.variables
+                ).items()
+            } == {
+                var.name: coef
+                for var, coef in expected.get_linear_coefficients(
+                    expected.variables
+                ).items()
+            }
+
+
+def test_batch_rebuilds_constraint():
+    rev_bin = RevBinPkg(model=mock_model_ecoli_core(True))
+    rev_bin.build_package()
+    reaction = rev_bin.model.reactions[0]
+    rev_bin.begin_batch()
+    rev_bin.build_constraint(reaction)
+    rev_bin.build_constraint(reaction)
+    rev_bin.end_batch()
+    assert len(rev_bin.model.constraints) == len(rev_bin.model.metabolites) + 2 * len(
+        rev_bin.model.reactions
+    )
+    assert rev_bin.constraints["revbinR"][reaction.id].name in rev_bin.model.constraints